@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""Benchmark of writing the CREDO XML records for a suite of model runs
+(ModelRun info XMLs and ModelResult record XMLs), with each of the
+available XML serializers (see :func:`credo.io.stgxml.writeXMLDoc`).
+
+Usage: benchmarkRecordWrites.py [numRuns ...]   (default 1000 10000)"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from credo.io import stgxml
+from credo import modelrun as mrun
+from credo import modelresult as mres
+from credo.jobrunner.api import JobMetaInfo
+
+def makeSuiteRecords(numRuns, basePath):
+    """Create numRuns ModelRuns and matching ModelResults, similar to those
+    of a parameter sweep suite."""
+    runs, results = [], []
+    for runI in range(numRuns):
+        runName = "testModel-run%d" % runI
+        outputPath = os.path.join("output", "run%d" % (runI % 100))
+        mRun = mrun.ModelRun(runName, ["testModel.xml", "extra.xml"],
+            outputPath, basePath=basePath,
+            simParams=mrun.SimParams(nsteps=10, cpevery=5),
+            paramOverrides={"gravity":1.0+runI*0.01, "dim":2})
+        mRes = mres.ModelResult(runName, os.path.join(basePath, outputPath))
+        mRes.jobMetaInfo = JobMetaInfo(runI*0.5)
+        mRes.jobMetaInfo.runType = "MPI"
+        mRes.jobMetaInfo.platform = {"nproc":4, "hostname":"testhost"}
+        mRes.jobMetaInfo.performance = {"CREDO":{"walltime":2.5,
+            "maxMem":1024}}
+        runs.append(mRun)
+        results.append(mRes)
+    return runs, results
+
+def timeWrites(runs, results, serializer):
+    origSerializer = stgxml.DEFAULT_XML_SERIALIZER
+    stgxml.DEFAULT_XML_SERIALIZER = serializer
+    try:
+        startTime = time.time()
+        for mRun, mRes in zip(runs, results):
+            mRun.writeInfoXML()
+            mRes.writeRecordXML()
+        return time.time() - startTime
+    finally:
+        stgxml.DEFAULT_XML_SERIALIZER = origSerializer
+
+if __name__ == "__main__":
+    runCounts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000]
+    print "%-10s %-8s %10s %12s" % ("numRuns", "serial.", "time (s)",
+        "records/s")
+    for numRuns in runCounts:
+        basePath = tempfile.mkdtemp()
+        try:
+            runs, results = makeSuiteRecords(numRuns, basePath)
+            for serializer in stgxml.XML_SERIALIZERS:
+                totalTime = timeWrites(runs, results, serializer)
+                print "%-10d %-8s %10.2f %12.0f" % (numRuns, serializer,
+                    totalTime, 2*numRuns/totalTime)
+        finally:
+            shutil.rmtree(basePath)
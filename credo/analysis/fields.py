@@ -384,11 +384,10 @@ class FieldComparisonList(AnalysisOperation):
          working with an Analytic Solution plugin.'''
         self.fromXML = True
 
-        # create a flattened file
+        # get the flattened model
         absInputFiles = stgpath.convertLocalXMLFilesToAbsPaths(inputFilesList,
             basePath)
-        ffile=stgxml.createFlattenedXML(absInputFiles)
-        xmlDoc = etree.parse(ffile)
+        xmlDoc = stgxml.getFlattenedXMLDoc(absInputFiles)
         stgRoot = xmlDoc.getroot()
         # Go and grab necessary info from XML file
         fieldTestDataEl = stgxml.getStructNode(stgRoot, self.stgXMLSpecName)
@@ -407,21 +406,18 @@ class FieldComparisonList(AnalysisOperation):
             ii+=1
         # NB: not reading in all the other specifying stuff currently. Possibly
         # would be useful to do this in future.
-        os.remove(ffile)
 
     def checkStgXMLResultsEnabled(self, inputFilesList, basePath):
         """Checks that the field comparison has the writing of comparison
         info to file enabled (returning Bool)."""
         absInputFiles = stgpath.convertLocalXMLFilesToAbsPaths(inputFilesList,
             basePath)
-        ffile=stgxml.createFlattenedXML(absInputFiles)
-        xmlDoc = etree.parse(ffile)
+        xmlDoc = stgxml.getFlattenedXMLDoc(absInputFiles)
         stgRoot = xmlDoc.getroot()
         fieldTestDataEl = stgxml.getStructNode(stgRoot, self.stgXMLSpecName)
         appendNode = stgxml.getParamNode(fieldTestDataEl,
             "appendToAnalysisFile")
         appendBool = stgxml.strToBool(appendNode.text)
-        os.remove(ffile)
         return appendBool
 
     def getAllResults(self, modelResult):
@@ -50,14 +50,31 @@ For example::
   1.000000e-01 6.14e-03 5.4e-2
   #Res TemperatureField1 TemperatureField2
   1.000000e-01 6.12235812e-03 5.3e-2
+
+The :class:`CvgFile` class reads in a whole CVG file at once (using the
+`numpy <http://numpy.scipy.org>`_ library if it's installed), and is
+recommended when accessing more than a single step. The module-level
+functions below use it, via :func:`getCvgFile`, which keeps recently used
+CvgFiles in a cache of bounded size.
 '''
 
 import os
 import glob
-import linecache
+
+from credo.utils import LRUCache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 CVG_EXT='cvg'
 CVG_HEADER_LINESTART='#'
+# Size of blocks to read backwards from the end of a file, when only the
+# last step is needed.
+_TAIL_BLOCK_SIZE=4096
+#: Default maximum total size of cvg files to keep in :data:`cvgFileCache`.
+CVG_CACHE_MAX_BYTES=64*1024*1024
 
 class CVGReadError(IOError):
     """An exception for specifying problems reading an Underworld
@@ -86,12 +103,169 @@ class CvgFileInfo:
         self.dofColMap={}
 
 
+class CvgFile:
+    '''The values from a whole CVG file, read in at once on construction.
+    Supports Python sequence operations on steps, e.g. ``len(cvgFile)``
+    gives the number of steps, ``cvgFile[-1]`` the values of the last step,
+    and ``cvgFile[2:5]`` the values of steps 2 to 4.
+
+    .. attribute:: filename
+
+       The filename (as a string) the values were read from.
+
+    .. attribute:: headers
+
+       List of the column names, read from the first header line.
+
+    .. attribute:: values
+
+       The values of each step (rows) and column of the file. If numpy is
+       installed this is a 2D numpy array of floats. Otherwise, or if the
+       file has some incomplete lines (e.g. from a parallel I/O problem
+       while running), it's a list of lists of floats.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.headers = []
+        cvgFile = open(filename, "r")
+        try:
+            text = cvgFile.read()
+        finally:
+            cvgFile.close()
+        dataLines = []
+        for line in text.splitlines():
+            if not line.strip(): continue
+            if line[0] == CVG_HEADER_LINESTART:
+                if not self.headers: self.headers = line[1:].split()
+                continue
+            dataLines.append(line)
+        self.values = None
+        if numpy is not None:
+            values = numpy.fromstring(" ".join(dataLines), dtype=float,
+                sep=" ")
+            numCols = 0
+            if dataLines: numCols = len(dataLines[0].split())
+            if values.size == len(dataLines) * numCols:
+                self.values = values.reshape(len(dataLines), numCols)
+        if self.values is None:
+            self.values = [map(float, line.split()) for line in dataLines]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def getStepsSlice(self, steps):
+        """Convert "steps", of the form documented in
+        :func:`getCheckStepsRange`, into a slice of step numbers for this
+        file."""
+        stepRange = _checkStepsRange(len(self), steps)
+        if len(stepRange) == 0: return slice(0, 0)
+        return slice(stepRange[0], stepRange[-1]+1)
+
+    def getColumn(self, colIndex, steps='all'):
+        """Returns a list of the values in the given column of the file, for
+        the given range of steps (see :func:`getCheckStepsRange`)."""
+        stepValues = self.values[self.getStepsSlice(steps)]
+        if isinstance(stepValues, list):
+            colVals = []
+            for values in stepValues:
+                colVals.append(_getColValue(values, colIndex, self.filename))
+            return colVals
+        if colIndex >= stepValues.shape[1]:
+            # Raise the standard error
+            _getColValue([], colIndex, self.filename)
+        return stepValues[:, colIndex].tolist()
+
+    def getRes(self, steps='all'):
+        """Return the 'resolutions' (length scale) for the given set of
+        steps, as for the module function :func:`getRes`."""
+        resVals = self.getColumn(0, steps)
+        if len(resVals) == 1: return resVals[0]
+        return resVals
+
+    def getDofErrors_ByDof(self, dofColMap, steps='all'):
+        """Get the errors of each dof, where `dofColMap` maps dof numbers to
+        columns (see :attr:`CvgFileInfo.dofColMap`), indexed primarily by Dof.
+        Otherwise as for the module function :func:`getDofErrors_ByDof`."""
+        dofErrors = []
+        for dof, colIndex in dofColMap.iteritems():
+            dofErrors.append(self.getColumn(colIndex, steps))
+        if len(dofErrors) > 0 and len(dofErrors[0]) == 1:
+            dofErrors = [dofErrs[0] for dofErrs in dofErrors]
+        return dofErrors
+
+    def getDofErrors_ByStep(self, dofColMap, steps='all'):
+        """Get the errors of each dof, where `dofColMap` maps dof numbers to
+        columns (see :attr:`CvgFileInfo.dofColMap`), indexed primarily by
+        step. Otherwise as for the module function
+        :func:`getDofErrors_ByStep`."""
+        dofErrorsByDof = self.getDofErrors_ByDof(dofColMap, steps)
+        if len(dofErrorsByDof) == 0: return []
+        if not isinstance(dofErrorsByDof[0], list): return dofErrorsByDof
+        return map(list, zip(*dofErrorsByDof))
+
+
+# Cache of convergence file indexes already generated, see
+# genConvergenceFileIndex(). Maps (absolute path, path) to a tuple of the
+# signature of the cvg files in the path, and the index.
+_cvgIndexCache = {}
+
+def _cvgFilesSignature(cvgFiles):
+    """Returns a signature of the given list of cvg files, that will change
+    if the files are modified, added or removed."""
+    signature = []
+    for cvgFilename in cvgFiles:
+        try:
+            fileStat = os.stat(cvgFilename)
+        except OSError:
+            # Deleted since being listed - so don't allow caching.
+            return None
+        signature.append((cvgFilename, fileStat.st_mtime, fileStat.st_size))
+    signature.sort()
+    return tuple(signature)
+
+#: :class:`credo.utils.LRUCache` of recently read :class:`CvgFile` objects,
+#: used by :func:`getCvgFile`. The size of each is taken as the size of its
+#: file, the total can be changed using its `setMaxBytes()` method, and it
+#: keeps counts of cache hits and misses.
+cvgFileCache = LRUCache(CVG_CACHE_MAX_BYTES)
+
+def getCvgFile(cvgFilename):
+    """Returns a :class:`CvgFile` of the given filename. Recently used
+    CvgFiles are kept in :data:`cvgFileCache`, and returned if the file
+    hasn't been modified since, so shouldn't be modified by the caller."""
+    fileStat = os.stat(cvgFilename)
+    cacheKey = (os.path.abspath(cvgFilename), fileStat.st_mtime,
+        fileStat.st_size)
+    cvgFile = cvgFileCache.get(cacheKey)
+    if cvgFile is None:
+        cvgFile = CvgFile(cvgFilename)
+        cvgFileCache.put(cacheKey, cvgFile, size=fileStat.st_size)
+    return cvgFile
+
 def genConvergenceFileIndex(path):
     '''Returns a dictionary relating field names to :class:`CvgFileInfo` 
-    classes, after reading all .cvg files in the given path.'''
+    classes, after reading all .cvg files in the given path.
+
+    The index of each path is cached, so later calls for the same path don't
+    need to open all its cvg files again, unless any of them have been
+    added, removed or modified since (see also
+    :func:`invalidateConvergenceFileIndex`).'''
     
     # get list of all convergence files
     cvgFiles=glob.glob(os.path.join(path, "*."+CVG_EXT))
+    signature = _cvgFilesSignature(cvgFiles)
+    cacheKey = (os.path.abspath(path), path)
+    try:
+        cachedSignature, cvgFileDict = _cvgIndexCache[cacheKey]
+    except KeyError:
+        pass
+    else:
+        if signature is not None and signature == cachedSignature:
+            return dict(cvgFileDict)
 
     cvgFileDict = {}
 
@@ -118,10 +292,20 @@ def genConvergenceFileIndex(path):
 
         cvgFile.close()
 
-    return cvgFileDict
-
-# TODO: the files below could perhaps be converted to an O-O representation,
-# where operations are performed on a CVG file, and support e.g. slice notation?
+    if signature is not None:
+        _cvgIndexCache[cacheKey] = (signature, cvgFileDict)
+    return dict(cvgFileDict)
+
+def invalidateConvergenceFileIndex(path=None):
+    """Clear the cached convergence file index (see
+    :func:`genConvergenceFileIndex`) for the given path, or if path is None,
+    for all paths."""
+    if path is None:
+        _cvgIndexCache.clear()
+        return
+    for cacheKey in _cvgIndexCache.keys():
+        if cacheKey[0] == os.path.abspath(path):
+            del _cvgIndexCache[cacheKey]
 
 def getCheckStepsRange(cvgFile, steps):
     """Checks that "steps" specified is valid for a given cvgFile (Python File),
@@ -144,7 +328,10 @@ def getCheckStepsRange(cvgFile, steps):
 
     # Given every 2nd line is a header
     stepTot = lineTot/2
+    return _checkStepsRange(stepTot, steps)
 
+def _checkStepsRange(stepTot, steps):
+    """As for :func:`getCheckStepsRange`, given the number of steps."""
     if steps == 'all':
         stepRange = range(0,stepTot)
     elif steps == 'last':
@@ -173,43 +360,63 @@ def getCheckStepsRange(cvgFile, steps):
 def _getLineValues(cvgFilename, stepNum):
     """Get all the values in the given step number in the filename given by
     cvgFilename. Returned as a list."""
-    # Given every 2nd line is a header, need to handle these
-    lineNum = stepNum*2+1
-    # The linecache.getline function indexes file lines from 1, hence
-    # adjustment below
-    line = linecache.getline(cvgFilename, lineNum+1) 
-    if line == "":
-        raise IOError("Couldn't read step %d (line %d) from '%s'" %
-            (stepNum, lineNum, cvgFilename))
-    elif line[0] == CVG_HEADER_LINESTART:
-        # Should have avoided header lines
-        raise IOError("Trying to read step %d (line %d) from '%s'"
-            " unexpectedly indexed to a header line" %
-            (stepNum, lineNum, cvgFilename))
-    colValsStr = line.split()
-    colVals = map(float, colValsStr)
+    cvgFile = getCvgFile(cvgFilename)
+    if stepNum < 0 or stepNum >= len(cvgFile):
+        raise IOError("Couldn't read step %d from '%s', which has %d steps"
+            % (stepNum, cvgFilename, len(cvgFile)))
+    colVals = cvgFile[stepNum]
+    if not isinstance(colVals, list): colVals = colVals.tolist()
     return colVals
 
+def _getLastLineValues(cvgFilename):
+    """Get all the values in the last step of the file given by cvgFilename,
+    as a list. The file is read backwards from the end, so this is quick
+    regardless of the length of the file."""
+    cvgFile = open(cvgFilename, "rb")
+    try:
+        cvgFile.seek(0, 2)
+        pos = cvgFile.tell()
+        remainder = ""
+        while pos > 0:
+            readSize = min(_TAIL_BLOCK_SIZE, pos)
+            pos -= readSize
+            cvgFile.seek(pos)
+            lines = (cvgFile.read(readSize) + remainder).split("\n")
+            # Unless at the start of the file, the first line may be
+            # incomplete, so save it to check with the next block.
+            remainder = ""
+            if pos > 0: remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip() and line[0] != CVG_HEADER_LINESTART:
+                    return map(float, line.split())
+    finally:
+        cvgFile.close()
+    raise CVGReadError("Error, couldn't read last step from CVG file '%s',"
+        " as it has no values lines." % (cvgFilename))
+
+def _getColValue(colVals, colIndex, cvgFilename):
+    try:
+        return colVals[colIndex]
+    except IndexError:
+        raise CVGReadError("Error, couldn't read expected error in"
+            " column %d"\
+            " from CVG file '%s'. Perhaps the model run had a parallel"\
+            " I/O problem (see CREDO FAQ online for advice)." \
+            % (colIndex, cvgFilename))
+
 def getDofErrorsForStep(cvgFileInfo, stepNum):
     """For the given :class:`CvgFileInfo` and step number, returns
     a list indexed by dof number of the error of each dof in that step.
     """
 
     colVals = _getLineValues(cvgFileInfo.filename, stepNum)
+    return _getDofErrorsFromValues(cvgFileInfo, colVals)
 
+def _getDofErrorsFromValues(cvgFileInfo, colVals):
     dofErrorsForStep = []
     for dof, colIndex in cvgFileInfo.dofColMap.iteritems():
-        try:
-            dofError = colVals[colIndex]
-        except IndexError:
-            raise CVGReadError("Error, couldn't read expected error in"
-                " column %d"\
-                " from CVG file '%s'. Perhaps the model run had a parallel"\
-                " I/O problem (see CREDO FAQ online for advice)." \
-                % (colIndex, cvgFileInfo.filename))
-        else:
-            dofErrorsForStep.append(dofError)
-    
+        dofErrorsForStep.append(_getColValue(colVals, colIndex,
+            cvgFileInfo.filename))
     return dofErrorsForStep
 
 
@@ -217,25 +424,11 @@ def getRes(cvgFilename, steps='all'):
     """For a given cvg Filename, return the 'resolutions' (length scale)
     for the given set of steps, where "steps" is of the form documented
     in :func:`getCheckStepsRange`."""
+    if steps == 'last':
+        return _getColValue(_getLastLineValues(cvgFilename), 0, cvgFilename)
+    return getCvgFile(cvgFilename).getRes(steps)
 
-    cvgFile = open(cvgFilename,"r")
-    stepRange = getCheckStepsRange(cvgFile, steps)
-
-    resResult = []
 
-    if len(stepRange) == 1:
-        resResult = _getLineValues(cvgFilename, stepRange[0])[0]
-    else:
-        for stepNum in stepRange:
-            res = _getLineValues(cvgFilename, stepNum)[0]
-            resResult.append(res)
-            
-    cvgFile.close()
-    return resResult
-
-
-# Question: should we use Numeric for this? - as performance for very large
-#  CVG files could be a bit ordinary
 def getDofErrors_ByDof(cvgFileInfo, steps='all'):
     """For a given cvgFileInfo, get the errors in the specified dof from
     the specified file, indexed primarily by Dof.
@@ -243,25 +436,11 @@ def getDofErrors_ByDof(cvgFileInfo, steps='all'):
     or a tuple specifying range (see :func:`getCheckStepsRange` for more).
     If only one step result is asked for, the dofs are returned as a
     simple 1D array, otherwise they're returned as a list."""
-
-    cvgFile = open(cvgFileInfo.filename,"r")
-
-    stepRange = getCheckStepsRange(cvgFile, steps)
-
-    dofErrors = []
-    numDofs = len(cvgFileInfo.dofColMap)
-    for ii in range(numDofs): dofErrors.append([])
-
-    if len(stepRange) == 1:
-        dofErrors = getDofErrorsForStep(cvgFileInfo, stepRange[0])
-    else:
-        for stepNum in stepRange:
-            dofErrorsStep = getDofErrorsForStep(cvgFileInfo, stepNum)
-            for dofI in range(numDofs):
-                dofErrors[dofI].append(dofErrorsStep[dofI])
-            
-    cvgFile.close()
-    return dofErrors
+    if steps == 'last':
+        return _getDofErrorsFromValues(cvgFileInfo,
+            _getLastLineValues(cvgFileInfo.filename))
+    cvgFile = getCvgFile(cvgFileInfo.filename)
+    return cvgFile.getDofErrors_ByDof(cvgFileInfo.dofColMap, steps)
 
 
 def getDofErrors_ByStep(cvgFileInfo, steps='all'):
@@ -272,20 +451,8 @@ def getDofErrors_ByStep(cvgFileInfo, steps='all'):
     or a tuple specifying range (see :func:`getCheckStepsRange` for more).
     If only one step result is asked for, the dofs are returned as a
     simple 1D array."""
-
-    cvgFile = open(cvgFileInfo.filename,"r")
-
-    stepRange = getCheckStepsRange(cvgFile, steps)
-
-    dofErrors = []
-    numDofs = len(cvgFileInfo.dofColMap)
-
-    if len(stepRange) == 1:
-        dofErrors = getDofErrorsForStep(cvgFileInfo, stepRange[0])
-    else:
-        for stepNum in stepRange:
-            dofErrorsStep = getDofErrorsForStep(cvgFileInfo, stepNum)
-            dofErrors.append(dofErrorsStep)
-            
-    cvgFile.close()
-    return dofErrors
+    if steps == 'last':
+        return _getDofErrorsFromValues(cvgFileInfo,
+            _getLastLineValues(cvgFileInfo.filename))
+    cvgFile = getCvgFile(cvgFileInfo.filename)
+    return cvgFile.getDofErrors_ByStep(cvgFileInfo.dofColMap, steps)
@@ -0,0 +1,558 @@
+##  Copyright (C), 2010, Monash University
+##  Copyright (C), 2010, Victorian Partnership for Advanced Computing (VPAC)
+##
+##  This file is part of the CREDO library.
+##  Developed as part of the Simulation, Analysis, Modelling program of
+##  AuScope Limited, and funded by the Australian Federal Government's
+##  National Collaborative Research Infrastructure Strategy (NCRIS) program.
+##
+##  This library is free software; you can redistribute it and/or
+##  modify it under the terms of the GNU Lesser General Public
+##  License as published by the Free Software Foundation; either
+##  version 2.1 of the License, or (at your option) any later version.
+##
+##  This library is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##  Lesser General Public License for more details.
+##
+##  You should have received a copy of the GNU Lesser General Public
+##  License along with this library; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+##  MA  02110-1301  USA
+
+"""
+This module "flattens" a set of StGermain XML model files, plus command-line
+overrides, into a single XML document, in Python - rather than running the
+StGermain FlattenXML tool. Generally accessed via
+:func:`credo.io.stgxml.getFlattenedXMLDoc`.
+
+The StGermain rules for merging model files are followed:
+
+* Files are read in the order given, with ``<include>`` statements
+  replaced by the contents of the included file. These are looked for
+  relative to the including file, the current directory, any
+  ``<searchPath>`` given so far, and the StGermain standard XML path (see
+  :func:`credo.io.stgpath.getStgStandardXMLPath`).
+* Where an entry has the same name as an existing entry, the result depends
+  on its ``mergeType`` attribute (or the ``childrenMergeType`` of its
+  parent struct):
+
+  * "replace" (the default): the new entry replaces the existing one.
+  * "merge": for structs, each of the new struct's entries are merged into
+    the existing one (following their own mergeType); for lists, the new
+    list's items are added to the end of the existing one.
+  * "append": the new entry is added as well as the existing one.
+
+* The "import" list is always merged, but each toolbox only imported once.
+* Command-line overrides of the form ``--struct.list[0].param=value`` are
+  then applied, creating new structs and params where necessary.
+
+The resulting document is in the format produced by FlattenXML, i.e. using
+``<element type=...>`` tags and the special ``<import>``, ``<plugins>`` and
+``<components>`` tags.
+
+Flattened models are memoized by :data:`flattenCache`, a
+:class:`FlattenCache`, keyed on the contents of all the files read plus the
+overrides - so repeated requests to flatten the same model are quick.
+"""
+
+import os
+import shlex
+import hashlib
+from xml.etree import ElementTree as etree
+
+import credo.io.stgpath
+from credo.io import stgxml
+from credo.utils import LRUCache
+
+STG_INCLUDE_TAG = "include"
+STG_SEARCHPATH_TAG = "searchPath"
+STG_CHILDREN_MERGE_ATTRIB = "childrenMergeType"
+STG_DEFAULT_MERGE_TYPE = "replace"
+#: Default maximum total size of input files of flattened models to keep in
+#: memory in :data:`flattenCache`.
+FLATTEN_CACHE_MAX_BYTES = 32*1024*1024
+#: Default maximum number of files whose contents hashes are kept by
+#: :data:`flattenCache`.
+FLATTEN_CACHE_MAX_FILE_HASHES = 10000
+#: Environment variable that, if set, gives the path for
+#: :data:`flattenCache` to also store flattened models on disk.
+FLATTEN_CACHE_DIRKEY = 'CREDO_FLATTEN_CACHE_DIR'
+# Top-level entries written first, and the tags they're written with.
+_specialOutputTags = [
+    (stgxml.STG_IMPORT_TAG, stgxml.STG_IMPORT_TAG),
+    (stgxml.STG_PLUGINS_TAG, stgxml.STG_PLUGINS_TAG),
+    (stgxml.STG_COMPONENTS_TAG, stgxml.STG_COMPONENTS_TAG)]
+
+class _StgStruct:
+    """A struct in a StGermain model being flattened: an ordered list of
+    named entries, each stored as a list of [name, value, mergeType]. Params
+    are stored as strings, lists as Python lists. Entries should be added
+    using :meth:`addEntry`, so they can be looked up by name."""
+    def __init__(self):
+        self.entries = []
+        # The first entry with each name.
+        self._entriesByName = {}
+
+    def addEntry(self, name, value, mergeType):
+        """Add a new entry to the end of the struct, and return it."""
+        entry = [name, value, mergeType]
+        self.entries.append(entry)
+        if name is not None: self._entriesByName.setdefault(name, entry)
+        return entry
+
+    def getEntry(self, name):
+        """Returns the first entry with the given name, or None."""
+        return self._entriesByName.get(name)
+
+class StgXMLFlattener:
+    '''Flattens a set of StGermain XML model files, and command-line
+    overrides, into a single model (see module docs for the rules followed).
+    Add files using :meth:`addFile`, apply overrides using
+    :meth:`applyCmdLineOverrides`, then get the result as an XML doc using
+    :meth:`getXMLDoc`.
+
+    .. attribute:: searchPaths
+
+       List of the extra paths to search for included files in, added to by
+       ``<searchPath>`` statements in the files.
+
+    .. attribute:: filesRead
+
+       List of the absolute paths of all files read in so far, including
+       included files.
+    '''
+
+    def __init__(self, searchPaths=None):
+        self.root = _StgStruct()
+        self.filesRead = []
+        self.searchPaths = []
+        if searchPaths is not None: self.searchPaths.extend(searchPaths)
+        try:
+            self._stdXMLPath = credo.io.stgpath.getStgStandardXMLPath()
+        except EnvironmentError:
+            self._stdXMLPath = None
+
+    def findFile(self, filename, fromPath=None):
+        """Returns the path of the given model file, looking in the
+        same places as StGermain does (see module docs). Raises an IOError
+        if it can't be found."""
+        searchPaths = ["."]
+        if fromPath is not None: searchPaths.insert(0, fromPath)
+        searchPaths += self.searchPaths
+        if self._stdXMLPath is not None: searchPaths.append(self._stdXMLPath)
+        if os.path.isabs(filename): searchPaths = [""]
+        for path in searchPaths:
+            fullPath = os.path.join(path, filename)
+            if os.path.isfile(fullPath): return fullPath
+        raise IOError("Error, StGermain model file '%s' not found in any"
+            " of the search paths %s." % (filename, searchPaths))
+
+    def addFile(self, filename, fromPath=None):
+        """Read in the model file given by filename, merging it into the
+        existing model."""
+        fullPath = self.findFile(filename, fromPath)
+        self.filesRead.append(os.path.abspath(fullPath))
+        try:
+            xmlDoc = etree.parse(fullPath)
+        except SyntaxError, e:
+            raise ValueError("Error, StGermain model file '%s' isn't valid"
+                " XML: %s" % (fullPath, e))
+        rootNode = xmlDoc.getroot()
+        if _localTag(rootNode.tag) != stgxml.STG_ROOT_TAG:
+            raise ValueError("Error, StGermain model file '%s' has root"
+                " element '%s', rather than '%s'." % (fullPath,
+                    rootNode.tag, stgxml.STG_ROOT_TAG))
+        self._mergeChildren(self.root, rootNode, os.path.dirname(fullPath),
+            isRoot=True)
+
+    def _mergeChildren(self, struct, xmlNode, filePath, isRoot=False):
+        """Merge the model entries given by the children of xmlNode into
+        the given struct."""
+        defMergeType = xmlNode.get(STG_CHILDREN_MERGE_ATTRIB,
+            STG_DEFAULT_MERGE_TYPE)
+        for childNode in xmlNode:
+            if not isinstance(childNode.tag, basestring):
+                # Comments and processing instructions
+                continue
+            tag = _localTag(childNode.tag)
+            if tag == STG_INCLUDE_TAG:
+                self.addFile(childNode.text.strip(), filePath)
+            elif tag == STG_SEARCHPATH_TAG:
+                self.searchPaths.append(os.path.join(filePath,
+                    childNode.text.strip()))
+            else:
+                name, value = self._readValue(childNode, filePath)
+                mergeType = childNode.get(stgxml.STG_MERGE_ATTRIB,
+                    defMergeType)
+                if isRoot and name == stgxml.STG_IMPORT_TAG:
+                    self._mergeImports(value)
+                else:
+                    _mergeEntry(struct, name, value, mergeType)
+
+    def _readValue(self, xmlNode, filePath):
+        """Read a model element, returning its name and value."""
+        eltType = stgxml.getElementType(xmlNode)
+        tag = _localTag(xmlNode.tag)
+        if tag in stgxml._stgSpecialLists[eltType]:
+            name = tag
+        else:
+            name = xmlNode.get('name')
+        if eltType == stgxml.STG_PARAM_TAG:
+            value = (xmlNode.text or "").strip()
+        elif eltType == stgxml.STG_LIST_TAG:
+            value = []
+            for itemNode in xmlNode:
+                if not isinstance(itemNode.tag, basestring): continue
+                value.append(self._readValue(itemNode, filePath)[1])
+        else:
+            value = _StgStruct()
+            self._mergeChildren(value, xmlNode, filePath)
+        return name, value
+
+    def _mergeImports(self, toolboxes):
+        entry = self.root.getEntry(stgxml.STG_IMPORT_TAG)
+        if entry is None:
+            entry = self.root.addEntry(stgxml.STG_IMPORT_TAG, [],
+                STG_DEFAULT_MERGE_TYPE)
+        for toolbox in toolboxes:
+            if toolbox not in entry[1]: entry[1].append(toolbox)
+
+    def applyCmdLineOverrides(self, cmdLineOverrides):
+        """Apply the model parameter overrides in the given string of
+        StGermain command-line arguments, e.g.
+        "--dim=3 --components.context.Type=FiniteElementContext".
+        Arguments that aren't of this form (e.g. PETSc options) are
+        ignored."""
+        for arg in shlex.split(cmdLineOverrides):
+            if not arg.startswith("--"): continue
+            strSpec, sep, value = arg[2:].partition("=")
+            if sep != "=" or strSpec == "": continue
+            self.setValue(strSpec, value)
+
+    def setValue(self, strSpec, value):
+        """Set the param at the given StGermain command-line style
+        specification (e.g. "vcList[2].type") to the given value,
+        creating any structs needed along the way."""
+        specParts = _splitStrSpec(strSpec)
+        container = self.root
+        for partI, part in enumerate(specParts):
+            isLast = (partI == len(specParts) - 1)
+            if isinstance(part, int):
+                if not isinstance(container, list):
+                    raise ValueError("Error, in override '%s', index [%d]"
+                        " given for an entry that isn't a list."
+                        % (strSpec, part))
+                if part > len(container):
+                    raise ValueError("Error, in override '%s', index [%d]"
+                        " is past the end of a list of length %d."
+                        % (strSpec, part, len(container)))
+                if part == len(container):
+                    container.append(_StgStruct())
+                if isLast:
+                    container[part] = value
+                else:
+                    container = container[part]
+            else:
+                if not isinstance(container, _StgStruct):
+                    raise ValueError("Error, in override '%s', entry '%s'"
+                        " given for an entry that isn't a struct."
+                        % (strSpec, part))
+                entry = container.getEntry(part)
+                if isLast:
+                    _mergeEntry(container, part, value,
+                        STG_DEFAULT_MERGE_TYPE)
+                elif entry is None:
+                    newValue = _StgStruct()
+                    if isinstance(specParts[partI+1], int): newValue = []
+                    container.addEntry(part, newValue,
+                        STG_DEFAULT_MERGE_TYPE)
+                    container = newValue
+                else:
+                    container = entry[1]
+
+    def getXMLDoc(self, nsTags=True):
+        """Returns the flattened model, as an ElementTree XML doc, in the
+        same format as files written by FlattenXML.
+
+        :keyword nsTags: if True, tag names include the StGermain namespace,
+          as for a flattened file parsed in using ElementTree, and is
+          suitable for use with the :mod:`credo.io.stgxml` functions.
+          Otherwise the namespace is just set as an attribute of the root
+          node, suitable for writing to file."""
+        if nsTags:
+            tagFunc = stgxml.addNsPrefix
+            rootNode = etree.Element(tagFunc(stgxml.STG_ROOT_TAG))
+        else:
+            tagFunc = str
+            rootNode = etree.Element(stgxml.STG_ROOT_TAG, xmlns=stgxml.STG_NS)
+        entries = self.root.entries[:]
+        for specialName, specialTag in _specialOutputTags:
+            for entry in entries:
+                if entry[0] == specialName:
+                    node = etree.SubElement(rootNode, tagFunc(specialTag))
+                    if specialName == stgxml.STG_IMPORT_TAG:
+                        for toolbox in entry[1]:
+                            etree.SubElement(node, tagFunc(
+                                stgxml.STG_TOOLBOX_TAG)).text = toolbox
+                    else:
+                        _writeValueContents(node, entry[1], tagFunc)
+                    entries.remove(entry)
+                    break
+        for name, value, mergeType in entries:
+            _writeEntry(rootNode, name, value, tagFunc)
+        stgxml.indentForPrettyPrint(rootNode)
+        return etree.ElementTree(rootNode)
+
+class FlattenCache:
+    '''A cache of flattened models, as returned by :func:`flattenStgXML`.
+    Models are keyed on a hash of the contents of the input files, the
+    overrides and the search paths. Before a cached model is used, the
+    contents of all the files it read (including included files) are checked
+    to be unchanged. (File contents hashes are themselves saved while a
+    file's size and modification time are unchanged, for up to
+    `maxFileHashes` files.)
+
+    Models are kept in memory up to a total size of `maxBytes` (as measured
+    by the size of the files read to flatten them), discarding least
+    recently used models. If `diskPath` is given, models are also stored
+    as files in that directory, so they can be re-used by other processes.
+
+    .. attribute:: hits
+
+       Number of requests that were found in memory.
+
+    .. attribute:: diskHits
+
+       Number of requests that were found on disk.
+
+    .. attribute:: misses
+
+       Number of requests that needed the model to be flattened.
+    '''
+
+    def __init__(self, maxBytes=FLATTEN_CACHE_MAX_BYTES, diskPath=None,
+            maxFileHashes=FLATTEN_CACHE_MAX_FILE_HASHES):
+        self.memCache = LRUCache(maxBytes)
+        self.diskPath = diskPath
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        # (mtime, size, contents hash) of each file, by filename - "sized"
+        #  as one each, so maxFileHashes are kept.
+        self._fileHashes = LRUCache(maxFileHashes)
+
+    def clear(self):
+        """Clear the in-memory cache and counters. (Files stored on disk
+        aren't removed.)"""
+        self.memCache.clear()
+        self._fileHashes.clear()
+        self.hits = self.diskHits = self.misses = 0
+
+    def stats(self):
+        """Returns a dict of the counters and current size of the cache."""
+        memStats = self.memCache.stats()
+        return {'hits':self.hits, 'diskHits':self.diskHits,
+            'misses':self.misses, 'entries':memStats['entries'],
+            'bytes':memStats['bytes'], 'maxBytes':memStats['maxBytes'],
+            'fileHashes':len(self._fileHashes)}
+
+    def fileHash(self, filename):
+        """Returns a hash of the contents of the given file."""
+        fileStat = os.stat(filename)
+        fileInfo = (fileStat.st_mtime, fileStat.st_size)
+        savedHash = self._fileHashes.get(filename)
+        if savedHash is not None and savedHash[:2] == fileInfo:
+            return savedHash[2]
+        inFile = open(filename, "rb")
+        try:
+            contentsHash = hashlib.sha1(inFile.read()).hexdigest()
+        finally:
+            inFile.close()
+        self._fileHashes.put(filename, fileInfo + (contentsHash,), size=1)
+        return contentsHash
+
+    def _depsValid(self, deps):
+        for filename, contentsHash in deps:
+            try:
+                if self.fileHash(filename) != contentsHash: return False
+            except (IOError, OSError):
+                return False
+        return True
+
+    def getXMLDoc(self, inputFiles, cmdLineOverrides="", searchPaths=None):
+        """Returns the flattened model XML doc of the given input files
+        and overrides (see :func:`flattenStgXML`), from the cache if
+        possible. The doc returned may be shared with other callers, so
+        shouldn't be modified."""
+        return self._getEntry(inputFiles, cmdLineOverrides, searchPaths)[1]
+
+    def getDependencies(self, inputFiles, searchPaths=None):
+        """Returns a list of (filename, contents hash) of all the files read
+        to flatten the model given by the input files (i.e. including any
+        included files), flattening it if it isn't already cached."""
+        return self._getEntry(inputFiles, "", searchPaths)[0]
+
+    def _getEntry(self, inputFiles, cmdLineOverrides, searchPaths):
+        flattener = StgXMLFlattener(searchPaths)
+        keyHash = hashlib.sha1()
+        keyHash.update(repr((cmdLineOverrides, searchPaths)))
+        for inputFile in inputFiles:
+            fullPath = os.path.abspath(flattener.findFile(inputFile))
+            keyHash.update("\0%s\0%s" % (fullPath, self.fileHash(fullPath)))
+        cacheKey = keyHash.hexdigest()
+
+        entry = self.memCache.get(cacheKey)
+        if entry is not None and self._depsValid(entry[0]):
+            self.hits += 1
+            return entry
+        entry = self._loadFromDisk(cacheKey)
+        if entry is not None:
+            self.diskHits += 1
+        else:
+            self.misses += 1
+            for inputFile in inputFiles:
+                flattener.addFile(inputFile)
+            if cmdLineOverrides:
+                flattener.applyCmdLineOverrides(cmdLineOverrides)
+            deps = [(filename, self.fileHash(filename)) for filename in
+                flattener.filesRead]
+            entry = (deps, flattener.getXMLDoc())
+            self._saveToDisk(cacheKey, entry)
+        size = sum([os.path.getsize(filename) for filename, h in entry[0]])
+        self.memCache.put(cacheKey, entry, size=size)
+        return entry
+
+    def _diskFilenames(self, cacheKey):
+        basename = os.path.join(self.diskPath, cacheKey)
+        return basename+".xml", basename+".deps"
+
+    def _loadFromDisk(self, cacheKey):
+        if self.diskPath is None: return None
+        xmlFilename, depsFilename = self._diskFilenames(cacheKey)
+        try:
+            depsFile = open(depsFilename, "r")
+            try:
+                deps = [tuple(line.rstrip("\n").split("\t", 1)[::-1])
+                    for line in depsFile]
+            finally:
+                depsFile.close()
+            if not self._depsValid(deps): return None
+            xmlDoc = etree.parse(xmlFilename)
+        except (IOError, OSError, SyntaxError, ValueError):
+            return None
+        return deps, xmlDoc
+
+    def _saveToDisk(self, cacheKey, entry):
+        if self.diskPath is None: return
+        xmlFilename, depsFilename = self._diskFilenames(cacheKey)
+        tmpSuffix = ".tmp%d" % os.getpid()
+        deps, xmlDoc = entry
+        try:
+            if not os.path.exists(self.diskPath):
+                os.makedirs(self.diskPath)
+            # Write to temporary files then rename, so other processes
+            # never see partly-written files.
+            xmlDoc.write(xmlFilename+tmpSuffix)
+            depsFile = open(depsFilename+tmpSuffix, "w")
+            try:
+                for filename, contentsHash in deps:
+                    depsFile.write("%s\t%s\n" % (contentsHash, filename))
+            finally:
+                depsFile.close()
+            os.rename(xmlFilename+tmpSuffix, xmlFilename)
+            os.rename(depsFilename+tmpSuffix, depsFilename)
+        except (IOError, OSError):
+            for tmpFilename in (xmlFilename+tmpSuffix,
+                    depsFilename+tmpSuffix):
+                if os.path.exists(tmpFilename): os.remove(tmpFilename)
+
+#: The :class:`FlattenCache` used by
+#: :func:`credo.io.stgxml.getFlattenedXMLDoc`. Stores flattened models on
+#: disk if the :data:`FLATTEN_CACHE_DIRKEY` environment variable is set.
+flattenCache = FlattenCache(diskPath=os.environ.get(FLATTEN_CACHE_DIRKEY))
+
+def flattenStgXML(inputFiles, cmdLineOverrides="", searchPaths=None,
+        nsTags=True):
+    """Flatten the given list of StGermain model input files, and string of
+    command-line overrides, into a single XML doc, which is returned.
+    See :class:`StgXMLFlattener` and :meth:`StgXMLFlattener.getXMLDoc`."""
+    flattener = StgXMLFlattener(searchPaths)
+    for inputFile in inputFiles:
+        flattener.addFile(inputFile)
+    if cmdLineOverrides:
+        flattener.applyCmdLineOverrides(cmdLineOverrides)
+    return flattener.getXMLDoc(nsTags)
+
+def _localTag(tag):
+    """Returns the given tag name, without any namespace."""
+    if tag[0] == "{":
+        return tag[tag.index("}")+1:]
+    return tag
+
+def _mergeEntry(struct, name, value, mergeType):
+    """Merge the given named entry into the given struct, according to the
+    StGermain mergeType."""
+    if mergeType not in stgxml.STG_MERGE_TYPES:
+        raise ValueError("Error, entry '%s' has mergeType '%s', which is not"
+            " one of the allowed StGermain merge types (%s)."
+            % (name, mergeType, stgxml.STG_MERGE_TYPES))
+    entry = None
+    if name is not None: entry = struct.getEntry(name)
+    if entry is None or mergeType == "append":
+        struct.addEntry(name, value, mergeType)
+    elif mergeType == "merge" and isinstance(entry[1], _StgStruct) \
+            and isinstance(value, _StgStruct):
+        for childName, childValue, childMergeType in value.entries:
+            _mergeEntry(entry[1], childName, childValue, childMergeType)
+    elif mergeType == "merge" and isinstance(entry[1], list) \
+            and isinstance(value, list):
+        entry[1].extend(value)
+    else:
+        entry[1] = value
+
+def _splitStrSpec(strSpec):
+    """Split a StGermain command-line style specification, e.g.
+    "plugins[0].Type", into a list of struct entry names and list indices,
+    e.g. ['plugins', 0, 'Type']."""
+    specParts = []
+    for dotPart in strSpec.split("."):
+        name, sep, rem = dotPart.partition("[")
+        if name != "": specParts.append(name)
+        while sep == "[":
+            indexStr, endSep, rem = rem.partition("]")
+            if endSep != "]" or not indexStr.isdigit():
+                raise ValueError("Error, badly formed list index in '%s'."
+                    % (strSpec))
+            specParts.append(int(indexStr))
+            name, sep, rem = rem.partition("[")
+            if name != "":
+                raise ValueError("Error, unexpected characters '%s' after"
+                    " list index in '%s'." % (name, strSpec))
+    if len(specParts) == 0 or "" in specParts:
+        raise ValueError("Error, badly formed specification '%s'."
+            % (strSpec))
+    return specParts
+
+def _writeEntry(parentNode, name, value, tagFunc):
+    if isinstance(value, _StgStruct):
+        eltType = stgxml.STG_STRUCT_TAG
+    elif isinstance(value, list):
+        eltType = stgxml.STG_LIST_TAG
+    else:
+        eltType = stgxml.STG_PARAM_TAG
+    node = etree.SubElement(parentNode, tagFunc(stgxml.STG_ELEMENT_TAG),
+        type=eltType)
+    if name is not None: node.set('name', name)
+    _writeValueContents(node, value, tagFunc)
+
+def _writeValueContents(node, value, tagFunc):
+    if isinstance(value, _StgStruct):
+        for name, childValue, mergeType in value.entries:
+            _writeEntry(node, name, childValue, tagFunc)
+    elif isinstance(value, list):
+        for itemValue in value:
+            _writeEntry(node, None, itemValue, tagFunc)
+    else:
+        node.text = value
@@ -25,13 +25,47 @@
 
 Primary construct is the FreqOutput class, which once constructed has numerous
 methods to access data from a FrequentOutput file.
+
+If the `numpy <http://numpy.scipy.org>`_ library is installed, FreqOutputs can
+also store their records in "columnar" form, which is much faster for large
+FrequentOutput files (see :class:`FreqOutput`).
 '''
 
 import os
 import operator
+import bisect
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 STG_DEF_FREQ_FILENAME='FrequentOutput.dat'
 FREQ_HEADER_LINESTART='#'
+FREQ_TSTEP_HEADER='Timestep'
+#: Extension added to the FrequentOutput filename for its cache file, and
+#: then the cache's key file (see :class:`FreqOutput`).
+FREQ_CACHE_EXT='.cache.npy'
+FREQ_CACHE_KEY_EXT='.key'
+#: Increment if the format of cache files changes, to invalidate old ones.
+FREQ_CACHE_VERSION=1
+
+def _stripHeaderLines(text):
+    """Return the given text from a FrequentOutput file, with all header
+    lines removed."""
+    # The header char never occurs in values lines, so just search for it.
+    dataChunks = []
+    chunkStart = 0
+    while True:
+        headerStart = text.find(FREQ_HEADER_LINESTART, chunkStart)
+        if headerStart == -1:
+            dataChunks.append(text[chunkStart:])
+            break
+        dataChunks.append(text[chunkStart:headerStart])
+        headerEnd = text.find("\n", headerStart)
+        if headerEnd == -1: break
+        chunkStart = headerEnd + 1
+    return "".join(dataChunks)
 
 class FreqOutput:
     '''A simple class to store information about a frequent output file,
@@ -45,6 +79,36 @@ class FreqOutput:
     calling an access function directly such as
     :meth:`getRecordDictAtStep()` will
     automatically populate the data cache for you behind the scenes.
+
+    By default records are stored as a list of lists of floats (see
+    :meth:`getAllRecords`). If the `columnar` constructor argument is True,
+    the file is instead parsed in bulk into a typed numpy record array (see
+    :attr:`recordsArray`), :meth:`getValuesArray` returns views of its columns
+    rather than copies, and the standard reduction ops in this module are
+    vectorised. The list-of-records interface still works in this mode, the
+    list is just created from the array on first request.
+
+    If the `lazy` constructor argument is True, single-timestep lookups such
+    as :meth:`getRecordDictAtStep` and :meth:`getValueAtStep` don't populate
+    the data cache. Instead the file is scanned once to build an index of
+    the byte offset of each timestep's record (see :meth:`buildIndex`), and
+    only the requested lines are then read and parsed. This is recommended
+    for very large FrequentOutput files when only a few timesteps are needed.
+    Functions that need all the records, such as :meth:`getValuesArray`,
+    still populate the cache as usual.
+
+    To follow a FrequentOutput file while its model is still running, call
+    :meth:`refresh` periodically: each call reads just the records appended
+    since the last one.
+
+    If the `useCache` constructor argument is True (implies columnar mode),
+    then after the file is first parsed, the records array is saved to a
+    binary cache file next to it (named with the extension
+    :data:`FREQ_CACHE_EXT`). Later FreqOutputs created with `useCache` on the
+    same file just memory-map the cache, rather than parsing the text.
+    The cache is keyed on the size and modification time of the
+    FrequentOutput file, so is re-created automatically if it changes.
+    If the cache can't be written (e.g. due to permissions), it's skipped.
     
     Key attributes:
 
@@ -58,9 +122,35 @@ class FreqOutput:
        dict, mapping header names in the FrequentOutput to the column number
        they occupy in the file.
 
+    .. attribute:: columnar
+
+       Bool, whether records are stored in columnar form in
+       :attr:`recordsArray` (requires numpy).
+
+    .. attribute:: recordsArray
+
+       Only used in columnar mode: once populated, a numpy record array
+       with one field per header, in file order. The Timestep field is of
+       int type, all others are floats.
+
+    .. attribute:: lazy
+
+       Bool, whether single-timestep lookups are done by seeking to the
+       timestep's record in the file, rather than populating all records.
+
+    .. attribute:: recordOffsets
+
+       Only used in lazy mode: once :meth:`buildIndex` has been called, a list
+       of the byte offsets in the file of each record, by record number.
+
+    .. attribute:: useCache
+
+       Bool, whether to use a binary cache file of the records, see above.
+
     '''
 
-    def __init__(self, path, filename=STG_DEF_FREQ_FILENAME):
+    def __init__(self, path, filename=STG_DEF_FREQ_FILENAME, columnar=False,
+            lazy=False, useCache=False):
         self.path = path
         self.filename = filename
         fullFilename = os.path.join(path, filename)
@@ -68,12 +158,24 @@ class FreqOutput:
             raise ValueError("Error, the path and filename passed in, '%s' "
                 " and '%s', does not point to a valid freq output file."
                 % (path, filename))
+        if useCache: columnar = True
+        if columnar and numpy is None:
+            raise ImportError("Error, columnar storage of FreqOutput records"
+                " requires the numpy python library to be installed.")
+        self.columnar = columnar
+        self.lazy = lazy
+        self.useCache = useCache
         self.populated = False
         self.headers = None
         self.headerColMap = {}
         self.records = None
+        self.recordsArray = None
+        self._recordsBuffer = None
         self.tStepMap = {}
+        self.recordOffsets = None
         self._finalTimeStep = None
+        self._readOffset = 0
+        self._sortedCols = {}
         try:
             self.file = open(fullFilename, "r")
         except IOError:
@@ -82,16 +184,265 @@ class FreqOutput:
                 " Possibly the relevant ModelRun didn't have one enabled."
                 % (fullFilename))
 
+    def __getstate__(self):
+        # The open file can't be pickled (e.g. to pass between processes),
+        # so is re-opened when unpickled. It's always seeked before reading.
+        state = self.__dict__.copy()
+        del state['file']
+        # The records array is a view of the over-allocated buffer, so only
+        # send the array, and rebuild the buffer from it when unpickled.
+        # Records loaded from the cache are sent as a plain array, rather
+        # than as a memory-map of the cache file.
+        del state['_recordsBuffer']
+        if self.recordsArray is not None \
+                and isinstance(self.recordsArray, numpy.memmap):
+            state['recordsArray'] = numpy.array(self.recordsArray)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # The unpickled records array has its own data, so it can act as
+        # the buffer for further records read by refresh().
+        self._recordsBuffer = self.recordsArray
+        self.file = open(os.path.join(self.path, self.filename), "r")
+
     def populateFromFile(self):
         """This function will read all essential data from the FrequentOutput
         file associated with the class into data structures in memory, for fast
         subsequent access. Saves the fact that this has occurred so it doesn't
-        neeed to be repeated in future."""
-        self.getHeaders()
-        self.getAllRecords()
-        self.getTimestepMap()
+        neeed to be repeated in future.
+
+        This assumes the file is complete, e.g. the model run has finished:
+        see :meth:`refresh` for reading the file while it's being written."""
+        self._resetRecords()
+        if self.useCache:
+            fileStat = os.fstat(self.file.fileno())
+            if not self._loadCache(fileStat):
+                self._readNewData(complete=True)
+                self._writeCache(fileStat)
+        else:
+            self._readNewData(complete=True)
         self.populated = True
-    
+        # The lazy mode index isn't needed any more.
+        self.recordOffsets = None
+
+    def refresh(self):
+        """Read any records that have been appended to the FrequentOutput
+        file since it was last read, e.g. while the model is still running.
+        Only the new part of the file is read, and any incomplete last line
+        is left until the next refresh. If the file hasn't been read yet,
+        all complete records are read in.
+
+        Returns the number of new records read."""
+        if not self.populated:
+            self._resetRecords()
+            self.populated = True
+            self.recordOffsets = None
+        return self._readNewData(complete=False)
+
+    def _resetRecords(self):
+        self.headers = None
+        self.headerColMap = {}
+        self.records = None
+        if not self.columnar: self.records = []
+        self.recordsArray = None
+        self._recordsBuffer = None
+        self.tStepMap = {}
+        self._finalTimeStep = None
+        self._readOffset = 0
+        self._sortedCols = {}
+
+    def _readNewData(self, complete):
+        """Read and store all records in the file after the offset it's been
+        read up to. If `complete` is False, an unterminated last line is
+        assumed to be still being written, so left unread.
+        Returns the number of new records read."""
+        self.file.seek(self._readOffset)
+        newText = self.file.read()
+        if not complete:
+            lastLineEnd = newText.rfind("\n")
+            newText = newText[:lastLineEnd+1]
+        if not newText: return 0
+        self._readOffset += len(newText)
+        if self.headers is None:
+            assert newText[0] == FREQ_HEADER_LINESTART
+            headerEnd = newText.find("\n")
+            if headerEnd == -1: headerEnd = len(newText)
+            self.headers = newText[1:headerEnd].split()
+            for hI, header in enumerate(self.headers):
+                self.headerColMap[header] = hI
+            newText = newText[headerEnd+1:]
+        firstRecNum = self._numRecords()
+        if self.columnar:
+            self._appendColumns(newText)
+            tSteps = self.recordsArray[FREQ_TSTEP_HEADER][firstRecNum:].tolist()
+        else:
+            for line in newText.splitlines():
+                if not line or line[0] == FREQ_HEADER_LINESTART:
+                    # Currently, on restart runs it will re-add a header to
+                    # Freq out, so ignore this
+                    continue
+                self.records.append(self._parseRecordLine(line))
+            tStepCol = self.headerColMap[FREQ_TSTEP_HEADER]
+            tSteps = [record[tStepCol] for record in
+                self.records[firstRecNum:]]
+        for recordNum, tstep in enumerate(tSteps):
+            self.tStepMap[tstep] = firstRecNum + recordNum
+        if tSteps:
+            self._finalTimeStep = tSteps[-1]
+            self._sortedCols = {}
+        return len(tSteps)
+
+    def _cacheFilenames(self):
+        cacheFilename = os.path.join(self.path, self.filename+FREQ_CACHE_EXT)
+        return cacheFilename, cacheFilename+FREQ_CACHE_KEY_EXT
+
+    def _cacheKey(self, fileStat):
+        return "%d %d %r\n" % (FREQ_CACHE_VERSION, fileStat.st_size,
+            fileStat.st_mtime)
+
+    def _loadCache(self, fileStat):
+        """Try to load the records from the cache file, if it's valid for the
+        FrequentOutput file with the given stat. Returns True if loaded."""
+        cacheFilename, keyFilename = self._cacheFilenames()
+        try:
+            keyFile = open(keyFilename, "r")
+            try:
+                cacheKey = keyFile.read()
+            finally:
+                keyFile.close()
+            if cacheKey != self._cacheKey(fileStat): return False
+            # Copy-on-write, so the cache file is never modified.
+            recordsArray = numpy.load(cacheFilename, mmap_mode='c')
+        except (IOError, OSError, ValueError):
+            return False
+        self.recordsArray = recordsArray
+        self.headers = list(recordsArray.dtype.names)
+        for hI, header in enumerate(self.headers):
+            self.headerColMap[header] = hI
+        tSteps = recordsArray[FREQ_TSTEP_HEADER].tolist()
+        self.tStepMap = dict(zip(tSteps, xrange(len(tSteps))))
+        if tSteps: self._finalTimeStep = tSteps[-1]
+        self._readOffset = fileStat.st_size
+        return True
+
+    def _writeCache(self, fileStat):
+        """Save the records array to the cache file, keyed on the given stat
+        of the FrequentOutput file."""
+        if self.recordsArray is None: return
+        if self._readOffset != fileStat.st_size: return
+        cacheFilename, keyFilename = self._cacheFilenames()
+        tmpSuffix = ".tmp%d" % os.getpid()
+        try:
+            # Write to temporary files then rename, so other processes
+            # never see partly-written cache files.
+            cacheFile = open(cacheFilename+tmpSuffix, "wb")
+            try:
+                numpy.save(cacheFile, self.recordsArray)
+            finally:
+                cacheFile.close()
+            keyFile = open(keyFilename+tmpSuffix, "w")
+            try:
+                keyFile.write(self._cacheKey(fileStat))
+            finally:
+                keyFile.close()
+            os.rename(cacheFilename+tmpSuffix, cacheFilename)
+            os.rename(keyFilename+tmpSuffix, keyFilename)
+        except (IOError, OSError):
+            for tmpFilename in (cacheFilename+tmpSuffix,
+                    keyFilename+tmpSuffix):
+                if os.path.exists(tmpFilename): os.remove(tmpFilename)
+
+    def _numRecords(self):
+        if self.columnar:
+            if self.recordsArray is None: return 0
+            return len(self.recordsArray)
+        return len(self.records)
+
+    def _appendColumns(self, dataText):
+        """Parse the records in the given text in bulk, and append them to
+        :attr:`recordsArray`."""
+        # Restart runs re-add header lines, so strip all of them.
+        values = numpy.fromstring(_stripHeaderLines(dataText), dtype=float,
+            sep=" ")
+        numCols = len(self.headers)
+        if values.size % numCols != 0:
+            raise ValueError("Error, Freq output file '%s' has %d values,"
+                " which doesn't match its %d headers %s."
+                % (os.path.join(self.path, self.filename), values.size,
+                    numCols, self.headers))
+        values = values.reshape(-1, numCols)
+        numOld = self._numRecords()
+        numNew = numOld + len(values)
+        if self._recordsBuffer is None or numNew > len(self._recordsBuffer):
+            # Grow the buffer geometrically, so that repeated refreshes
+            # don't have to copy all the records each time.
+            colTypes = []
+            for header in self.headers:
+                if header == FREQ_TSTEP_HEADER:
+                    colTypes.append((header, int))
+                else:
+                    colTypes.append((header, float))
+            capacity = numNew
+            if self._recordsBuffer is not None:
+                capacity = max(numNew, 2 * len(self._recordsBuffer))
+            newBuffer = numpy.empty(capacity, dtype=colTypes)
+            if numOld > 0: newBuffer[:numOld] = self.recordsArray
+            self._recordsBuffer = newBuffer
+        self.recordsArray = self._recordsBuffer[:numNew]
+        for colNum, header in enumerate(self.headers):
+            self.recordsArray[header][numOld:] = values[:, colNum]
+        self.records = None
+
+    def buildIndex(self):
+        """Scan the associated FrequentOutput file once, and build the
+        timestep map (see :meth:`getTimestepMap`) and the list of byte
+        offsets of each record (:attr:`recordOffsets`), so individual records
+        can be read later without parsing the whole file. Only the timestep
+        of each record is parsed."""
+        self.getHeaders()
+        self.file.seek(0)
+        # Use readline() rather than iterating, so tell() stays accurate.
+        offset = 0
+        recordNum = 0
+        tStepMap = {}
+        recordOffsets = []
+        lastTStep = None
+        readline = self.file.readline
+        while True:
+            line = readline()
+            if not line: break
+            if line[0] != FREQ_HEADER_LINESTART:
+                # See comment in getAllRecords re duplicate header lines
+                lastTStep = int(line.split(None, 1)[0])
+                tStepMap[lastTStep] = recordNum
+                recordOffsets.append(offset)
+                recordNum += 1
+            offset += len(line)
+        self.tStepMap = tStepMap
+        self.recordOffsets = recordOffsets
+        self._finalTimeStep = lastTStep
+
+    def _prepareForLookup(self):
+        """Make sure individual timesteps can be looked up - by populating
+        the data cache, or in lazy mode just building the record index."""
+        if self.populated: return
+        if self.lazy:
+            if self.recordOffsets is None: self.buildIndex()
+        else:
+            self.populateFromFile()
+
+    def _parseRecordLine(self, line):
+        """Convert a values line of the file into a record
+        (see :meth:`getAllRecords`)."""
+        # We are assuming all freq output values are floats. Might be better
+        # to actually record the data type in the headers somehow?
+        recordValueNums = [float(val) for val in line.split()]
+        # For now, manually convert tstep specially to int.
+        tStepCol = self.headerColMap[FREQ_TSTEP_HEADER]
+        recordValueNums[0] = int(recordValueNums[tStepCol])
+        return recordValueNums
+
     def getHeaders(self):
         """Read the headers from the associated FrequentOutput file, populate
         attr:`headerColMap`, and return the names of the headers
@@ -112,23 +463,15 @@ class FreqOutput:
         FrequentOutput file - stores this, and returns a reference to it.
 
         This is important especially if the FrequentOutput has been sampled from
-        the model at a timstep frequency less than 1."""
+        the model at a timstep frequency less than 1.
 
-        if not self.populated:
-            self.file.seek(0)
-            # First line should be headers, skip
-            firstLine = self.file.readline()
-            assert(firstLine[0]) == FREQ_HEADER_LINESTART
-            # need to do this rather than just enumerate because
-            # of possible duplicate header lines
-            recordNum = 0
-            for lineNum, line in enumerate(self.file):
-                # See comment above in getAllRecords
-                if line[0] == FREQ_HEADER_LINESTART:
-                    continue
-                tstep = int(line.split()[0])
-                self.tStepMap[tstep] = recordNum
-                recordNum+=1
+        In lazy mode, this builds the record index (see :meth:`buildIndex`)
+        if it doesn't already exist."""
+
+        if not self.populated and self.lazy:
+            if self.recordOffsets is None: self.buildIndex()
+        elif not self.populated:
+            self.populateFromFile()
         return self.tStepMap    
 
     def getAllRecords(self):
@@ -141,26 +484,12 @@ class FreqOutput:
         data itself by header name, ie the self.headerColMap.
         
         Saves this as self.records, and returns a reference to it.
-        (Also populates the self._finalTimeStep attribute.)""" 
-        if not self.populated:
-            self.file.seek(0)
-            self.headers = self.getHeaders()
-            tStepCol = self.headerColMap['Timestep']
-            self.records = []
-            for line in self.file:
-                if line[0] == FREQ_HEADER_LINESTART:
-                    # Currently, on restart runs it will re-add a header to
-                    # Freq out, so ignore this
-                    continue
-                recordValues = line.split()
-                # We are assuming all freq output values are floats.
-                # Might be better
-                # to actually record the data type in the headers somehow?
-                recordValueNums = [float(val) for val in recordValues]
-                # For now, manually convert tstep specially to int.
-                recordValueNums[0] = int(recordValueNums[tStepCol])
-                self.records.append(recordValueNums)
-        self._finalTimeStep = (self.records[-1])[tStepCol]
+        (Also populates the self._finalTimeStep attribute.)
+
+        In columnar mode, the list is created from :attr:`recordsArray`.""" 
+        if not self.populated: self.populateFromFile()
+        if self.columnar and self.records is None:
+            self.records = map(list, self.recordsArray.tolist())
         return self.records
 
     def getRecordDictAtStep(self, tstep):
@@ -169,7 +498,7 @@ class FreqOutput:
         headername is the name of each header in the FrequentOutput file, and
         recordVal is the value of that property at the requested timestep."""
 
-        if not self.populated: self.populateFromFile()
+        self._prepareForLookup()
         record = self.getRecordAtStep(tstep)
         recordDict = {}
         for header, col in self.headerColMap.iteritems():
@@ -180,25 +509,23 @@ class FreqOutput:
         """Utility wrapper function to get a dictionary of records in
         the FreqOutput at the final timestep - see :attr:`.getRecordDictAtStep`
         ."""
-        if not self.populated: self.populateFromFile()
+        self._prepareForLookup()
         return self.getRecordDictAtStep(self._finalTimeStep)
 
     def finalStep(self):
         """Returns the highest timestep number that has information recorded for
         it in the associated FrequentOutput file."""
-        if not self.populated: self.populateFromFile()
+        self._prepareForLookup()
         return self._finalTimeStep
 
     def getValueAtStep(self, headerName, tstep):
         """Gets the values of a property given by 'headerName', at a specified
         timestep 'tstep'."""
 
-        if not self.populated:
-            # We will take the approach that you should always populate the 
-            # info for fast access. If memory were really a concern, could use
-            # algorithms and/or read file line-by-line until (if) correct 
-            # timestep's data found.
-            self.populateFromFile()
+        # By default we take the approach that you should always populate
+        # the info for fast access. If memory is a concern, use lazy mode,
+        # which reads only the requested timestep's line from file.
+        self._prepareForLookup()
         colNum = self.getColNum(headerName)
         record = self.getRecordAtStep(tstep)
         value = record[colNum]
@@ -208,22 +535,123 @@ class FreqOutput:
         """Gets the record number in the FrequentOutput file of a given
         timestep. E.g. in a FrequentOutput file where values were saved
         every 5 timesteps, then the 15th timestep will map to the 3rd record."""
-        if not self.populated: self.populateFromFile()
+        self._prepareForLookup()
         try:
             recordNum = self.tStepMap[tstep]
         except KeyError:
-            tSteps = self.tStepMap.keys()
+            if len(self.tStepMap) == 0:
+                raise ValueError("Error, timestep at which to get value, %d,"
+                    " doesn't exist in this Frequent output file, which has"
+                    " no records." % (tstep))
+            if self.populated and self._getSortedColumn(FREQ_TSTEP_HEADER) \
+                    is not None:
+                tSteps = self._getSortedColumn(FREQ_TSTEP_HEADER)
+                firstStep, lastStep = tSteps[0], tSteps[-1]
+            else:
+                firstStep = min(self.tStepMap)
+                lastStep = max(self.tStepMap)
             raise ValueError("Error, timestep at which to get value, %d,"
                 " doesn't exist in this Frequent output file (valid range is"
-                " (%d-%d)." % (tstep, min(tSteps), max(tSteps)))
+                " (%d-%d))." % (tstep, firstStep, lastStep))
         return recordNum        
 
+    def _getSortedColumn(self, headerName):
+        """If the values of the given header never decrease from one record
+        to the next, as is normal for the Timestep and Time headers,
+        return them (see :meth:`getValuesArray`). Otherwise, e.g. for
+        Timesteps in a run restarted from an earlier step, returns None.
+        The result is saved until new records are read."""
+        if not self.populated: self.populateFromFile()
+        try:
+            return self._sortedCols[headerName]
+        except KeyError:
+            pass
+        colVals = self.getValuesArray(headerName)
+        if self.columnar:
+            isSorted = bool((colVals[1:] >= colVals[:-1]).all())
+        else:
+            # Python's sort is linear time for already sorted lists.
+            isSorted = (colVals == sorted(colVals))
+        if not isSorted: colVals = None
+        self._sortedCols[headerName] = colVals
+        return colVals
+
+    def _getRecordValue(self, recordNum, headerName):
+        if self.columnar:
+            return self.recordsArray[headerName][recordNum].item()
+        return self.records[recordNum][self.getColNum(headerName)]
+
+    def getRecordNumClosestTo(self, headerName, targVal):
+        """Gets the number of the record where the value of the property
+        given by `headerName` is closest to `targVal`. If several are equally
+        close, the first is returned.
+
+        If the values of the property increase with each record (e.g.
+        Timestep and Time, unless the run was restarted), this uses a
+        binary search, so is fast even for very large files. Otherwise, all
+        the records are checked."""
+        sortedVals = self._getSortedColumn(headerName)
+        if sortedVals is None:
+            colVals = self.getValuesArray(headerName)
+            if self.columnar:
+                return int(numpy.abs(colVals - targVal).argmin())
+            return min(xrange(len(colVals)),
+                key=lambda recNum: abs(colVals[recNum] - targVal))
+        numRecords = len(sortedVals)
+        if numRecords == 0:
+            raise ValueError("Error, can't find closest value to %s, as"
+                " this Frequent output file has no records." % (targVal))
+        recordNum = bisect.bisect_left(sortedVals, targVal)
+        if recordNum == numRecords:
+            recordNum -= 1
+        elif recordNum > 0 and (targVal - sortedVals[recordNum-1]) \
+                <= (sortedVals[recordNum] - targVal):
+            recordNum -= 1
+        # In case of repeated values, return the first.
+        return bisect.bisect_left(sortedVals, sortedVals[recordNum])
+
+    def getValueAtSimTime(self, headerName, simTime):
+        """Gets the value of the property given by `headerName` at
+        simulation time `simTime`, linearly interpolating between the records
+        either side of it if necessary. Useful e.g. for comparing runs with
+        different timestep sizes.
+
+        Raises a ValueError if `simTime` is outside the range of times in the
+        file, or if the Time values don't increase with each record (e.g.
+        the run was restarted from an earlier time)."""
+        times = self._getSortedColumn('Time')
+        if times is None:
+            raise ValueError("Error, can't get value of '%s' at sim time %s,"
+                " since the sim times in this Frequent output file don't"
+                " always increase (perhaps it's from a restarted run)."
+                % (headerName, simTime))
+        if len(times) == 0 or simTime < times[0] or simTime > times[-1]:
+            raise ValueError("Error, sim time at which to get value, %s,"
+                " is outside the range of times in this Frequent output"
+                " file." % (simTime))
+        self.getColNum(headerName)
+        recordNum = bisect.bisect_left(times, simTime)
+        if times[recordNum] == simTime:
+            return self._getRecordValue(recordNum, headerName)
+        t0, t1 = float(times[recordNum-1]), float(times[recordNum])
+        val0 = self._getRecordValue(recordNum-1, headerName)
+        val1 = self._getRecordValue(recordNum, headerName)
+        return val0 + (val1 - val0) * (simTime - t0) / (t1 - t0)
+
     def getRecordAtStep(self, tstep):
         """Gets the record (in raw form, see getAllRecords) at a given
-        timestep, and returns."""
-        if not self.populated: self.populateFromFile()
-        assert self.records
+        timestep, and returns.
+
+        In lazy mode, if the data cache hasn't been populated, just the
+        relevant line is read from the file."""
+        self._prepareForLookup()
         recordNum = self.getRecordNum(tstep)
+        if not self.populated:
+            self.file.seek(self.recordOffsets[recordNum])
+            return self._parseRecordLine(self.file.readline())
+        if self.columnar:
+            return list(self.recordsArray[recordNum].item())
+        assert self.records
         record = self.records[recordNum]
         return record
 
@@ -242,36 +670,67 @@ class FreqOutput:
         """Returns an array of all values over time for the property defined by
         "headerName" in the associated FrequentOutput file.
 
-        .. note::
+        In columnar mode, this is a numpy array view of the column in
+        :attr:`recordsArray`, not a copy.
 
-           the "range" parameter is not yet operational and should be
-           ignored for now.
+        :keyword range: which records to return the values of. May be "all",
+          a Python slice of record numbers - e.g. slice(-100, None) for the
+          last 100 records, or slice(None, None, 10) for every 10th record -
+          or a :class:`StepRange` or :class:`TimeRange`. In columnar mode,
+          the result is still a view, except for step or time ranges in
+          files where the steps or times don't increase with each record
+          (e.g. restarted runs).
         """
         if not self.populated: self.populateFromFile()
-        # TODO: Check range input is ok. I need to find out the right way to
-        # handling unusual values for these 
-        recordsSet = self.records
         colNum = self.getColNum(headerName)
-        valArray = []
-        for record in recordsSet:
-            valArray.append(record[colNum])
-        return valArray    
+        recordNums = self._getRecordNums(range)
+        if self.columnar:
+            if recordNums is None:
+                return self.recordsArray[headerName]
+            return self.recordsArray[headerName][recordNums]
+        records = self.records
+        if recordNums is None:
+            return [record[colNum] for record in records]
+        if isinstance(recordNums, slice):
+            recordNums = xrange(*recordNums.indices(len(records)))
+        return [records[recNum][colNum] for recNum in recordNums]
 
     def getTimeStepsArray(self, range="all"):    
         """Returns an array of all timestep numbers
         that have records saved in the associated FrequentOutput file.
 
-        .. note::
-
-           the "range" parameter is not yet operational and should be
-           ignored for now.
+        :keyword range: which records to return the timesteps of, see
+          :meth:`getValuesArray`.
         """   
-        if not self.populated: self.populateFromFile()
-        # TODO: Check range input is ok. I need to find out the right way to
-        # handling unusual values for these 
-        colNum = self.getColNum('Timestep')
-        tSteps = [record[colNum] for record in self.records]
-        return tSteps
+        return self.getValuesArray(FREQ_TSTEP_HEADER, range)
+
+    def _getRecordNums(self, range):
+        """Convert the `range` argument of :meth:`getValuesArray` into the
+        record numbers to use: either None for all records, a slice, or a
+        list of record numbers."""
+        if isinstance(range, slice):
+            return range
+        if isinstance(range, StepRange):
+            sortedVals = self._getSortedColumn(range.headerName)
+            if sortedVals is not None:
+                start, stop = 0, len(sortedVals)
+                if range.first is not None:
+                    start = bisect.bisect_left(sortedVals, range.first)
+                if range.last is not None:
+                    stop = bisect.bisect_right(sortedVals, range.last)
+                return slice(start, stop, range.stride)
+            recordNums = []
+            for recNum, val in enumerate(self.getValuesArray(
+                    range.headerName)):
+                if range.first is not None and val < range.first: continue
+                if range.last is not None and val > range.last: continue
+                recordNums.append(recNum)
+            return recordNums[::range.stride]
+        if range == "all":
+            return None
+        raise TypeError("Error, range argument %s not valid, should be"
+            " \"all\", a slice, or a StepRange or TimeRange."
+            % (repr(range)))
 
     def getMin(self, headerName):
         '''get the Minimum of the records for a given header, including
@@ -293,6 +752,8 @@ class FreqOutput:
            directly using stats functions/libraries.'''
         if not self.populated: self.populateFromFile()
         valArray = self.getValuesArray(headerName)
+        if self.columnar:
+            return float(valArray.mean())
         return sum(valArray, 0.0) / len(valArray)
 
     def getClosest(self, headerName, targVal):
@@ -320,13 +781,25 @@ class FreqOutput:
         .. note:: This has been written to allow both standard Python
            'reduction ops' like `max()` and `min()`, and also more complex
            operators defined in this module, or by the user.
+
+        .. note:: In columnar mode, the reduction ops defined in this module
+           are replaced by vectorised equivalents. Other ops are passed the
+           list of records, as usual.
         '''
         if not self.populated: self.populateFromFile()
-        if len(self.records) == 0: return None, None
+        if self.columnar and reduceFunc in _columnarReductionOps:
+            if len(self.recordsArray) == 0: return None, None
+            colVals = self.getValuesArray(headerName)
+            recordNum = _columnarReductionOps[reduceFunc](colVals,
+                stgFreq=self, **kwargs)
+            return colVals[recordNum].item(), \
+                self.recordsArray[FREQ_TSTEP_HEADER][recordNum].item()
+        records = self.getAllRecords()
+        if len(records) == 0: return None, None
         colNum = self.getColNum(headerName)
         tStepColNum = self.getColNum('Timestep')
         # Note passing in a couple of specific keywords first - see docstring
-        retRecord = reduceFunc(self.records,
+        retRecord = reduceFunc(records,
             key=operator.itemgetter(colNum), stgFreq=self, **kwargs)
         return retRecord[colNum], retRecord[tStepColNum]
 
@@ -334,12 +807,13 @@ class FreqOutput:
         '''Utility function for doing comparison operations on the records
         list, e.g. the max or minimum - where cmpFunc is a single operator'''
         if not self.populated: self.populateFromFile()
-        if len(self.records) == 0: return None, None
+        records = self.getAllRecords()
+        if len(records) == 0: return None, None
         colNum = self.getColNum(headerName)
         tStepColNum = self.getColNum('Timestep')
-        firstRec = self.records[0]
+        firstRec = records[0]
         retVal, retStep = firstRec[colNum], firstRec[tStepColNum]
-        for record in self.records:
+        for record in records:
             if cmpFunc(record[colNum], retVal):
                 retVal, retStep = record[colNum], record[tStepColNum]
         return retVal, retStep
@@ -386,6 +860,33 @@ class FreqOutput:
         if show: plt.show()
         return plt
 
+class StepRange:
+    """A range of timesteps to get the values at, for use as the `range`
+    argument of :meth:`FreqOutput.getValuesArray`.
+
+    Includes the records for all timesteps from `first` to `last`, inclusive
+    (either may be None, meaning the first or last record in the file).
+    If `stride` is given, only every `stride`'th of these records is
+    included.
+    """
+    headerName = FREQ_TSTEP_HEADER
+
+    def __init__(self, first=None, last=None, stride=None):
+        self.first = first
+        self.last = last
+        self.stride = stride
+
+    def __repr__(self):
+        return "%s(%r, %r, %r)" % (self.__class__.__name__, self.first,
+            self.last, self.stride)
+
+class TimeRange(StepRange):
+    """A range of simulation times to get the values at, for use as the
+    `range` argument of :meth:`FreqOutput.getValuesArray`.
+
+    As for :class:`StepRange`, but `first` and `last` are sim times."""
+    headerName = 'Time'
+
 def maxOp(inList, key, stgFreq):
     return max(inList, key=key)
 
@@ -410,6 +911,9 @@ def closestToStep(inList, key, stgFreq, targStep):
 
     :keyword target: the target timestep."""
     assert stgFreq != None
+    if inList is stgFreq.records:
+        # Let the FreqOutput use a binary search if possible.
+        return inList[stgFreq.getRecordNumClosestTo('Timestep', targStep)]
     return closestToVal(inList, key, stgFreq, targVal=targStep,
         targObsName='Timestep')
     
@@ -419,6 +923,9 @@ def closestToSimTime(inList, key, stgFreq, targTime):
 
     :keyword target: the target simulation time."""
     assert stgFreq != None
+    if inList is stgFreq.records:
+        # Let the FreqOutput use a binary search if possible.
+        return inList[stgFreq.getRecordNumClosestTo('Time', targTime)]
     return closestToVal(inList, key, stgFreq, targVal=targTime,
         targObsName='Time')
 
@@ -438,7 +945,7 @@ def closestToVal(inList, key, stgFreq, targVal, targObsName=None):
     closestVal = key(inList[0])
     closestRec = inList[0]
     diff = abs(closestVal - targVal)
-    if len(inList) == 1: return closestVal
+    if len(inList) == 1: return closestRec
     for listEntry in inList[1:]:
         eVal = key(listEntry)
         newDiff = abs(eVal - targVal)
@@ -447,3 +954,24 @@ def closestToVal(inList, key, stgFreq, targVal, targObsName=None):
             closestVal = eVal
             closestRec = listEntry
     return closestRec
+
+# Vectorised equivalents of the reduction ops above, used by
+# FreqOutput.getReductionOp() in columnar mode. Each is passed the numpy
+# array of the column being reduced, and returns the chosen record number.
+
+def _closestToValIndex(colVals, stgFreq, targVal, targObsName=None):
+    if targObsName != None:
+        colVals = stgFreq.getValuesArray(targObsName)
+    return int(numpy.abs(colVals - targVal).argmin())
+
+_columnarReductionOps = {
+    maxOp: lambda colVals, stgFreq: int(colVals.argmax()),
+    minOp: lambda colVals, stgFreq: int(colVals.argmin()),
+    firstOp: lambda colVals, stgFreq: 0,
+    lastOp: lambda colVals, stgFreq: len(colVals) - 1,
+    closestToVal: _closestToValIndex,
+    closestToStep: lambda colVals, stgFreq, targStep:
+        stgFreq.getRecordNumClosestTo(FREQ_TSTEP_HEADER, targStep),
+    closestToSimTime: lambda colVals, stgFreq, targTime:
+        stgFreq.getRecordNumClosestTo('Time', targTime),
+    }
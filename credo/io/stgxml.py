@@ -33,7 +33,16 @@ representative of an element in an open Stg XML document.
 import os
 import shlex
 import subprocess as subp
+import tempfile
+import weakref
+import hashlib
+from cStringIO import StringIO
 from xml.etree import ElementTree as etree
+try:
+    # Faster, where available, for streaming through large files.
+    from xml.etree.cElementTree import iterparse as _iterparse
+except ImportError:
+    _iterparse = etree.iterparse
 import credo
 
 STG_ROOT_TAG = 'StGermainData'
@@ -58,6 +67,31 @@ _stgSpecialLists = {
     STG_STRUCT_TAG:_stgSpecialStructTags,
     STG_LIST_TAG:_stgSpecialListTags,
     STG_PARAM_TAG:_stgSpecialParamTags }
+# The tags as they appear in parsed-in docs, for quick lookups.
+_STG_ELEMENT_TAG_NS = _STG_NS_LXML+STG_ELEMENT_TAG
+_stgBaseTagTypesNS = dict([(_STG_NS_LXML+tag, tag) for tag in
+    _stgElementBaseTags])
+_stgSpecialTagTypesNS = {}
+for _eltType, _specialTags in _stgSpecialLists.iteritems():
+    for _specialTag in _specialTags:
+        _stgSpecialTagTypesNS[_STG_NS_LXML+_specialTag] = \
+            (_specialTag, _eltType)
+#: Names of the available serializers used by :func:`writeXMLDoc`.
+#: "stream" pretty-prints in a single pass without modifying the doc, and
+#: "etree" indents the doc in place using :func:`indentForPrettyPrint`
+#: then uses ElementTree's writer. More can be added using
+#: :func:`registerXMLSerializer`.
+XML_SERIALIZERS = ['stream', 'etree']
+#: The serializer used by default by :func:`writeXMLDoc`.
+DEFAULT_XML_SERIALIZER = 'stream'
+#: Max number of compiled strSpecs to keep, see :func:`compileStrSpec`.
+STRSPEC_CACHE_MAX = 10000
+#: Names of the available backends for flattening XML model files: either
+#: in Python (see :mod:`credo.io.stgflatten`), or using StGermain's
+#: FlattenXML tool.
+FLATTEN_BACKENDS = ['python', 'FlattenXML']
+#: The flatten backend used by default.
+DEFAULT_FLATTEN_BACKEND = 'python'
 
 ############
 # Utility functions
@@ -94,79 +128,132 @@ def removeNsPrefix(tagName):
         return tagName[len(_STG_NS_LXML):]
 
 ###################
-# Key function for navigating a hierarchy when strSpec is given in StGermain
+# Key functions for navigating a hierarchy when strSpec is given in StGermain
 # command-line style
 
-def navigateStrSpecHierarchy(currNode, strSpec, insertMode=False):
-    """Navigate a document, based on a remaining StGermain command-line style
-    element specification.
-    Returns currNode, nodeName of the final entry in the hierarchy"""
-    # Parse the string, checking if it specifies to recurse into a sub-struct or
-    # list.
-
-    if strSpec == "":
-        raise ValueError("Can't operate on an empty strSpec string")
-
-    structSepPrefix, structSep, structRem = strSpec.partition(".")
-    listSepPrefix, listSep, listFirstRem = structSepPrefix.partition("[")
-
-    # The list is handled slightly different to structs: since list items are
-    # un-named, an immediate list spec (eg [5]) with no prefix means we're done.
-    if listSep == '[':
-        # Check and handle the list separator first, since the code above
-        # made sure that this must occur before any structSeps
-
-        # First re-do the partition, to get all remainder
-        listStartName, listStartSep, listStartRem = strSpec.partition('[')
-        listContents, listEndSep, listEndRem = listStartRem.partition(']')
-        if listEndSep != ']':
-            raise ValueError("Navigating section \"%s\" specified: badly"\
-                " formed list found, not closed correctly with '%s'."
-                % (strSpec, "]") )
-    
-        listNode = _getListNodeAtCurrent(currNode, listStartName, strSpec)
-        if listNode == None:
-            # TODO - insert mode
-            raise ValueError("Navigating section \"%s\" specified: list"\
-                " \"%s\" doesn't exist at this level of XML file."\
-                % (strSpec, listStartName) )
-
-        if listEndRem == "":
-            # We are done, because there's only one list spec at current context
-            # remaining in the string
-            return listNode, listStartSep+listStartRem
-        else:
-            # Navigate into the list contents
-            listItemNode = _getListItemFromStrSpec(listNode,
-                '['+listContents+']')
-
-            # Check the remaining contents appropriate
-            if listEndRem[0] == '.':
-                # Consume the . for a dictionary at next section
-                listEndRem = listEndRem[1:]
-            elif listEndRem[0] != '[':
+# Types of steps in a compiled strSpec path
+_NAME_STEP = "name"
+_INDEX_STEP = "index"
+# Compiled strSpecs, keyed by the strSpec string.
+_strSpecCache = {}
+
+class StrSpecPath:
+    """A StGermain command-line style element specification (e.g.
+    "plugins[0].Context"), parsed once so that it can be quickly used to
+    navigate many XML docs. Generally created using :func:`compileStrSpec`,
+    and can be passed to :func:`getNodeFromStrSpec` and
+    :func:`navigateStrSpecHierarchy` instead of a string.
+
+    .. attribute:: strSpec
+
+       The original string specification.
+
+    .. attribute:: steps
+
+       List of the steps to navigate the spec, each a tuple of
+       (stepType, elType, key): either a named element (key is the name,
+       elType the type it must be, or None if any type), or an index into
+       a list (key is the index, or None if the spec ended in "[]").
+
+    .. attribute:: lastSpecStr
+
+       String specification of the last step, i.e. the name or list index
+       of the element, at the level found by navigating all other steps.
+    """
+
+    def __init__(self, strSpec):
+        self.strSpec = strSpec
+        self.steps = []
+        self._parse()
+
+    def _parse(self):
+        strSpec = self.strSpec
+        if strSpec == "":
+            raise ValueError("Can't operate on an empty strSpec string")
+        segments = strSpec.split(".")
+        for segNum, segment in enumerate(segments):
+            name, sep, rem = segment.partition("[")
+            if name != "":
+                if sep == "[":
+                    elType = STG_LIST_TAG
+                elif segNum < len(segments)-1:
+                    elType = STG_STRUCT_TAG
+                else:
+                    elType = None
+                self.steps.append((_NAME_STEP, elType, name))
+                self.lastSpecStr = name
+            elif sep != "[":
+                raise ValueError("Navigating section \"%s\" specified:"\
+                    " empty element name found." % (strSpec))
+            # The list index specs (there may be several, for nested lists)
+            while sep == "[":
+                listContents, listEndSep, rem = rem.partition("]")
+                if listEndSep != "]":
+                    raise ValueError("Navigating section \"%s\" specified:"\
+                        " badly formed list found, not closed correctly"\
+                        " with '%s'." % (strSpec, "]"))
+                self.steps.append((_INDEX_STEP, None,
+                    _getListIndex(listContents)))
+                self.lastSpecStr = "[%s]" % listContents
+                if rem != "" and rem[0] != "[":
+                    raise ValueError("Navigating section \"%s\" specified:"\
+                        " List not followed by either a '%s' or '%s', error."\
+                        % (strSpec, '[', '.'))
+                sep, rem = rem[:1], rem[1:]
+        for stepType, elType, key in self.steps[:-1]:
+            if stepType == _INDEX_STEP and key is None:
                 raise ValueError("Navigating section \"%s\" specified:"\
-                    " List not followed by either a '%s' or '%s', error."\
-                    % (strSpec, '[', '.'))
-
-            #recurse again on the remainder, since there's stuff left to handle
-            return navigateStrSpecHierarchy(listItemNode, listEndRem)
-    elif structSep == '.':
-        structName = structSepPrefix
-        # There is no list separator, but a struct to recurse into.
-        structNode = getStructNode(currNode, structName)
-        if structNode == None:
-            if insertMode:
-                structNode = insertStructNode(currNode, structName)
+                    " list index must be given for lists that aren't the"\
+                    " last element." % (strSpec))
+
+    def __repr__(self):
+        return "StrSpecPath(%r)" % (self.strSpec)
+
+def compileStrSpec(strSpec):
+    """Returns a :class:`StrSpecPath` for the given StGermain command-line
+    style element specification (which may also already be a
+    :class:`StrSpecPath`). Compiled specs are saved, so this is cheap to call
+    repeatedly with the same strSpec."""
+    if isinstance(strSpec, StrSpecPath): return strSpec
+    try:
+        return _strSpecCache[strSpec]
+    except KeyError:
+        pass
+    specPath = StrSpecPath(strSpec)
+    if len(_strSpecCache) >= STRSPEC_CACHE_MAX:
+        _strSpecCache.clear()
+    _strSpecCache[strSpec] = specPath
+    return specPath
+
+def _navigateSteps(currNode, specPath, steps, insertMode=False):
+    """Navigate from currNode through the given steps of a
+    :class:`StrSpecPath`, returning the node found."""
+    for stepType, elType, key in steps:
+        if stepType == _INDEX_STEP:
+            currNode = _getListItem(currNode, key, specPath.strSpec)
+            continue
+        nextNode = _lookupNamedNode(currNode, key, elType)
+        if nextNode is None:
+            if insertMode and elType == STG_STRUCT_TAG:
+                nextNode = insertNamedElementNode(currNode, key,
+                    STG_STRUCT_TAG)
             else:
-                raise ValueError("Navigating section \"%s\" specified: struct"\
+                raise ValueError("Navigating section \"%s\" specified: %s"\
                     " \"%s\" doesn't exist at this level of XML file."\
-                    % (strSpec, structName) )
-        # Recursively process the rest of the specification
-        return navigateStrSpecHierarchy(structNode, structRem)
-    else:
-        # We are at the correct hierarchy level - just return.
-        return currNode, strSpec
+                    % (specPath.strSpec, elType or "element", key))
+        currNode = nextNode
+    return currNode
+
+def navigateStrSpecHierarchy(currNode, strSpec, insertMode=False):
+    """Navigate a document, based on a remaining StGermain command-line style
+    element specification (either a string, or a :class:`StrSpecPath`).
+    If insertMode is True, any structs that don't exist along the way are
+    created.
+    Returns currNode, nodeName of the final entry in the hierarchy"""
+    specPath = compileStrSpec(strSpec)
+    resultNode = _navigateSteps(currNode, specPath, specPath.steps[:-1],
+        insertMode)
+    return resultNode, specPath.lastSpecStr
 
 
 def getItemFromStrSpec_CurrentCtx(currCtxNode, nodeSpecStr):
@@ -200,16 +287,24 @@ def _getListItemFromStrSpec(currListNode, listItemStr):
             " closed." % (listItemStr, listEndRem))
 
     listIndex = _getListIndex(listContents)
+    return _getListItem(currListNode, listIndex, listItemStr)
+
+def _getListItem(currListNode, listIndex, strSpec):
+    """Returns the listIndex-th item of the given list node."""
+    if getElementType(currListNode) != STG_LIST_TAG:
+        raise ValueError("Navigating section \"%s\" specified: implies"\
+            " current section is a list, but is actually a %s element."\
+            % (strSpec, getElementType(currListNode)))
     # TODO - modify later for insertion
-    assert listIndex != None
+    if listIndex is None:
+        raise ValueError("Navigating section \"%s\" specified: no list"\
+            " index given." % (strSpec))
     if not listIndex < len(currListNode):
         raise ValueError("Parsing listItemStr '%s', asked for list index %d,"\
             " but list has only %d items"\
-            % (listItemStr, listIndex, len(currListNode)))
-        
+            % (strSpec, listIndex, len(currListNode)))
     # (Using the etree concise format here)
-    listItemNode = currListNode[listIndex]
-    return listItemNode
+    return currListNode[listIndex]
 
 def _getListIndex(listIndexStr):
     if listIndexStr == "":
@@ -226,22 +321,27 @@ def _getListIndex(listIndexStr):
 
 def getNodeFromStrSpec(parentNode, strSpec):
     """From a given specification of a node in a StGermain model file (eg
-    plugins[0].Context), return the element to operate on."""
+    plugins[0].Context), return the element to operate on.
+    The strSpec can be either a string, or a :class:`StrSpecPath` (faster
+    if using the same spec many times)."""
+    specPath = compileStrSpec(strSpec)
+    resultNode = _navigateSteps(parentNode, specPath, specPath.steps[:-1])
 
-    resultNode, lastSpecStr = navigateStrSpecHierarchy(parentNode, strSpec)
-
-    # We just need to return the element with the remaining spec string at the
+    # We just need to return the element with the remaining spec at the
     # current context
     # Remember it could be either a name (at a struct level), or an index (at a
     # list level).
     # It can also be of any any element type:-
     # thus if the calling function expects a param, list or
     # dict specifically, will need to check for that.
-    elementNode = getItemFromStrSpec_CurrentCtx(resultNode, lastSpecStr)
-    if elementNode == None:
+    stepType, elType, key = specPath.steps[-1]
+    if stepType == _INDEX_STEP:
+        return _getListItem(resultNode, key, specPath.strSpec)
+    elementNode = _lookupNamedNode(resultNode, key)
+    if elementNode is None:
         raise ValueError("Navigating str spec \"%s\": last element"\
             " \"%s\" doesn't exist at correct level of XML file."\
-            % (strSpec, lastSpecStr) )
+            % (specPath.strSpec, key) )
     return elementNode 
 
 def getElementType(elementNode):
@@ -288,22 +388,6 @@ def getElementType(elementNode):
         raise ValueError("Given node with tag '%s' is not a StGermainData"
             " element of known type." % (elementNode.tag))
 
-def _getListNodeAtCurrent(currNode, listName, strSpec):
-    """Get the list named at the current XML level. Note that if the list name
-    is '', then assumes current level is a list"""
-    if listName == "":
-        # This case is allowed - suppose we are in a recursive loop, dealing
-        # with a list entry within a list - then there would be no prefix,
-        # so just check we're already within a list
-        listNode = currNode
-        if STG_LIST_TAG != getElementType(listNode):
-            raise ValueError("Navigating section \"%s\" specified: implies"\
-                    " current section is a list, but is actually a %s element."\
-                    % (strSpec, getElementType(listNode)))
-    else:
-        listNode = getListNode(currNode, listName)
-    return listNode
-
 def getParamValue(elNode, paramName, castFunc):
     """Gets the value of a parameter from a StGermain XML model file that's a
     child of the given elNode, with the given paramName.
@@ -330,72 +414,25 @@ def strToBool(boolStr):
         raise ValueError("String given, '%s', doesn't convert to a Boolean"\
             " using StGermain idiom." % (boolStr))
 
-def _getSpecialTagNode(elNode, eltName, eltType):
-    '''Checks to see if the current elNode has a child element with special tag
-    equal to given eltName'''
-
-    try:
-        specialTagsList = _stgSpecialLists[eltType]
-    except KeyError:
-        raise ValueError("The eltType argument must be one of %s" \
-            % _stgSpecialLists.keys())
-
-    for specialTag in specialTagsList: 
-        if eltName == specialTag:
-            for childNode in elNode.getchildren():
-                if childNode.tag == addNsPrefix(specialTag):
-                    return childNode
-    return None
-
 def getParamNode(elNode, paramName):
     """Returns the element node (in etree form) of a particular Param parameter
     that's a child of the given elNode with given paramName.
     If a node with the given name not found, returns none."""
     # The default schema for written files (eg flattened files) is to use
     # "element" and set a type attribute, rather than "param" directly.
-    eltNode = _getNamedElementNode_elTag(elNode, paramName, elType=STG_PARAM_TAG)
-    if eltNode is not None: return eltNode
-    for paramNode in elNode.getchildren():
-        if paramNode.tag != addNsPrefix('param'): continue
-        if paramNode.attrib['name'] == paramName:
-            return paramNode
-
-    specialNode = _getSpecialTagNode(elNode, paramName, STG_PARAM_TAG)
-    if specialNode is not None: return specialNode
-
-    return None
+    return _lookupNamedNode(elNode, paramName, STG_PARAM_TAG)
 
 def getStructNode(elNode, structName):
     """Returns the element node (in etree form) of a particular struct element
     that's a child of the given elNode with given structName.
     If a node with the given name not found, returns none."""
-    eltNode = _getNamedElementNode_elTag(elNode, structName, elType=STG_STRUCT_TAG)
-    if eltNode is not None: return eltNode
-    for structNode in elNode.getchildren():
-        if structNode.tag != addNsPrefix('struct'): continue
-        if structNode.attrib['name'] == structName:
-            return structNode
-
-    specialNode = _getSpecialTagNode(elNode, structName, STG_STRUCT_TAG)
-    if specialNode is not None: return specialNode
-
-    return None
+    return _lookupNamedNode(elNode, structName, STG_STRUCT_TAG)
 
 def getListNode(elNode, listName):
     """Returns the element node (in etree form) of a particular list element
     that's a child of the given elNode with given listName.
     If a node with the given name not found, returns none."""
-    eltNode = _getNamedElementNode_elTag(elNode, listName, elType=STG_LIST_TAG)
-    if eltNode is not None: return eltNode
-    for listNode in elNode.getchildren():
-        if listNode.tag != addNsPrefix('list'): continue
-        if listNode.attrib['name'] == listName:
-            return listNode
-
-    specialNode = _getSpecialTagNode(elNode, listName, STG_LIST_TAG)
-    if specialNode is not None: return specialNode
-
-    return None
+    return _lookupNamedNode(elNode, listName, STG_LIST_TAG)
 
 def _getNamedElementNode(ctxNode, elName, elType=None):
     """Returns the element node (in etree form) of a particular element
@@ -406,41 +443,233 @@ def _getNamedElementNode(ctxNode, elName, elType=None):
     Searches in both the element tag format (used by output files), and
     the param, list, struct format - and also for 'special' model elements such
     as plugins, imports and components."""
-    eltNode = _getNamedElementNode_elTag(ctxNode, elName)
-    if eltNode is not None: return eltNode
-    # now check for the 'special' element tags
-    for eltNode in ctxNode.getchildren():
-        # in this case, e.g. the list with asked for name 'import' will have
+    return _lookupNamedNode(ctxNode, elName, elType)
+
+##################
+# Indexes of the named children of nodes, so named elements can be found
+# without searching through all children each time.
+
+# Categories of named child element, and the order they are searched in
+# for typed and untyped lookups (matches the original search order of
+# getParamNode etc. and _getNamedElementNode).
+_ELEMENT_TAG_CAT = 0
+_BASE_TAG_CAT = 1
+_SPECIAL_TAG_CAT = 2
+_typedLookupRank = {_ELEMENT_TAG_CAT:0, _BASE_TAG_CAT:1, _SPECIAL_TAG_CAT:2}
+_untypedLookupRank = {_ELEMENT_TAG_CAT:0, _SPECIAL_TAG_CAT:1, _BASE_TAG_CAT:2}
+# Indexes, keyed by node, of (numChildren, lastChild, index) - so the index
+# is rebuilt if children are added or removed.
+_nameIndexes = weakref.WeakKeyDictionary()
+
+def _nameIndexEntry(eltNode):
+    """Returns the name, category and element type to index the given child
+    element by, or None if it can't be looked up by name."""
+    tag = eltNode.tag
+    if tag == _STG_ELEMENT_TAG_NS:
+        return eltNode.get('name'), _ELEMENT_TAG_CAT, eltNode.get('type')
+    elif tag in _stgBaseTagTypesNS:
+        return eltNode.get('name'), _BASE_TAG_CAT, _stgBaseTagTypesNS[tag]
+    elif tag in _stgSpecialTagTypesNS:
+        # in this case, e.g. the list with name 'import' will have
         # tag 'import'
-        if eltNode.tag == addNsPrefix(elName):
-            if eltNode.tag in map(addNsPrefix, _stgSpecialParamTags):
-                return eltNode
-            if eltNode.tag in map(addNsPrefix, _stgSpecialListTags):
-                return eltNode
-            elif eltNode.tag in map(addNsPrefix, _stgSpecialStructTags):
-                return eltNode
-    # now check the old param, list, struct format
-    for eltNode in ctxNode.getchildren():
-        if eltNode.tag in map(addNsPrefix, _stgElementBaseTags):
-            if elName == eltNode.attrib['name']:
-                return eltNode
-    return None        
-
-def _getNamedElementNode_elTag(elNode, elName, elType=None):
-    """Returns the element node (in etree form) of a particular element
-    that's a child of the given elNode with given elName.
-    If a node with the given name not found, returns none.
-    If elType is specified, will only return nodes of the given type.
-    (Not designed to be used directly, but by getList etc.)
-    Searches in the element tag format."""
-    
-    for eltNode in elNode.getchildren():
-        if eltNode.tag != addNsPrefix('element'): continue
-        if eltNode.attrib['name'] == elName:
-            if elType == None or eltNode.attrib['type'] == elType:
-                return eltNode
+        elName, elType = _stgSpecialTagTypesNS[tag]
+        return elName, _SPECIAL_TAG_CAT, elType
     return None
 
+def _buildNameIndex(ctxNode):
+    """Returns a dict mapping each child element name of ctxNode to a
+    list of (category, elType, node, childIndex) of the children with that
+    name, in doc order."""
+    index = {}
+    for childI, eltNode in enumerate(ctxNode):
+        entry = _nameIndexEntry(eltNode)
+        # Un-named elements, eg list items, can't be looked up by name.
+        if entry is None or entry[0] is None: continue
+        elName, category, elType = entry
+        index.setdefault(elName, []).append((category, elType, eltNode,
+            childI))
+    return index
+
+def _lastChild(ctxNode):
+    if len(ctxNode) == 0: return None
+    return ctxNode[-1]
+
+def _getNameIndex(ctxNode):
+    """Returns the (lazily built) name index of the given node's children,
+    see :func:`_buildNameIndex`."""
+    try:
+        numChildren, lastChild, index = _nameIndexes[ctxNode]
+        if numChildren == len(ctxNode) and lastChild is _lastChild(ctxNode):
+            return index
+    except KeyError:
+        pass
+    except TypeError:
+        # Node type that can't be weakly referenced: don't save the index.
+        return _buildNameIndex(ctxNode)
+    index = _buildNameIndex(ctxNode)
+    _nameIndexes[ctxNode] = (len(ctxNode), _lastChild(ctxNode), index)
+    return index
+
+def _isValidIndexEntry(ctxNode, elName, entry):
+    """Checks a name index entry still describes a child of ctxNode."""
+    category, elType, eltNode, childI = entry
+    return childI < len(ctxNode) and ctxNode[childI] is eltNode \
+        and _nameIndexEntry(eltNode) == (elName, category, elType)
+
+def invalidateNameIndex(ctxNode=None):
+    """Discard the saved index of named children of the given node, or of
+    all nodes if ctxNode is None. Indexes are rebuilt when children are
+    added to or removed from a node (including by the functions in this
+    module), or a child found with the index turns out to have been renamed
+    or moved - but this needs to be called if a child is renamed, or
+    replaced in the middle of the node's children, so that it can be found
+    by its new name."""
+    if ctxNode is None:
+        _nameIndexes.clear()
+    else:
+        try:
+            del _nameIndexes[ctxNode]
+        except (KeyError, TypeError):
+            pass
+
+def _lookupNamedNode(ctxNode, elName, elType=None):
+    """Returns the child of ctxNode with the given elName (and elType, if not
+    None) using the node's name index, or None if there isn't one."""
+    entries = _getNameIndex(ctxNode).get(elName)
+    if entries is None: return None
+    for entry in entries:
+        if not _isValidIndexEntry(ctxNode, elName, entry):
+            # Out of date: re-build it.
+            invalidateNameIndex(ctxNode)
+            entries = _getNameIndex(ctxNode).get(elName)
+            if entries is None: return None
+            break
+    if elType is None:
+        lookupRank = _untypedLookupRank
+    else:
+        lookupRank = _typedLookupRank
+    bestRank, bestNode = None, None
+    for category, entType, eltNode, childI in entries:
+        if elType is not None and entType != elType: continue
+        rank = lookupRank[category]
+        if bestRank is None or rank < bestRank:
+            bestRank, bestNode = rank, eltNode
+    return bestNode
+
+##################
+# Streaming extraction of selected elements from XML files, without parsing
+# in the whole doc.
+
+def extractFromStgXMLFile(xmlFilename, strSpecs):
+    """Extract the elements given by a list of StGermain command-line style
+    specifications (strings, or :class:`StrSpecPath`) from a StGermain XML
+    file, e.g. a flattened model file, without parsing in the whole doc.
+
+    The file is streamed through, stopping as soon as all the elements have
+    been found, and parsed elements that aren't needed are discarded as
+    they are passed - so memory use is small even for large files.
+
+    Unlike :func:`getNodeFromStrSpec`, the types of elements along the path
+    aren't checked, and if several elements match a spec the first one in
+    the file is returned.
+
+    :returns: a dict mapping each given strSpec to its element (in etree
+      form, including all its children), or None if it wasn't found."""
+    wantedPaths = {}
+    for strSpec in strSpecs:
+        specPath = compileStrSpec(strSpec)
+        keyPath = tuple([key for stepType, elType, key in specPath.steps])
+        if None in keyPath:
+            raise ValueError("Spec \"%s\" given to extract doesn't specify"\
+                " a single element." % (specPath.strSpec))
+        wantedPaths.setdefault(keyPath, []).append(strSpec)
+    # Only elements along the way to wanted ones need to be looked at.
+    parentPaths = {}
+    for keyPath in wantedPaths:
+        for ii in range(len(keyPath)):
+            parentPaths[keyPath[:ii]] = True
+    extracted = dict([(strSpec, None) for strSpec in strSpecs])
+    numLeft = len(wantedPaths)
+    if numLeft == 0: return extracted
+
+    xmlFile = open(xmlFilename, 'rb')
+    try:
+        # Stack of [keyPath, node, numChildren] of the currently open
+        # elements. keyPath is None if the element isn't of interest.
+        openElts = []
+        # Depth of the wanted element being read in, if any - nothing inside
+        # this is discarded.
+        keepDepth = None
+        for event, eltNode in _iterparse(xmlFile,
+                events=("start", "end")):
+            if event == "start":
+                if not openElts:
+                    keyPath = ()
+                else:
+                    parentInfo = openElts[-1]
+                    keyPath = None
+                    if parentInfo[0] in parentPaths:
+                        key = _getStreamedEltKey(parentInfo[1], eltNode,
+                            parentInfo[2])
+                        if key is not None:
+                            keyPath = parentInfo[0] + (key,)
+                    parentInfo[2] += 1
+                if keyPath in wantedPaths and keepDepth is None \
+                        and extracted[wantedPaths[keyPath][0]] is None:
+                    keepDepth = len(openElts)
+                openElts.append([keyPath, eltNode, 0])
+                continue
+
+            keyPath = openElts.pop()[0]
+            if keyPath in wantedPaths \
+                    and extracted[wantedPaths[keyPath][0]] is None:
+                for strSpec in wantedPaths[keyPath]:
+                    extracted[strSpec] = eltNode
+                numLeft -= 1
+                if numLeft == 0: break
+            if keepDepth == len(openElts):
+                keepDepth = None
+            if keepDepth is None and openElts:
+                # Discard this, and any already-passed siblings.
+                del openElts[-1][1][:]
+    finally:
+        xmlFile.close()
+    return extracted
+
+def _getStreamedEltKey(parentNode, eltNode, childIndex):
+    """Returns the name of the given eltNode in the parent, or the index if
+    the parent is a list (or None if it isn't a StGermain element)."""
+    try:
+        if getElementType(parentNode) == STG_LIST_TAG:
+            return childIndex
+    except ValueError:
+        return None
+    tag = eltNode.tag
+    if tag == _STG_ELEMENT_TAG_NS or tag in _stgBaseTagTypesNS:
+        return eltNode.get('name')
+    elif tag in _stgSpecialTagTypesNS:
+        return _stgSpecialTagTypesNS[tag][0]
+    return None
+
+def getParamValuesFromStgXMLFile(xmlFilename, paramCasts):
+    """Gets the values of a set of parameters from a StGermain XML file,
+    using :func:`extractFromStgXMLFile` (so the file isn't all parsed in).
+
+    :param paramCasts: dict mapping the strSpec of each parameter to the
+      castFunc to convert its value with (see :func:`getParamValue`).
+    :returns: dict mapping each strSpec to its value, or None if not found
+      (or not a param)."""
+    paramNodes = extractFromStgXMLFile(xmlFilename, paramCasts.keys())
+    paramVals = {}
+    for strSpec, castFunc in paramCasts.iteritems():
+        paramElt = paramNodes[strSpec]
+        if paramElt is not None and \
+                getElementType(paramElt) == STG_PARAM_TAG:
+            paramVals[strSpec] = castFunc(paramElt.text.strip())
+        else:
+            paramVals[strSpec] = None
+    return paramVals
+
 #############################
 # For manipulating/updating an existing XML doc, using the eTree package
 
@@ -466,16 +695,19 @@ def setMergeType(xmlNode, mergeType):
                 % (mergeType, STG_MERGE_TYPES))
         xmlNode.attrib[STG_MERGE_ATTRIB] = mergeType
 
-# TODO: really needed??
 def insertNamedElementNode(parentNode, elementName, createType):
+    """Insert a new element of type createType (e.g. "struct"), named
+    elementName, as a child of parentNode, and return it."""
     elementNode = etree.SubElement(parentNode, createType, name=elementName)
-    setMergeType(paramEl, "replace")
+    invalidateNameIndex(parentNode)
+    setMergeType(elementNode, "replace")
     return elementNode
 
 def writeParam(parentNode, paramName, paramVal, mt=None):
     """Writes a particular parameter, with name of paramName, val of paramVal,
     to the open XML file at position specified by parentNode."""
     paramEl = etree.SubElement(parentNode, STG_PARAM_TAG, name=paramName)
+    invalidateNameIndex(parentNode)
     setMergeType(paramEl, mt)
     paramEl.text = str(paramVal)
     return paramEl
@@ -489,6 +721,7 @@ def writeParamSet(parentNode, paramsDict, mt=None):
 def writeParamList(parentNode, listName, paramVals, mt=None):
     '''Write a Stg XML List structure, made up purely of (unnamed) parameters'''
     listElt = etree.SubElement(parentNode, STG_LIST_TAG, name=listName) 
+    invalidateNameIndex(parentNode)
     setMergeType(listElt, mt)
     for paramVal in paramVals:
         pElt = etree.SubElement(listElt, STG_PARAM_TAG)
@@ -501,6 +734,7 @@ def writeMergeComponent(rootNode, compName, compType):
     assert rootNode.tag == STG_ROOT_TAG
     compList = etree.SubElement(rootNode, STG_STRUCT_TAG, name="components",\
         mergeType="merge") 
+    invalidateNameIndex(rootNode)
     compElt = etree.SubElement(compList, STG_STRUCT_TAG, name=compName)
     writeParam(compElt, "Type", compType)
     return compElt
@@ -528,13 +762,166 @@ def writeValueUsingStrSpec(rootNode, strSpec, value):
 ############################################
 # For actual file I/O
 
-def writeXMLDoc(xmlDoc, outFile, prettyPrint=True):
-    """Necessary because the xml.etree doesn't include a pretty_print
-    functionality by default (unlike lxml)"""
+def writeXMLDoc(xmlDoc, outFile, prettyPrint=True, serializer=None):
+    """Write the given xmlDoc (in xml.etree format) to the open file outFile,
+    optionally pretty-printed (since the xml.etree doesn't include a
+    pretty_print functionality by default, unlike lxml).
+
+    :keyword serializer: which of the :data:`XML_SERIALIZERS` to use. If None,
+      uses :data:`DEFAULT_XML_SERIALIZER`."""
+    if serializer is None: serializer = DEFAULT_XML_SERIALIZER
+    try:
+        serializerFunc = _xmlSerializers[serializer]
+    except KeyError:
+        raise ValueError("Error, XML serializer '%s' not one of the"
+            " available serializers %s." % (serializer, XML_SERIALIZERS))
+    serializerFunc(xmlDoc, outFile, prettyPrint)
+
+def registerXMLSerializer(name, serializerFunc):
+    """Add a new serializer that can be used by :func:`writeXMLDoc`.
+    serializerFunc must take arguments (xmlDoc, outFile, prettyPrint)."""
+    _xmlSerializers[name] = serializerFunc
+    if name not in XML_SERIALIZERS: XML_SERIALIZERS.append(name)
+
+def _writeXMLDoc_etree(xmlDoc, outFile, prettyPrint=True):
+    """Serializer that indents the doc itself, then uses ElementTree's
+    writer."""
     if prettyPrint:
         indentForPrettyPrint(xmlDoc.getroot())
     xmlDoc.write(outFile)
 
+def _writeXMLDoc_stream(xmlDoc, outFile, prettyPrint=True):
+    """Serializer that pretty-prints the doc in a single pass, without
+    modifying it. The output is the same as the "etree" serializer, except
+    that namespaces are declared on the first element that uses them,
+    rather than the root."""
+    if not prettyPrint:
+        xmlDoc.write(outFile)
+        return
+    rootNode = xmlDoc.getroot()
+    outParts = []
+    _streamXMLElement(outParts.append, rootNode, 0, rootNode.tail,
+        dict(_fixedNSPrefixes))
+    outFile.write("".join(outParts))
+
+# Namespaces that don't need to be declared.
+_fixedNSPrefixes = {"http://www.w3.org/XML/1998/namespace":"xml"}
+
+def _streamXMLElement(write, elem, level, tail, nsPrefixes):
+    """Write elem, and its children, as pretty-printed XML using the write
+    function. The indenting follows :func:`indentForPrettyPrint`."""
+    tag = elem.tag
+    if tag is etree.Comment:
+        write("<!--%s-->" % _encodeXMLText(elem.text))
+    elif tag is etree.ProcessingInstruction:
+        write("<?%s?>" % _encodeXMLText(elem.text))
+    else:
+        nsDecls = []
+        qname, nsPrefixes = _qualifyXMLName(tag, nsPrefixes, nsDecls)
+        attribStrs = []
+        for key, value in sorted(elem.items()):
+            key, nsPrefixes = _qualifyXMLName(key, nsPrefixes, nsDecls)
+            attribStrs.append(' %s="%s"' % (key, _escapeXMLAttrib(value)))
+        write("<" + qname)
+        for prefix, uri in nsDecls:
+            write(' xmlns:%s="%s"' % (prefix, _escapeXMLAttrib(uri)))
+        write("".join(attribStrs))
+        text = elem.text
+        if len(elem):
+            indent = "\n" + level*"  "
+            if not text or not text.strip():
+                text = indent + "  "
+            write(">" + _escapeXMLCData(text))
+            lastIndex = len(elem) - 1
+            for childIndex, childNode in enumerate(elem):
+                childTail = childNode.tail
+                if not childTail or not childTail.strip():
+                    if childIndex == lastIndex:
+                        childTail = indent
+                    else:
+                        childTail = indent + "  "
+                _streamXMLElement(write, childNode, level+1, childTail,
+                    nsPrefixes)
+            write("</%s>" % qname)
+        elif text:
+            write(">%s</%s>" % (_escapeXMLCData(text), qname))
+        else:
+            write(" />")
+    if tail:
+        write(_escapeXMLCData(tail))
+
+def _qualifyXMLName(name, nsPrefixes, nsDecls):
+    """Convert an xml.etree "{uri}local" name to "prefix:local" form,
+    adding to nsDecls if the namespace needs declaring. Returns the name and
+    the (possibly updated) nsPrefixes dict."""
+    if name[:1] != "{": return name, nsPrefixes
+    uri, localName = name[1:].split("}", 1)
+    try:
+        prefix = nsPrefixes[uri]
+    except KeyError:
+        prefix = "ns%d" % (len(nsPrefixes) - len(_fixedNSPrefixes))
+        nsPrefixes = nsPrefixes.copy()
+        nsPrefixes[uri] = prefix
+        nsDecls.append((prefix, uri))
+    return "%s:%s" % (prefix, localName), nsPrefixes
+
+def _encodeXMLText(text):
+    if isinstance(text, unicode):
+        return text.encode("us-ascii", "xmlcharrefreplace")
+    return text
+
+def _escapeXMLCData(text):
+    if "&" in text: text = text.replace("&", "&amp;")
+    if "<" in text: text = text.replace("<", "&lt;")
+    if ">" in text: text = text.replace(">", "&gt;")
+    return _encodeXMLText(text)
+
+def _escapeXMLAttrib(text):
+    text = _escapeXMLCData(text)
+    if "\"" in text: text = text.replace("\"", "&quot;")
+    if "\n" in text: text = text.replace("\n", "&#10;")
+    return text
+
+_xmlSerializers = {
+    'stream':_writeXMLDoc_stream,
+    'etree':_writeXMLDoc_etree}
+
+def isFileUnchangedSince(filename, prevStamp):
+    """Returns True if prevStamp, as returned by :func:`writeXMLDocToFile`,
+    records writing to the given file, and the file hasn't changed since
+    (by its modification time and size)."""
+    if prevStamp is None or prevStamp[0] != os.path.abspath(filename):
+        return False
+    try:
+        fileStat = os.stat(prevStamp[0])
+    except OSError:
+        return False
+    return prevStamp[2:] == (fileStat.st_mtime, fileStat.st_size)
+
+def writeXMLDocToFile(xmlDoc, filename, prettyPrint=True, prevStamp=None):
+    """Write xmlDoc to the file given by filename - unless prevStamp, as
+    returned by a previous call, shows that the same contents have already
+    been written to the file, and it hasn't changed since. Useful for records
+    that may be re-written many times without changing.
+
+    :returns: a stamp recording the file contents written, to pass to later
+      calls."""
+    outBuffer = StringIO()
+    writeXMLDoc(xmlDoc, outBuffer, prettyPrint)
+    contents = outBuffer.getvalue()
+    fullPath = os.path.abspath(filename)
+    contentsHash = hashlib.sha1(contents).hexdigest()
+    if prevStamp is not None and prevStamp[1] == contentsHash \
+            and isFileUnchangedSince(fullPath, prevStamp):
+        return prevStamp
+    outFile = open(fullPath, 'w')
+    try:
+        outFile.write(contents)
+    finally:
+        outFile.close()
+    fileStat = os.stat(fullPath)
+    return (fullPath, contentsHash, fileStat.st_mtime, fileStat.st_size)
+
 def writeStgDataDocToFile(xmlDoc, filename):
     """Write a given StGermain xmlDoc to the file given by filename"""
     outFile = open(filename, 'w')
@@ -542,12 +929,63 @@ def writeStgDataDocToFile(xmlDoc, filename):
     outFile.close()
 
 def createFlattenedXML(inputFiles, cmdLineOverrides="",
-        flatFilename="output.xml"):
+        flatFilename="output.xml", backend=None):
     '''Flatten a list of provided XML files and optionally also
-    cmdLineOverrides (string), using the StGermain FlattenXML tool.
-    
+    cmdLineOverrides (string), and write to file.
+
+    :keyword backend: which of the :data:`FLATTEN_BACKENDS` to use. If None,
+      uses :data:`DEFAULT_FLATTEN_BACKEND`.
     :returns: the file name of the newly created flattened file.'''
+    if backend is None: backend = DEFAULT_FLATTEN_BACKEND
+    _checkFlattenBackend(backend)
+    if backend == 'FlattenXML':
+        return _createFlattenedXML_FlattenXML(inputFiles, cmdLineOverrides,
+            flatFilename)
+    from credo.io import stgflatten
+    xmlDoc = stgflatten.flattenStgXML(inputFiles, cmdLineOverrides,
+        nsTags=False)
+    outFile = open(flatFilename, 'w')
+    writeXMLDoc(xmlDoc, outFile, prettyPrint=False)
+    outFile.close()
+    return flatFilename
 
+def getFlattenedXMLDoc(inputFiles, cmdLineOverrides="", backend=None,
+        useCache=True):
+    '''Flatten a list of provided XML files and optionally also
+    cmdLineOverrides (string), and return the result as an ElementTree XML
+    doc, as if parsed in from a flattened file. Unlike
+    :func:`createFlattenedXML`, by default no files are written.
+
+    :keyword backend: which of the :data:`FLATTEN_BACKENDS` to use. If None,
+      uses :data:`DEFAULT_FLATTEN_BACKEND`.
+    :keyword useCache: if True, and using the python backend, the doc is
+      got from the :data:`credo.io.stgflatten.flattenCache` if possible.
+      In this case the doc may be shared, so shouldn't be modified.'''
+    if backend is None: backend = DEFAULT_FLATTEN_BACKEND
+    _checkFlattenBackend(backend)
+    if backend == 'FlattenXML':
+        fd, flatFilename = tempfile.mkstemp(suffix=".xml")
+        os.close(fd)
+        try:
+            _createFlattenedXML_FlattenXML(inputFiles, cmdLineOverrides,
+                flatFilename)
+            xmlDoc = etree.parse(flatFilename)
+        finally:
+            os.remove(flatFilename)
+        return xmlDoc
+    from credo.io import stgflatten
+    if useCache:
+        return stgflatten.flattenCache.getXMLDoc(inputFiles, cmdLineOverrides)
+    return stgflatten.flattenStgXML(inputFiles, cmdLineOverrides)
+
+def _checkFlattenBackend(backend):
+    if backend not in FLATTEN_BACKENDS:
+        raise ValueError("Error, flatten backend '%s' not one of the"
+            " available backends %s." % (backend, FLATTEN_BACKENDS))
+
+def _createFlattenedXML_FlattenXML(inputFiles, cmdLineOverrides,
+        flatFilename):
+    '''Flatten using the StGermain FlattenXML tool.'''
     flattenExe = credo.io.stgpath.getVerifyStgExePath('FlattenXML')
     outFileArg = "-output_file=%s" % (flatFilename)
 
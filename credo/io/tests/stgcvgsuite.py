@@ -54,6 +54,33 @@ class StgCVGTestCase(unittest.TestCase):
             './sampleData/Analytic2-analysis.cvg')
         self.assertEqual(cvgInfo['VelocityField'].dofColMap, {0:1})
 
+    def test_genConvergenceFileIndex_cached(self):
+        cvgFilename = os.path.join(self.basedir, "Analytic-analysis.cvg")
+        shutil.copy("./sampleData/Analytic2-analysis.cvg", cvgFilename)
+        cvgInfo = stgcvg.genConvergenceFileIndex(self.basedir)
+        self.assertEqual(cvgInfo.keys(), ['VelocityField'])
+        cvgInfo2 = stgcvg.genConvergenceFileIndex(self.basedir)
+        self.assertEqual(cvgInfo2, cvgInfo)
+        self.assertTrue(cvgInfo2['VelocityField'] is cvgInfo['VelocityField'])
+        # Adding and changing files should update the index.
+        shutil.copy("./sampleData/CosineHillRotate-analysis.cvg",
+            self.basedir)
+        cvgInfo3 = stgcvg.genConvergenceFileIndex(self.basedir)
+        self.assertEqual(len(cvgInfo3), 2)
+        cvgFile = open(cvgFilename, "w")
+        cvgFile.write("#Res PressureField1\n1.000000e-01 0.1\n")
+        cvgFile.close()
+        cvgInfo4 = stgcvg.genConvergenceFileIndex(self.basedir)
+        self.assertEqual(sorted(cvgInfo4.keys()),
+            ['PressureField', 'TemperatureField'])
+        stgcvg.invalidateConvergenceFileIndex(self.basedir)
+        cvgInfo5 = stgcvg.genConvergenceFileIndex(self.basedir)
+        self.assertEqual(sorted(cvgInfo5.keys()),
+            ['PressureField', 'TemperatureField'])
+        self.assertFalse(cvgInfo5['PressureField'] is
+            cvgInfo4['PressureField'])
+        stgcvg.invalidateConvergenceFileIndex()
+
     def test_getCheckStepsRange(self):
         cvgFile = open("./sampleData/CosineHillRotate-analysis.cvg","r")
         range = stgcvg.getCheckStepsRange(cvgFile,'all')
@@ -127,6 +154,86 @@ class StgCVGTestCase(unittest.TestCase):
         self.assertEqual(dofErrorArray[1][0], 0.00614)
         self.assertEqual(dofErrorArray[1][1], 0.054)
 
+    def test_CvgFile(self):
+        cvgFile = stgcvg.CvgFile("./sampleData/CosineHillRotate-analysis.cvg")
+        self.assertEqual(cvgFile.headers,
+            ['Res', 'TemperatureField1', 'TemperatureField2'])
+        self.assertEqual(len(cvgFile), 3)
+        self.assertEqual(list(cvgFile[-1]), [0.1, 0.00612235812, 0.053])
+        self.assertEqual([list(vals) for vals in cvgFile[0:2]],
+            [[0.1, 0.00616, 0.055], [0.1, 0.00614, 0.054]])
+        self.assertEqual(cvgFile.getRes(), [0.1, 0.1, 0.1])
+        self.assertEqual(cvgFile.getRes('last'), 0.1)
+        self.assertEqual(cvgFile.getDofErrors_ByDof({0:1,1:2}, (1,3)),
+            [[0.00614, 0.00612235812], [0.054, 0.053]])
+        self.assertEqual(cvgFile.getDofErrors_ByStep({0:1,1:2}, (1,3)),
+            [[0.00614, 0.054], [0.00612235812, 0.053]])
+        self.assertRaises(ValueError, cvgFile.getRes, (0,4))
+        self.assertRaises(stgcvg.CVGReadError, cvgFile.getColumn, 3)
+
+    def test_CvgFile_incompleteLines(self):
+        cvgFilename = os.path.join(self.basedir, "Broken-analysis.cvg")
+        cvgFile = open(cvgFilename, "w")
+        cvgFile.write("#Res TemperatureField1 TemperatureField2\n")
+        cvgFile.write("1.000000e-01 6.16e-03 5.5e-2\n")
+        cvgFile.write("#Res TemperatureField1 TemperatureField2\n")
+        cvgFile.write("1.000000e-01 6.14e-03\n")
+        cvgFile.close()
+        cvgFile = stgcvg.CvgFile(cvgFilename)
+        self.assertEqual(len(cvgFile), 2)
+        self.assertEqual(cvgFile.getColumn(1), [0.00616, 0.00614])
+        self.assertEqual(cvgFile.getColumn(2, (0,1)), [0.055])
+        self.assertRaises(stgcvg.CVGReadError, cvgFile.getColumn, 2)
+        cvgFileInfo = CvgFileInfo(cvgFilename)
+        cvgFileInfo.dofColMap={0:1,1:2}
+        self.assertRaises(stgcvg.CVGReadError, stgcvg.getDofErrors_ByDof,
+            cvgFileInfo, 'last')
+
+    def test_getLastLineValues(self):
+        self.assertEqual(stgcvg._getLastLineValues(
+            "./sampleData/CosineHillRotate-analysis.cvg"),
+            [0.1, 0.00612235812, 0.053])
+        # Check over several blocks, with trailing header and blank lines
+        cvgFilename = os.path.join(self.basedir, "Long-analysis.cvg")
+        cvgFile = open(cvgFilename, "w")
+        for step in range(2000):
+            cvgFile.write("#Res TemperatureField1\n")
+            cvgFile.write("1.000000e-01 %d\n" % step)
+        cvgFile.write("#Res TemperatureField1\n\n")
+        cvgFile.close()
+        self.assertEqual(stgcvg._getLastLineValues(cvgFilename), [0.1, 1999])
+        cvgFile = open(cvgFilename, "w")
+        cvgFile.write("#Res TemperatureField1\n")
+        cvgFile.close()
+        self.assertRaises(stgcvg.CVGReadError, stgcvg._getLastLineValues,
+            cvgFilename)
+
+    def test_cvgFileCache(self):
+        cache = stgcvg.cvgFileCache
+        cvgFilenames = ["./sampleData/CosineHillRotate-analysis.cvg",
+            "./sampleData/Analytic2-analysis.cvg"]
+        maxFileSize = max([os.path.getsize(fname) for fname in cvgFilenames])
+        cache.clear()
+        cache.setMaxBytes(maxFileSize)
+        try:
+            cvgFile = stgcvg.getCvgFile(cvgFilenames[0])
+            self.assertTrue(stgcvg.getCvgFile(cvgFilenames[0]) is cvgFile)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            # Only room for one file at a time
+            stgcvg.getCvgFile(cvgFilenames[1])
+            self.assertEqual((len(cache), cache.evictions), (1, 1))
+            self.assertTrue(cache.currBytes <= cache.maxBytes)
+            self.assertFalse(stgcvg.getCvgFile(cvgFilenames[0]) is cvgFile)
+            self.assertEqual((cache.hits, cache.misses), (1, 3))
+            self.assertEqual(stgcvg._getLineValues(cvgFilenames[0], 1),
+                [0.1, 0.00614, 0.054])
+            self.assertEqual(cache.hits, 2)
+            self.assertRaises(IOError, stgcvg._getLineValues,
+                cvgFilenames[0], 3)
+        finally:
+            cache.clear()
+            cache.setMaxBytes(stgcvg.CVG_CACHE_MAX_BYTES)
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(StgCVGTestCase, 'test'))
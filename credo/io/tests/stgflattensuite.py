@@ -0,0 +1,253 @@
+##  Copyright (C), 2010, Monash University
+##  Copyright (C), 2010, Victorian Partnership for Advanced Computing (VPAC)
+##
+##  This file is part of the CREDO library.
+##  Developed as part of the Simulation, Analysis, Modelling program of
+##  AuScope Limited, and funded by the Australian Federal Government's
+##  National Collaborative Research Infrastructure Strategy (NCRIS) program.
+##
+##  This library is free software; you can redistribute it and/or
+##  modify it under the terms of the GNU Lesser General Public
+##  License as published by the Free Software Foundation; either
+##  version 2.1 of the License, or (at your option) any later version.
+##
+##  This library is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##  Lesser General Public License for more details.
+##
+##  You should have received a copy of the GNU Lesser General Public
+##  License along with this library; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+##  MA  02110-1301  USA
+
+import os
+import tempfile
+import time
+import unittest
+import shutil
+
+from credo.io import stgxml
+from credo.io import stgflatten
+from xml.etree import ElementTree as etree
+
+_baseXML = """<?xml version="1.0"?>
+<StGermainData xmlns="http://www.vpac.org/StGermain/XML_IO_Handler/Jun2003">
+  <!-- A comment -->
+  <list name="import"><param>StgFEM</param></list>
+  <list name="plugins">
+    <struct><param name="Type">PluginA</param></struct>
+  </list>
+  <struct name="components" mergeType="merge">
+    <struct name="context"><param name="Type">FiniteElementContext</param>
+    </struct>
+  </struct>
+  <param name="dim"> 2 </param>
+  <include>inc/extra.xml</include>
+  <struct name="velocityICs">
+    <param name="type">CompositeVC</param>
+    <list name="vcList">
+      <struct><param name="type">AllNodesVC</param></struct>
+    </list>
+  </struct>
+</StGermainData>
+"""
+
+_extraXML = """<?xml version="1.0"?>
+<StGermainData xmlns="http://www.vpac.org/StGermain/XML_IO_Handler/Jun2003">
+  <list name="import"><param>StgFEM</param><param>StgDomain</param></list>
+  <struct name="components" mergeType="merge">
+    <struct name="mesh"><param name="Type">FeMesh</param></struct>
+  </struct>
+  <param name="dim">3</param>
+</StGermainData>
+"""
+
+_modelXML = """<?xml version="1.0"?>
+<StGermainData xmlns="http://www.vpac.org/StGermain/XML_IO_Handler/Jun2003">
+  <list name="plugins" mergeType="merge">
+    <struct><param name="Type">PluginB</param></struct>
+  </list>
+  <param name="maxTimeSteps">10</param>
+  <param name="maxTimeSteps" mergeType="append">20</param>
+  <struct name="velocityICs">
+    <param name="type">Replaced</param>
+  </struct>
+  <struct name="components" mergeType="merge">
+    <struct name="context" mergeType="merge">
+      <param name="extra">1</param>
+    </struct>
+  </struct>
+</StGermainData>
+"""
+
+def _treeAsTuple(node):
+    """Convert an XML tree to nested tuples, for comparison."""
+    text = (node.text or "").strip()
+    return (node.tag, sorted(node.attrib.items()), text,
+        [_treeAsTuple(child) for child in node])
+
+class StgFlattenTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = os.path.realpath(tempfile.mkdtemp())
+        os.makedirs(os.path.join(self.basedir, "inc"))
+        for fname, contents in [("base.xml", _baseXML),
+                (os.path.join("inc", "extra.xml"), _extraXML),
+                ("model.xml", _modelXML)]:
+            xmlFile = open(os.path.join(self.basedir, fname), "w")
+            xmlFile.write(contents)
+            xmlFile.close()
+        self.inputFiles = [os.path.join(self.basedir, fname) for fname in
+            ("base.xml", "model.xml")]
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_flattenStgXML(self):
+        xmlDoc = stgflatten.flattenStgXML(self.inputFiles)
+        root = xmlDoc.getroot()
+        self.assertEqual(root.tag, stgxml.addNsPrefix(stgxml.STG_ROOT_TAG))
+        # Special entries written first, in FlattenXML format.
+        self.assertEqual([node.tag for node in root[:3]],
+            map(stgxml.addNsPrefix, ['import', 'plugins', 'components']))
+        self.assertEqual([node.text for node in root[0]],
+            ['StgFEM', 'StgDomain'])
+        # Included file replaced 'dim'
+        self.assertEqual(stgxml.getParamValue(root, "dim", int), 3)
+        self.assertEqual(stgxml.getParamNode(root, "dim").text, "3")
+        # Plugins list merged
+        self.assertEqual(len(stgxml.getListNode(root, "plugins")), 2)
+        self.assertEqual(stgxml.getNodeFromStrSpec(root,
+            "plugins[1].Type").text, "PluginB")
+        # Components struct merged, recursively
+        compsNode = stgxml.getStructNode(root, "components")
+        self.assertEqual([node.attrib['name'] for node in compsNode],
+            ['context', 'mesh'])
+        self.assertEqual(stgxml.getNodeFromStrSpec(root,
+            "components.context.Type").text, "FiniteElementContext")
+        self.assertEqual(stgxml.getNodeFromStrSpec(root,
+            "components.context.extra").text, "1")
+        # Appended param
+        maxStepsNodes = [node for node in root
+            if node.get('name') == 'maxTimeSteps']
+        self.assertEqual([node.text for node in maxStepsNodes], ['10', '20'])
+        # Replaced struct
+        velICsNode = stgxml.getStructNode(root, "velocityICs")
+        self.assertEqual(len(velICsNode), 1)
+        self.assertEqual(stgxml.getParamValue(velICsNode, "type", str),
+            "Replaced")
+
+    def test_cmdLineOverrides(self):
+        overrides = "--dim=2 --components.context.Type=Other" \
+            " --pluginData.appendToAnalysisFile=true -options_file foo.opt" \
+            " --plugins[1].Context=context --plugins[2].Type=PluginC" \
+            " --newList[0]=5"
+        xmlDoc = stgflatten.flattenStgXML(self.inputFiles, overrides)
+        root = xmlDoc.getroot()
+        self.assertEqual(stgxml.getParamValue(root, "dim", int), 2)
+        getText = lambda strSpec: stgxml.getNodeFromStrSpec(root,
+            strSpec).text
+        self.assertEqual(getText("components.context.Type"), "Other")
+        self.assertEqual(getText("pluginData.appendToAnalysisFile"), "true")
+        self.assertEqual(getText("plugins[1].Context"), "context")
+        self.assertEqual(getText("plugins[1].Type"), "PluginB")
+        self.assertEqual(getText("plugins[2].Type"), "PluginC")
+        self.assertEqual(getText("newList[0]"), "5")
+        self.assertRaises(ValueError, stgflatten.flattenStgXML,
+            self.inputFiles, "--plugins[5].Type=Bad")
+        self.assertRaises(ValueError, stgflatten.flattenStgXML,
+            self.inputFiles, "--dim.sub=1")
+        self.assertRaises(ValueError, stgflatten.flattenStgXML,
+            self.inputFiles, "--plugins[x]=1")
+
+    def test_errors(self):
+        self.assertRaises(IOError, stgflatten.flattenStgXML,
+            [os.path.join(self.basedir, "voodoo.xml")])
+        badFilename = os.path.join(self.basedir, "bad.xml")
+        badFile = open(badFilename, "w")
+        badFile.write('<StGermainData><param name="dim" mergeType="blend">'
+            '3</param></StGermainData>')
+        badFile.close()
+        self.assertRaises(ValueError, stgflatten.flattenStgXML,
+            [badFilename])
+        # Include not found
+        shutil.rmtree(os.path.join(self.basedir, "inc"))
+        self.assertRaises(IOError, stgflatten.flattenStgXML, self.inputFiles)
+
+    def test_flattenFlattened(self):
+        # Flattening an already-flattened file should give the same model.
+        flatFilename = os.path.join("sampleData", "stgXML",
+            "flattenedModel.xml")
+        xmlDoc = stgflatten.flattenStgXML([flatFilename])
+        origDoc = etree.parse(flatFilename)
+        self.assertEqual(_treeAsTuple(xmlDoc.getroot()),
+            _treeAsTuple(origDoc.getroot()))
+
+    def test_backends(self):
+        xmlDoc = stgxml.getFlattenedXMLDoc(self.inputFiles, "--dim=4")
+        self.assertEqual(stgxml.getParamValue(xmlDoc.getroot(), "dim", int), 4)
+        flatFilename = os.path.join(self.basedir, "flat.xml")
+        stgxml.createFlattenedXML(self.inputFiles, "--dim=4",
+            flatFilename=flatFilename, backend='python')
+        fileDoc = etree.parse(flatFilename)
+        self.assertEqual(_treeAsTuple(fileDoc.getroot()),
+            _treeAsTuple(xmlDoc.getroot()))
+        self.assertRaises(ValueError, stgxml.getFlattenedXMLDoc,
+            self.inputFiles, backend='voodoo')
+
+    def test_flattenCache(self):
+        cache = stgflatten.FlattenCache()
+        xmlDoc = cache.getXMLDoc(self.inputFiles, "--dim=4")
+        self.assertEqual(stgxml.getParamValue(xmlDoc.getroot(), "dim", int), 4)
+        self.assertTrue(cache.getXMLDoc(self.inputFiles, "--dim=4") is xmlDoc)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # Different overrides
+        xmlDoc2 = cache.getXMLDoc(self.inputFiles, "--dim=5")
+        self.assertEqual(stgxml.getParamValue(xmlDoc2.getroot(), "dim", int),
+            5)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        # Changing an included file should cause a re-flatten.
+        extraFile = open(os.path.join(self.basedir, "inc", "extra.xml"), "w")
+        extraFile.write(_extraXML.replace("FeMesh", "OtherMesh"))
+        extraFile.close()
+        xmlDoc3 = cache.getXMLDoc(self.inputFiles, "--dim=4")
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertEqual(stgxml.getNodeFromStrSpec(xmlDoc3.getroot(),
+            "components.mesh.Type").text, "OtherMesh")
+        # .. replacing the out-of-date entry.
+        self.assertEqual(cache.stats()['entries'], 2)
+        # File hashes are kept per file (not per version of a file), up to
+        # the max number given.
+        numFiles = cache.stats()['fileHashes']
+        for ii in range(3):
+            time.sleep(0.01)
+            extraFile = open(os.path.join(self.basedir, "inc", "extra.xml"),
+                "w")
+            extraFile.write(_extraXML.replace("FeMesh", "Mesh%d" % ii))
+            extraFile.close()
+            cache.getXMLDoc(self.inputFiles, "--dim=4")
+        self.assertEqual(cache.stats()['fileHashes'], numFiles)
+        smallCache = stgflatten.FlattenCache(maxFileHashes=1)
+        smallCache.getXMLDoc(self.inputFiles)
+        self.assertEqual(smallCache.stats()['fileHashes'], 1)
+        # Stored on disk, to share with other processes.
+        diskPath = os.path.join(self.basedir, "flatCache")
+        cache = stgflatten.FlattenCache(diskPath=diskPath)
+        xmlDoc4 = cache.getXMLDoc(self.inputFiles, "--dim=4")
+        cache2 = stgflatten.FlattenCache(diskPath=diskPath)
+        xmlDoc5 = cache2.getXMLDoc(self.inputFiles, "--dim=4")
+        self.assertEqual((cache2.diskHits, cache2.misses), (1, 0))
+        self.assertEqual(_treeAsTuple(xmlDoc5.getroot()),
+            _treeAsTuple(xmlDoc4.getroot()))
+        self.assertTrue(cache2.getXMLDoc(self.inputFiles, "--dim=4")
+            is xmlDoc5)
+        self.assertEqual(cache2.hits, 1)
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(StgFlattenTestCase, 'test'))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
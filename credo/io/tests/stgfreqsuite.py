@@ -21,6 +21,7 @@
 ##  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 ##  MA  02110-1301  USA
 
+import cPickle as pickle
 import os
 import shutil
 import tempfile
@@ -74,6 +75,32 @@ class StgFreqTestCase(unittest.TestCase):
     def test_finalStep(self):
         self.assertEqual(self.tSteps[-1], self.stgFreq.finalStep())
     
+    def test_refresh(self):
+        freqPath = os.path.join(self.basedir, "FrequentOutput.dat")
+        freqFile = open(freqPath, "w")
+        freqFile.write("#  Timestep Time VRMS\n  3 0.0125 3\n  6 0.03")
+        freqFile.flush()
+        stgFreq = FreqOutput(self.basedir, columnar=self.stgFreq.columnar,
+            lazy=self.stgFreq.lazy)
+        # The incomplete last line shouldn't be read yet.
+        self.assertEqual(stgFreq.refresh(), 1)
+        self.assertEqual(stgFreq.finalStep(), 3)
+        self.assertEqual(stgFreq.refresh(), 0)
+        freqFile.write("75 3.2\n#  Timestep Time VRMS\n  9 0.0625 3.8\n")
+        freqFile.flush()
+        self.assertEqual(stgFreq.refresh(), 2)
+        self.assertEqual(list(stgFreq.getTimeStepsArray()), [3, 6, 9])
+        self.assertEqual(stgFreq.getRecordAtStep(6), [6, 0.0375, 3.2])
+        self.assertEqual(stgFreq.getMax('VRMS'), (3.8, 9))
+        for tstep in range(12, 60, 3):
+            freqFile.write("  %d 0.1 4.0\n" % tstep)
+            freqFile.flush()
+            self.assertEqual(stgFreq.refresh(), 1)
+        freqFile.close()
+        self.assertEqual(stgFreq.finalStep(), 57)
+        self.assertEqual(len(stgFreq.getAllRecords()), 19)
+        self.assertEqual(stgFreq.getRecordNum(57), 18)
+
     def test_getValuesArray(self):
         valArray = self.stgFreq.getValuesArray('Time')
         for ii, val in enumerate(valArray):
@@ -172,6 +199,68 @@ class StgFreqTestCase(unittest.TestCase):
                 self.assertAlmostEqual(closestVal, testList[targIndex])
                 self.assertEqual(closestStep, self.tSteps[targIndex])
 
+    def test_getValuesArray_range(self):
+        getVals = self.stgFreq.getValuesArray
+        self.assertEqual(list(getVals('VRMS', slice(-2, None))),
+            self.VRMSVals[-2:])
+        self.assertEqual(list(getVals('VRMS', slice(None, None, 2))),
+            self.VRMSVals[::2])
+        self.assertEqual(list(getVals('VRMS', stgfreq.StepRange(6, 12))),
+            self.VRMSVals[1:4])
+        self.assertEqual(list(getVals('VRMS', stgfreq.StepRange(7))),
+            self.VRMSVals[2:])
+        self.assertEqual(list(getVals('VRMS', stgfreq.StepRange(stride=3))),
+            self.VRMSVals[::3])
+        self.assertEqual(list(getVals('VRMS',
+            stgfreq.TimeRange(0.03, 0.07))), self.VRMSVals[1:3])
+        self.assertEqual(list(getVals('VRMS', stgfreq.TimeRange(1.0))), [])
+        self.assertEqual(list(self.stgFreq.getTimeStepsArray(
+            stgfreq.StepRange(last=9, stride=2))), [3, 9])
+        self.assertRaises(TypeError, getVals, 'VRMS', (0, 2))
+        # Restarted runs, where the steps don't always increase.
+        freqFile = open(os.path.join(self.basedir, "FrequentOutput.dat"), "w")
+        freqFile.write("#  Timestep Time VRMS\n")
+        freqFile.write("  3 0.0125 3\n  6 0.0375 3.2\n  9 0.0625 3.8\n")
+        freqFile.write("#  Timestep Time VRMS\n")
+        freqFile.write("  6 0.0375 3.3\n  9 0.0625 3.9\n")
+        freqFile.close()
+        stgFreq = FreqOutput(self.basedir, columnar=self.stgFreq.columnar)
+        self.assertEqual(list(stgFreq.getValuesArray('VRMS',
+            stgfreq.StepRange(6, 9))), [3.2, 3.8, 3.3, 3.9])
+
+    def test_getRecordNumClosestTo(self):
+        for targStep, recordNum in [(0, 0), (4, 0), (4.5, 0), (5, 1),
+                (15, 4), (100, 4)]:
+            self.assertEqual(self.stgFreq.getRecordNumClosestTo('Timestep',
+                targStep), recordNum)
+        self.assertEqual(self.stgFreq.getRecordNumClosestTo('Time', 0.049), 1)
+        # VRMS isn't sorted, so will be checked by a full scan.
+        self.assertEqual(self.stgFreq.getRecordNumClosestTo('VRMS', 3.7), 2)
+        # A restarted run, so steps repeat.
+        freqFile = open(os.path.join(self.basedir, "FrequentOutput.dat"), "w")
+        freqFile.write("#  Timestep Time VRMS\n")
+        freqFile.write("  3 0.0125 3\n  6 0.0375 3.2\n  9 0.0625 3.8\n")
+        freqFile.write("#  Timestep Time VRMS\n")
+        freqFile.write("  6 0.0375 3.3\n  9 0.0625 3.9\n")
+        freqFile.close()
+        stgFreq = FreqOutput(self.basedir, columnar=self.stgFreq.columnar)
+        self.assertEqual(stgFreq.getRecordNumClosestTo('Timestep', 7), 1)
+        self.assertEqual(stgFreq.getReductionOp('VRMS', stgfreq.closestToStep,
+            targStep=10), (3.8, 9))
+        self.assertRaises(ValueError, stgFreq.getValueAtSimTime, 'VRMS', 0.02)
+
+    def test_getValueAtSimTime(self):
+        self.assertAlmostEqual(self.stgFreq.getValueAtSimTime('VRMS', 0.0375),
+            3.2)
+        self.assertAlmostEqual(self.stgFreq.getValueAtSimTime('VRMS', 0.05),
+            3.5)
+        self.assertAlmostEqual(self.stgFreq.getValueAtSimTime('Timestep',
+            0.1125), 15)
+        self.assertRaises(ValueError, self.stgFreq.getValueAtSimTime,
+            'VRMS', 0.2)
+        self.assertRaises(ValueError, self.stgFreq.getValueAtSimTime,
+            'Pressure', 0.05)
+
     def test_plotOverTime(self):
         self.stgFreq.plotOverTime("Time", show=False, path="output/Plots")
         self.stgFreq.plotOverTime("VRMS", show=False, path="output/Plots")
@@ -179,9 +268,166 @@ class StgFreqTestCase(unittest.TestCase):
     def test_printAllMinMax(self):
         self.stgFreq.printAllMinMax()
 
+class StgFreqColumnarTestCase(StgFreqTestCase):
+    """Re-runs all the standard tests, using columnar storage."""
+    def setUp(self):
+        StgFreqTestCase.setUp(self)
+        self.stgFreq = FreqOutput("./sampleData", columnar=True)
+
+    def test_getTimeStepsArray(self):
+        timeStepsArray = self.stgFreq.getTimeStepsArray()
+        self.assertEqual(self.tSteps, list(timeStepsArray))
+        self.assertEqual(timeStepsArray.dtype.kind, 'i')
+
+    def test_getValuesArray_view(self):
+        valArray = self.stgFreq.getValuesArray('VRMS')
+        self.assertEqual(list(valArray), self.VRMSVals)
+        # Should be a view of the stored records, not a copy.
+        self.assertTrue(valArray.base is not None)
+        valArray[0] = 10.0
+        self.assertEqual(self.stgFreq.getValueAtStep('VRMS', self.tSteps[0]),
+            10.0)
+
+    def test_getValuesArray_rangeView(self):
+        valArray = self.stgFreq.getValuesArray('VRMS',
+            stgfreq.StepRange(6, 12, 2))
+        self.assertEqual(list(valArray), [3.2, 3.4])
+        valArray[1] = 10.0
+        self.assertEqual(self.stgFreq.getValueAtStep('VRMS', 12), 10.0)
+
+    def test_restartHeaders(self):
+        freqFile = open(os.path.join(self.basedir, "FrequentOutput.dat"), "w")
+        freqFile.write("#  Timestep Time VRMS\n")
+        freqFile.write("  3 0.0125 3\n  6 0.0375 3.2\n")
+        freqFile.write("#  Timestep Time VRMS\n")
+        freqFile.write("  9 0.0625 3.8\n")
+        freqFile.close()
+        stgFreq = FreqOutput(self.basedir, columnar=True)
+        self.assertEqual(list(stgFreq.getTimeStepsArray()), [3, 6, 9])
+        self.assertEqual(stgFreq.finalStep(), 9)
+        self.assertEqual(stgFreq.getRecordAtStep(6), [6, 0.0375, 3.2])
+
+    def test_pickle(self):
+        freqPath = os.path.join(self.basedir, "FrequentOutput.dat")
+        freqFile = open(freqPath, "w")
+        freqFile.write("#  Timestep Time VRMS\n")
+        for tstep in range(1, 1001):
+            freqFile.write("  %d 0.1 %d\n" % (tstep, tstep))
+        freqFile.flush()
+        stgFreq = FreqOutput(self.basedir, columnar=True)
+        stgFreq.refresh()
+        # Reading one more record over-allocates the buffer.
+        freqFile.write("  1001 0.1 1001\n")
+        freqFile.flush()
+        stgFreq.refresh()
+        self.assertTrue(len(stgFreq._recordsBuffer) >
+            len(stgFreq.recordsArray))
+        self.assertFalse('_recordsBuffer' in stgFreq.__getstate__())
+        # So the buffer and its slack shouldn't be sent as well.
+        pickled = pickle.dumps(stgFreq, pickle.HIGHEST_PROTOCOL)
+        self.assertTrue(len(pickled) < 1.5 * stgFreq.recordsArray.nbytes)
+        stgFreq2 = pickle.loads(pickled)
+        self.assertEqual(list(stgFreq2.getTimeStepsArray()), range(1, 1002))
+        self.assertEqual(stgFreq2.getMax('VRMS'), (1001, 1001))
+        # Should still be able to read new records after unpickling.
+        freqFile.write("  1002 0.1 1002\n")
+        freqFile.close()
+        self.assertEqual(stgFreq2.refresh(), 1)
+        self.assertEqual(stgFreq2.finalStep(), 1002)
+        self.assertEqual(stgFreq2.getRecordAtStep(1002), [1002, 0.1, 1002])
+        self.assertEqual(stgFreq.finalStep(), 1001)
+
+class StgFreqLazyTestCase(StgFreqTestCase):
+    """Re-runs all the standard tests, in lazy mode."""
+    def setUp(self):
+        StgFreqTestCase.setUp(self)
+        self.stgFreq = FreqOutput("./sampleData", lazy=True)
+
+    def test_lazyLookups(self):
+        tI = 3
+        recordDict = self.stgFreq.getRecordDictAtStep(self.tSteps[tI])
+        self.assertEqual(recordDict,
+            {'Timestep':self.tSteps[tI],'Time':self.timeVals[tI],
+              "VRMS":self.VRMSVals[tI]})
+        self.assertEqual(self.stgFreq.finalStep(), self.tSteps[-1])
+        self.assertAlmostEqual(self.stgFreq.getValueAtStep('VRMS',
+            self.tSteps[0]), self.VRMSVals[0])
+        # Shouldn't have needed to read in all the records.
+        self.assertFalse(self.stgFreq.populated)
+        self.assertEqual(self.stgFreq.records, None)
+        self.assertEqual(len(self.stgFreq.recordOffsets), len(self.tSteps))
+        self.assertRaises(ValueError, self.stgFreq.getRecordAtStep, 4)
+        # Full access should still work after lazy lookups.
+        self.assertEqual(self.stgFreq.getTimeStepsArray(), self.tSteps)
+        self.assertTrue(self.stgFreq.populated)
+
+    def test_restartHeaders(self):
+        freqFile = open(os.path.join(self.basedir, "FrequentOutput.dat"), "w")
+        freqFile.write("#  Timestep Time VRMS\n")
+        freqFile.write("  3 0.0125 3\n  6 0.0375 3.2\n")
+        freqFile.write("#  Timestep Time VRMS\n")
+        freqFile.write("  9 0.0625 3.8\n")
+        freqFile.close()
+        stgFreq = FreqOutput(self.basedir, lazy=True)
+        self.assertEqual(stgFreq.finalStep(), 9)
+        self.assertEqual(stgFreq.getRecordAtStep(9), [9, 0.0625, 3.8])
+        self.assertEqual(stgFreq.getRecordAtStep(6), [6, 0.0375, 3.2])
+        self.assertFalse(stgFreq.populated)
+
+class StgFreqCachedTestCase(StgFreqColumnarTestCase):
+    """Re-runs all the standard tests, using the binary cache."""
+    def setUp(self):
+        StgFreqTestCase.setUp(self)
+        # Use a copy of the sample data, so no cache is written there.
+        shutil.copy(os.path.join("./sampleData", "FrequentOutput.dat"),
+            self.basedir)
+        # Create the cache, so the tests run on a cached FreqOutput.
+        FreqOutput(self.basedir, useCache=True).populateFromFile()
+        self.stgFreq = FreqOutput(self.basedir, useCache=True)
+
+    def test_useCache(self):
+        cacheFilename = os.path.join(self.basedir,
+            "FrequentOutput.dat"+stgfreq.FREQ_CACHE_EXT)
+        self.assertTrue(os.path.exists(cacheFilename))
+        self.stgFreq.populateFromFile()
+        self.assertTrue(isinstance(self.stgFreq.recordsArray, stgfreq.numpy.memmap))
+        self.assertEqual(self.stgFreq.getHeaders(), ['Timestep','Time','VRMS'])
+        self.assertEqual(self.stgFreq.getMax('VRMS'), (3.8, 9))
+        # Writes to the records shouldn't change the cache.
+        self.stgFreq.getValuesArray('VRMS')[0] = 10.0
+        stgFreq2 = FreqOutput(self.basedir, useCache=True)
+        self.assertEqual(stgFreq2.getValueAtStep('VRMS', 3), 3.0)
+        # Changing the file should invalidate the cache.
+        freqFile = open(os.path.join(self.basedir, "FrequentOutput.dat"), "a")
+        freqFile.write("  18 0.1375 2.2\n")
+        freqFile.close()
+        stgFreq3 = FreqOutput(self.basedir, useCache=True)
+        self.assertEqual(stgFreq3.finalStep(), 18)
+        self.assertFalse(isinstance(stgFreq3.recordsArray, stgfreq.numpy.memmap))
+        stgFreq4 = FreqOutput(self.basedir, useCache=True)
+        self.assertEqual(stgFreq4.finalStep(), 18)
+        self.assertTrue(isinstance(stgFreq4.recordsArray, stgfreq.numpy.memmap))
+
+    def test_pickleCached(self):
+        self.stgFreq.populateFromFile()
+        self.assertTrue(isinstance(self.stgFreq.recordsArray,
+            stgfreq.numpy.memmap))
+        self.stgFreq.getValuesArray('VRMS')[0] = 10.0
+        stgFreq2 = pickle.loads(pickle.dumps(self.stgFreq,
+            pickle.HIGHEST_PROTOCOL))
+        self.assertFalse(isinstance(stgFreq2.recordsArray,
+            stgfreq.numpy.memmap))
+        self.assertEqual(list(stgFreq2.getTimeStepsArray()), self.tSteps)
+        self.assertEqual(stgFreq2.getValueAtStep('VRMS', 3), 10.0)
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(StgFreqTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(StgFreqLazyTestCase, 'test'))
+    # Columnar storage requires numpy.
+    if stgfreq.numpy is not None:
+        suite.addTest(unittest.makeSuite(StgFreqColumnarTestCase, 'test'))
+        suite.addTest(unittest.makeSuite(StgFreqCachedTestCase, 'test'))
     return suite
 
 if __name__ == '__main__':
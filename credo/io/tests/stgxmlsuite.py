@@ -316,6 +316,89 @@ class StgXMLTestCase(unittest.TestCase):
             #NB: since the components list in the first XML is un-merged, we
             #can't access this entirely.
     
+    def test_compileStrSpec(self):
+        specPath = stgxml.compileStrSpec("temperatureBCs.vcList[0].Shape")
+        self.assertTrue(stgxml.compileStrSpec(specPath) is specPath)
+        self.assertTrue(stgxml.compileStrSpec(
+            "temperatureBCs.vcList[0].Shape") is specPath)
+        self.assertEqual(specPath.lastSpecStr, "Shape")
+        self.assertEqual(len(specPath.steps), 4)
+        # The same compiled spec can be used across docs.
+        for xmlRoot in [self.flatXMLRoot, self.inXMLRoot]:
+            node = stgxml.getNodeFromStrSpec(xmlRoot, specPath)
+            self.assertEqual(node.text.strip(), "initialConditionShape")
+            ctxNode, lastSpecStr = stgxml.navigateStrSpecHierarchy(xmlRoot,
+                "velocityICs.vcList[0]")
+            self.assertEqual(stgxml.getElementType(ctxNode),
+                stgxml.STG_LIST_TAG)
+            self.assertEqual(lastSpecStr, "[0]")
+        # Badly formed specs are rejected when compiled.
+        for badSpec in ["", "..", "a.", "a[", "a[0]b", "a[x]", "a[].b"]:
+            self.assertRaises(ValueError, stgxml.compileStrSpec, badSpec)
+        # Insert mode creates structs along the way.
+        xmlDoc, root = stgxml.createNewStgDataDoc()
+        ctxNode, lastSpecStr = stgxml.navigateStrSpecHierarchy(root,
+            "a.b.c", insertMode=True)
+        self.assertEqual(ctxNode.attrib['name'], "b")
+        self.assertEqual(lastSpecStr, "c")
+
+    def test_nameIndex(self):
+        compsNode = stgxml.getStructNode(self.inXMLRoot, "components")
+        self.assertEqual(stgxml.getStructNode(compsNode, "newComp"), None)
+        # Index should be updated once the node's children change.
+        newNode = etree.SubElement(compsNode, stgxml.addNsPrefix("struct"),
+            name="newComp")
+        self.assertTrue(stgxml.getStructNode(compsNode, "newComp") is newNode)
+        self.assertEqual(stgxml.getParamNode(compsNode, "newComp"), None)
+        # Renamed or replaced children aren't returned under their old names.
+        newNode.attrib['name'] = "renamedComp"
+        self.assertEqual(stgxml.getStructNode(compsNode, "newComp"), None)
+        compsNode.remove(newNode)
+        otherNode = etree.SubElement(compsNode, stgxml.addNsPrefix("struct"),
+            name="otherComp")
+        self.assertEqual(stgxml.getStructNode(compsNode, "renamedComp"), None)
+        self.assertTrue(stgxml.getStructNode(compsNode, "otherComp")
+            is otherNode)
+        firstNode = compsNode[0]
+        compsNode.remove(firstNode)
+        compsNode.insert(0, newNode)
+        self.assertEqual(stgxml.getStructNode(compsNode,
+            firstNode.attrib['name']), None)
+        # .. but needs to be invalidated manually to find a child under a
+        # new name, if it replaced one in the middle of the node.
+        stgxml.invalidateNameIndex(compsNode)
+        self.assertTrue(stgxml.getStructNode(compsNode, "renamedComp")
+            is newNode)
+        compsNode.remove(newNode)
+        self.assertEqual(stgxml.getStructNode(compsNode, "renamedComp"), None)
+
+    def test_extractFromStgXMLFile(self):
+        strSpecs = ["dim", "velocityICs", "velocityICs.type",
+            "temperatureBCs.vcList[0].variables[0].value", "plugins[0].Type",
+            "voodoo", "velocityICs.vcList[3]"]
+        for xmlFilename in ["flattenedModel.xml", "CosineHillRotateBC.xml"]:
+            xmlFilename = os.path.join(self.dataPath, xmlFilename)
+            xmlRoot = etree.parse(xmlFilename).getroot()
+            extracted = stgxml.extractFromStgXMLFile(xmlFilename, strSpecs)
+            self.assertEqual(sorted(extracted.keys()), sorted(strSpecs))
+            for strSpec in strSpecs[:5]:
+                node = stgxml.getNodeFromStrSpec(xmlRoot, strSpec)
+                self.assertEqual(extracted[strSpec].attrib, node.attrib)
+                self.assertEqual(extracted[strSpec].text, node.text)
+            self.assertEqual(extracted["voodoo"], None)
+            self.assertEqual(extracted["velocityICs.vcList[3]"], None)
+            # Wanted elements kept complete.
+            velICsNode = extracted["velocityICs"]
+            self.assertEqual(stgxml.getNodeFromStrSpec(velICsNode,
+                "vcList[0].type").text.strip(), "AllNodesVC")
+            paramVals = stgxml.getParamValuesFromStgXMLFile(xmlFilename,
+                {"dim":int, "velocityICs":str, "maxTimeSteps":int})
+            self.assertEqual(paramVals, {"dim":2, "velocityICs":None,
+                "maxTimeSteps":stgxml.getParamValue(xmlRoot, "maxTimeSteps",
+                    int)})
+        self.assertRaises(ValueError, stgxml.extractFromStgXMLFile,
+            xmlFilename, ["velocityICs.vcList[]"])
+
     # TODO
     #def test_insertItemAtStrSpec_CurrentCtx(self):    
         #stgxml.insertItemAtStrSpec_CurrentCtx(resultNode, lastSpecStr, "2")
@@ -335,6 +418,42 @@ class StgXMLTestCase(unittest.TestCase):
         stgxml.writeStgDataDocToFile(xmlDoc, "output/testInsert.xml")
 
     # Writing things out tests
+    def test_writeXMLDoc(self):
+        root = etree.Element('StgModelRun', name="a&b", desc='say "hi"\n')
+        etree.SubElement(root, 'name').text = "Test <1>"
+        listNode = etree.SubElement(root, 'modelInputFiles')
+        for ii in range(3):
+            etree.SubElement(listNode, 'inputFile').text = "f%d.xml" % ii
+        etree.SubElement(root, 'empty')
+        mixedNode = etree.SubElement(root, 'mixed')
+        mixedNode.text = "some text"
+        etree.SubElement(mixedNode, 'child').tail = " tail"
+        root.append(etree.Comment(" comment "))
+        etree.SubElement(root, 'unicode').text = u"caf\xe9"
+        xmlDoc = etree.ElementTree(root)
+        outputs = {}
+        for serializer in stgxml.XML_SERIALIZERS:
+            outFilename = os.path.join(self.basedir, serializer+".xml")
+            outFile = open(outFilename, "w")
+            stgxml.writeXMLDoc(xmlDoc, outFile, serializer=serializer)
+            outFile.close()
+            outputs[serializer] = open(outFilename).read()
+        # Streamed output should be the same, without changing the doc
+        # (the etree serializer does, so comes last).
+        self.assertEqual(outputs['stream'], outputs['etree'])
+        self.assertTrue("\n  <name>Test &lt;1&gt;</name>" in outputs['stream'])
+        self.assertRaises(ValueError, stgxml.writeXMLDoc, xmlDoc, None,
+            serializer='voodoo')
+        # Namespaced docs.
+        outFilename = os.path.join(self.basedir, "nsDoc.xml")
+        outFile = open(outFilename, "w")
+        stgxml.writeXMLDoc(self.inXMLDoc, outFile, serializer='stream')
+        outFile.close()
+        rereadRoot = etree.parse(outFilename).getroot()
+        self.assertEqual(rereadRoot.tag, self.inXMLRoot.tag)
+        self.assertEqual(etree.tostring(rereadRoot).split(),
+            etree.tostring(self.inXMLRoot).split())
+
     def test_setMergeType(self):
         stgxml.setMergeType(self.testParamNode, 'append')
         self.assertEqual(self.testParamNode.attrib['mergeType'], 'append')
@@ -27,6 +27,7 @@ from datetime import timedelta, datetime
 from xml.etree import ElementTree as etree
 import credo.modelrun
 import credo.modelresult
+import credo.runcache
 from credo.io import stgcmdline
 from credo.io import stgpath
 
@@ -106,7 +107,10 @@ class JobMetaInfo:
         self.simtime = float(xmlNode.find('simtime').text)
         #TODO: how to convert ...
         #self.submitTime = xmlNode.find('submitTime').text
-        #TODO: platformInfo
+        piNode = xmlNode.find('platformInfo')
+        if piNode is not None:
+            for platNode in piNode:
+                self.platform[platNode.tag] = platNode.text or ""
         #TODO: profiler info
         profilersNode = xmlNode.find('performanceInfo')
         for profNode in profilersNode.findall('profilerInfo'):
@@ -193,13 +197,20 @@ class JobRunner:
             return None
 
     def submitSuite(self, modelSuite, prefixStr=None, extraCmdLineOpts=None,
-            dryRun=False, maxRunTime=None, writeRecords=True):
+            dryRun=False, maxRunTime=None, writeRecords=True, skipRuns=None):
         """Submits each modelRun in a suite to be run, and returns a list
-        of all jobMetaInfos for the submitted jobs."""
+        of all jobMetaInfos for the submitted jobs.
+        If writeRecords is True, the XML record of each ModelRun is written
+        (once, just before it's submitted).
+        Runs whose indices are in skipRuns aren't submitted (and have None
+        in the returned list)."""
         jobMetaInfos = []
         for runI, modelRun in enumerate(modelSuite.runs):
+            if skipRuns and runI in skipRuns:
+                if dryRun == False: jobMetaInfos.append(None)
+                continue
             if writeRecords == True:
-                modelSuite.writeAllModelRunXMLs()
+                modelRun.writeInfoXML()
             customOpts = modelSuite.getCustomOpts(runI, extraCmdLineOpts)
             jobMetaInfo = self.submitRun(modelRun, prefixStr, customOpts,
                 dryRun, maxRunTime)    
@@ -207,23 +218,69 @@ class JobRunner:
                 jobMetaInfos.append(jobMetaInfo)
         return jobMetaInfos
         
-    def blockSuite(self, modelSuite, jobMetaInfos):    
+    def blockSuite(self, modelSuite, jobMetaInfos, reusedResults=None,
+            writeRecords=False):
         """Blocks on each ModelRun in a Suite, given a list of
-        JobMetaInfos for each run."""
-        modelSuite.resultsList = []
-        for modelRun, jobMetaInfo in zip(modelSuite.runs, jobMetaInfos):
-            # TODO: ideally if we implemented a "testResult" func, could
-            #  loop through and poll/report as they complete,
-            #  rather than just in sequential order ...
-            result = self.blockResult(modelRun, jobMetaInfo)
+        JobMetaInfos for each run. reusedResults is an optional dict of
+        ModelResults to use for runs that weren't submitted, by run index.
+
+        Runs are finished off (see :meth:`.blockResult`), and if
+        writeRecords is True have their ModelResult's XML record written,
+        in the order they complete (see :meth:`.waitForAnyRun`). The
+        ModelResults are returned, and stored in the suite's resultsList,
+        in suite order."""
+        results = []
+        pendingRuns = []
+        for runI, jobMetaInfo in enumerate(jobMetaInfos):
+            if reusedResults and runI in reusedResults:
+                results.append(reusedResults[runI])
+            else:
+                results.append(None)
+                pendingRuns.append(runI)
+        while pendingRuns:
+            runI = self.waitForAnyRun(modelSuite, jobMetaInfos, pendingRuns)
+            pendingRuns.remove(runI)
+            modelRun = modelSuite.runs[runI]
+            result = self.blockResult(modelRun, jobMetaInfos[runI])
             print "ModelRun '%s' complete." % modelRun.name
             assert isinstance(result, credo.modelresult.ModelResult)
-            modelSuite.resultsList.append(result)
+            if writeRecords == True:
+                result.writeRecordXML()
+            results[runI] = result
+        modelSuite.resultsList = results
         return modelSuite.resultsList
+
+    def waitForAnyRun(self, modelSuite, jobMetaInfos, runIndices):
+        """Wait until at least one of the given runs of the suite (indices
+        into the suite's runs, and jobMetaInfos list) has completed, and
+        return its index - it will then be finished off with
+        :meth:`.blockResult`.
+
+        By default, just returns the first, so :meth:`.blockResult` blocks
+        on each run in order. Sub-classes that can check the status of
+        several jobs at once should override this."""
+        return runIndices[0]
     
+    def submitAndBlockSuite(self, modelSuite, prefixStr=None,
+            extraCmdLineOpts=None, dryRun=False, maxRunTime=None,
+            writeRecords=True, reusedResults=None):
+        """Submits all the runs in a suite, and blocks until they're
+        complete, returning the list of ModelResults (in suite order).
+        Runs whose indices are keys of the reusedResults dict aren't
+        submitted, the given ModelResult is used instead.
+
+        By default, uses :meth:`.submitSuite` then :meth:`.blockSuite`:
+        sub-classes may override, e.g. to control how many runs are
+        running at once."""
+        jobMetaInfos = self.submitSuite(modelSuite, prefixStr,
+            extraCmdLineOpts, dryRun, maxRunTime, writeRecords,
+            skipRuns=reusedResults)
+        return self.blockSuite(modelSuite, jobMetaInfos, reusedResults,
+            writeRecords)
+
     def runSuite(self, modelSuite, prefixStr=None, extraCmdLineOpts=None,
             dryRun=False, maxRunTime=None, runSuiteNonBlocking=None,
-            writeRecords=True):
+            writeRecords=True, reuseResults=None):
         """Run each ModelRun in the suite - with optional extra cmd line opts.
         Will also write XML records of each ModelRun and ModelResult in the 
         suite.
@@ -233,12 +290,20 @@ class JobRunner:
 
         :keyword runSuiteNonBlocking: controls whether the suite will be 
            run "non-blocking", i.e. all modelRuns submitted initially, then
-           a separate phase to block until they're all completed.
+           a separate phase to block until they're all completed (see
+           :meth:`.submitAndBlockSuite`).
 
         :keyword writeRecords: sets whether you want each ModelRun in the 
            suite, and each ModelResult generated, to automatically write
            an XML record of itself in default location as it is run/produced.
 
+        :keyword reuseResults: if True, runs that have already been run
+           successfully with exactly the same configuration (see
+           :func:`credo.runcache.getRunHash`) aren't run again - their
+           existing ModelResult records are read in instead. (Requires
+           writeRecords.) Defaults to
+           :func:`credo.runcache.reuseResultsDefault`.
+
         :returns: a reference to the :attr:`.resultsList` containing all
            the ModelResults generated."""
 
@@ -247,13 +312,27 @@ class JobRunner:
     
         if runSuiteNonBlocking is None:
             runSuiteNonBlocking = self.runSuiteNonBlockingDefault
+        if reuseResults is None:
+            reuseResults = credo.runcache.reuseResultsDefault()
+        reuseResults = reuseResults and writeRecords
 
         if runSuiteNonBlocking:
-            jobMetaInfos = self.submitSuite(modelSuite, prefixStr,
-                extraCmdLineOpts, dryRun, maxRunTime, writeRecords)
-            resultsList = self.blockSuite(modelSuite, jobMetaInfos)
-            if writeRecords == True:
-                modelSuite.writeAllModelResultXMLs()
+            runHashes, reusedResults = {}, {}
+            if reuseResults:
+                for runI, modelRun in enumerate(modelSuite.runs):
+                    runHash, result = self._checkReusableResult(modelSuite,
+                        runI, extraCmdLineOpts, dryRun)
+                    runHashes[runI] = runHash
+                    if result is not None: reusedResults[runI] = result
+            resultsList = self.submitAndBlockSuite(modelSuite, prefixStr,
+                extraCmdLineOpts, dryRun, maxRunTime, writeRecords,
+                reusedResults)
+            # Result records were written as each run completed.
+            if writeRecords == True and dryRun == False:
+                modelSuite.updateResultIndex()
+            for runI, runHash in runHashes.iteritems():
+                if runI not in reusedResults and dryRun == False:
+                    credo.runcache.saveRunHash(modelSuite.runs[runI], runHash)
             return resultsList
         else:
             modelSuite.resultsList = []
@@ -269,6 +348,12 @@ class JobRunner:
                 print "Running the Model (saving results in %s):"\
                     % (modelRun.outputPath)
 
+                if reuseResults:
+                    runHash, result = self._checkReusableResult(modelSuite,
+                        runI, extraCmdLineOpts, dryRun)
+                    if result is not None:
+                        modelSuite.resultsList.append(result)
+                        continue
                 customOpts = modelSuite.getCustomOpts(runI, extraCmdLineOpts)
                 if writeRecords == True:
                     modelRun.writeInfoXML()
@@ -279,9 +364,29 @@ class JobRunner:
                 modelSuite.resultsList.append(result)
                 if writeRecords == True:
                     result.writeRecordXML()
+                if reuseResults:
+                    credo.runcache.saveRunHash(modelRun, runHash)
+            if writeRecords == True and dryRun == False:
+                modelSuite.updateResultIndex()
 
         return modelSuite.resultsList
 
+    def _checkReusableResult(self, modelSuite, runI, extraCmdLineOpts,
+            dryRun):
+        """Returns the configuration hash of run runI of the suite, and its
+        existing ModelResult if it can be re-used (or else None)."""
+        modelRun = modelSuite.runs[runI]
+        customOpts = modelSuite.getCustomOpts(runI, extraCmdLineOpts)
+        runHash = credo.runcache.getRunHash(modelRun, customOpts)
+        result = credo.runcache.getReusableResult(modelRun, runHash)
+        if result is not None:
+            print "ModelRun '%s' already run with the same configuration,"\
+                " re-using its results." % modelRun.name
+        elif dryRun == False:
+            # Its previous results (if any) will be over-written.
+            credo.runcache.clearRunHash(modelRun)
+        return runHash, result
+
     def attachPlatformInfo(self, jobMI):    
         """Attach provenance info relevant to the platform used to run the
         job to the JobMetaInfo object."""
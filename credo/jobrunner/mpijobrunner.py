@@ -23,11 +23,12 @@
 
 import os
 import sys
-import signal
 import subprocess
 import time
 import shlex
 import operator
+import threading
+import Queue
 from xml.etree import ElementTree as etree
 from datetime import timedelta, datetime
 from credo.jobrunner.api import *
@@ -39,22 +40,92 @@ from credo.jobrunner.unixTimeCmdProfiler import UnixTimeCmdProfiler
 MPI_RUN_COMMAND = "MPI_RUN_COMMAND"
 DEFAULT_MPI_RUN_COMMAND = "mpiexec"
 
+#: Scheduling orders for :attr:`MPIJobRunner.scheduleOrder`: start runs
+#: using the most processors first ...
+SCHEDULE_LARGEST_FIRST = "largestFirst"
+#: ... or those with the shortest estimated run time first (see
+#: :func:`.estimateRunTime`).
+SCHEDULE_SHORTEST_FIRST = "shortestFirst"
+
+#: Default time (in seconds) a run that passed its maxRunTime is given to
+#: exit after being sent SIGTERM, before it's sent SIGKILL.
+DEFAULT_KILL_GRACE_PERIOD = 10
+
+def estimateRunTime(modelRun):
+    """Default estimate of the time (in seconds) a ModelRun will take, used
+    for :data:`.SCHEDULE_SHORTEST_FIRST` scheduling: the ModelRun's
+    'estRunTime' job parameter if set, otherwise its 'maxRunTime'.
+    Returns None if neither is set."""
+    estRunTime = modelRun.jobParams.get('estRunTime')
+    if estRunTime is None:
+        estRunTime = modelRun.jobParams['maxRunTime']
+    if estRunTime is not None and estRunTime <= 0:
+        estRunTime = None
+    return estRunTime
+
 class MPIJobMetaInfo(JobMetaInfo):
     def __init__(self):
         JobMetaInfo.__init__(self, 0)
         self.runType = "MPI"
         self.runCommand = None
         self.procHandle = None
+        # Value of time.time() when the run was launched (used for timing).
+        self.submitClock = None
+        # Time the run's process exited, and the time (in seconds) it ran.
+        self.finishTime = None
+        self.walltime = None
+        # Set if the run was killed for passing its maxRunTime.
+        self.timedOut = False
     
     def writeInfoXML(self, xmlNode):
         JobMetaInfo.writeInfoXML(self, xmlNode)
         jmNode = xmlNode.find(self.XML_INFO_TAG)
         etree.SubElement(jmNode, 'runCommand').text = str(self.runCommand)
+        etree.SubElement(jmNode, 'finishTime').text = str(self.finishTime)
+        etree.SubElement(jmNode, 'walltime').text = str(self.walltime)
 
 
 class MPIJobRunner(JobRunner):
-    def __init__(self):
+    """Runs ModelRuns locally using MPI (see :data:`MPI_RUN_COMMAND`).
+
+    If `maxCores` is given, suites are run non-blocking by default, and
+    several runs are run at once, as long as the total number of processors
+    they use (their 'nproc' job parameter) is within `maxCores` (see
+    :meth:`.submitAndBlockSuite`).
+
+    .. attribute:: maxCores
+
+       Maximum total processors to use for the runs of a suite at once, or
+       None to not limit (i.e. when run non-blocking, all of a suite's runs
+       are started at once).
+
+    .. attribute:: scheduleOrder
+
+       The order in which to start a suite's queued runs when there are
+       free processors, either :data:`.SCHEDULE_LARGEST_FIRST` (the
+       default) or :data:`.SCHEDULE_SHORTEST_FIRST`. Runs that don't fit in
+       the free processors are skipped until some runs complete.
+
+    .. attribute:: runTimeEstimator
+
+       Function returning the estimated run time of a ModelRun, used for
+       :data:`.SCHEDULE_SHORTEST_FIRST` scheduling. Defaults to
+       :func:`.estimateRunTime`.
+
+    .. attribute:: killGracePeriod
+
+       Time (in seconds) a run that has passed its 'maxRunTime' job
+       parameter is given to exit after being sent SIGTERM, before it's
+       sent SIGKILL. Defaults to :data:`.DEFAULT_KILL_GRACE_PERIOD`.
+    """
+    def __init__(self, maxCores=None, scheduleOrder=SCHEDULE_LARGEST_FIRST):
         JobRunner.__init__(self)
+        self.maxCores = maxCores
+        self.scheduleOrder = scheduleOrder
+        self.runTimeEstimator = estimateRunTime
+        self.killGracePeriod = DEFAULT_KILL_GRACE_PERIOD
+        if maxCores is not None:
+            self.runSuiteNonBlockingDefault = True
         if MPI_RUN_COMMAND in os.environ:
             self.mpiRunCommand = os.environ[MPI_RUN_COMMAND]
         else:
@@ -118,6 +189,7 @@ class MPIJobRunner(JobRunner):
         jobMI.stdOutFile = stdOutFile
         jobMI.stdErrFile = stdErrFile
         jobMI.submitTime = datetime.now()
+        jobMI.submitClock = time.time()
         try:
             procHandle = subprocess.Popen(runAsArgs, shell=False,
                 stdout=stdOutFile, stderr=stdErrFile)
@@ -150,43 +222,89 @@ class MPIJobRunner(JobRunner):
 
     def blockResult(self, modelRun, jobMI):        
         # CHeck jobMI is of type MPI ...
+        # Rather than polling, block until the process exits - if it passes
+        #  its maxRunTime first, a timer thread kills it.
+        killTimer = self._startKillTimer(modelRun, jobMI)
+        try:
+            retCode = self._waitForRun(jobMI)
+        finally:
+            if killTimer is not None: killTimer.cancel()
+        return self._finishRun(modelRun, jobMI, retCode, jobMI.timedOut)
+
+    def _waitForRun(self, jobMI):
+        """Block until a run's process exits, then record its finish time
+        and walltime, and return its exit code."""
+        retCode = jobMI.procHandle.wait()
+        jobMI.finishTime = datetime.now()
+        if jobMI.submitClock is not None:
+            jobMI.walltime = time.time() - jobMI.submitClock
+        return retCode
+
+    def _startKillTimer(self, modelRun, jobMI):
+        """If the run has a maxRunTime, start (and return) a timer thread
+        that kills it if it's still running after that time (see
+        :meth:`._killTimedOutRun`). Cancel the timer once the run exits.
+        Returns None if the run has no maxRunTime."""
         maxRunTime = modelRun.jobParams['maxRunTime']
-        pollInterval = modelRun.jobParams['pollInterval']
+        if maxRunTime is None or maxRunTime <= 0:
+            return None
+        runTimeLeft = maxRunTime
+        if jobMI.submitClock is not None:
+            # Allow for time since the run was submitted.
+            runTimeLeft -= time.time() - jobMI.submitClock
+        killTimer = threading.Timer(max(0, runTimeLeft),
+            self._killTimedOutRun, [jobMI, maxRunTime])
+        killTimer.setDaemon(True)
+        killTimer.start()
+        return killTimer
+
+    def _killTimedOutRun(self, jobMI, maxRunTime):
+        """Mark a run as timed out, and send its process SIGTERM - then if
+        it hasn't exited after :attr:`.killGracePeriod`, SIGKILL."""
         procHandle = jobMI.procHandle
+        if procHandle.returncode is not None: return
+        # Mark before signalling, so it's set by the time the run exits.
+        jobMI.timedOut = True
+        print "Error: passed timeout of %s, sending terminate signal." % \
+            (str(timedelta(seconds=maxRunTime)))
+        try:
+            procHandle.terminate()
+        except OSError:
+            # Already exited.
+            return
+        def forceKill():
+            if procHandle.returncode is not None: return
+            print "Error: run still going %s after terminate signal,"\
+                " sending kill signal." % \
+                (str(timedelta(seconds=self.killGracePeriod)))
+            try:
+                procHandle.kill()
+            except OSError:
+                pass
+        forceKillTimer = threading.Timer(self.killGracePeriod, forceKill)
+        forceKillTimer.setDaemon(True)
+        forceKillTimer.start()
 
+    def _finishRun(self, modelRun, jobMI, retCode, timeOut):
+        """Check the exit status of a run that has finished (or been killed
+        after timing out), tidy up after it, and return its ModelResult."""
         # Navigate to the model's base directory
         startDir = os.getcwd()
         if modelRun.basePath != startDir:
             print "Changing to ModelRun's specified base path '%s'" % \
                 (modelRun.basePath)
             os.chdir(modelRun.basePath)
+        try:
+            return self._finishRunInBasePath(modelRun, jobMI, retCode,
+                timeOut)
+        finally:
+            if modelRun.basePath != startDir:
+                print "Restoring initial path '%s'" % \
+                    (startDir)
+                os.chdir(startDir)
 
-        if maxRunTime == None or maxRunTime <= 0:    
-            timeOut = False
-            retCode = procHandle.wait()
-        else:
-            if pollInterval > maxRunTime: pollInterval = maxRunTime
-            totalTime = 0
-            timeOut = True
-            while totalTime <= maxRunTime:
-                # Note: current strategy in this loop means 'totalTime'
-                #  recorded here will only be as accurate as size of 
-                #  pollInterval.
-                #  Thus this is a fall-back for recording time taken.
-                time.sleep(pollInterval)
-                totalTime += pollInterval
-                retCode = procHandle.poll()
-                if retCode is not None:
-                    timeOut = False
-                    break
-            if timeOut:
-                # At this point, we know the process has run too long.
-                # From Python 2.6, change this to procHandle.kill()
-                print "Error: passed timeout of %s, sending quit signal." % \
-                    (str(timedelta(seconds=maxRunTime)))
-                os.kill(procHandle.pid, signal.SIGQUIT)
-        # TODO: set finishTime
-
+    def _finishRunInBasePath(self, modelRun, jobMI, retCode, timeOut):
+        maxRunTime = modelRun.jobParams['maxRunTime']
         # Check status of run (eg error status)
         stdOutFilename = modelRun.getStdOutFilename()
         stdErrFilename = modelRun.getStdErrFilename()
@@ -225,13 +343,164 @@ class MPIJobRunner(JobRunner):
         #Now collect profiler performance info.
         for profiler in self.profilers:
             profiler.attachPerformanceInfo(jobMI, mResult)
-
-        if modelRun.basePath != startDir:
-            print "Restoring initial path '%s'" % \
-                (startDir)
-            os.chdir(startDir)
         return mResult
 
+    def blockSuite(self, modelSuite, jobMetaInfos, reusedResults=None,
+            writeRecords=False):
+        """See :meth:`credo.jobrunner.api.JobRunner.blockSuite`.
+        
+        Waits on all the suite's runs at once, so each is finished off as
+        soon as it completes (or passes its maxRunTime). If a run fails, the
+        error is raised once the other runs have completed."""
+        results = []
+        running = {}
+        finishedRuns = Queue.Queue()
+        for runI, jobMI in enumerate(jobMetaInfos):
+            if reusedResults and runI in reusedResults:
+                results.append(reusedResults[runI])
+            else:
+                results.append(None)
+                running[runI] = self._watchRun(modelSuite.runs[runI], runI,
+                    jobMI, finishedRuns)
+        self._collectRuns(modelSuite, results, running, finishedRuns,
+            writeRecords)
+        modelSuite.resultsList = results
+        return modelSuite.resultsList
+
+    def submitAndBlockSuite(self, modelSuite, prefixStr=None,
+            extraCmdLineOpts=None, dryRun=False, maxRunTime=None,
+            writeRecords=True, reusedResults=None):
+        """See :meth:`credo.jobrunner.api.JobRunner.submitAndBlockSuite`.
+        
+        If :attr:`.maxCores` is set, the suite's runs are queued (in the
+        order given by :attr:`.scheduleOrder`), and started when enough
+        processors are free for them, as other runs complete. (A run using
+        more than maxCores processors is started when no others are
+        running.) If a run fails (or fails to start), no more runs are
+        started, and the error is raised once the runs already started have
+        completed."""
+        if self.maxCores is None or dryRun == True:
+            return JobRunner.submitAndBlockSuite(self, modelSuite, prefixStr,
+                extraCmdLineOpts, dryRun, maxRunTime, writeRecords,
+                reusedResults)
+        if reusedResults is None: reusedResults = {}
+        modelRuns = modelSuite.runs
+        results = [reusedResults.get(runI) for runI in range(len(modelRuns))]
+        queuedRuns = self.getScheduleOrder(modelRuns,
+            [runI for runI in range(len(modelRuns))
+                if runI not in reusedResults])
+        running = {}
+        finishedRuns = Queue.Queue()
+
+        def startQueuedRuns():
+            freeCores = self.maxCores - sum([modelRuns[runI].jobParams['nproc']
+                for runI in running])
+            for runI in list(queuedRuns):
+                modelRun = modelRuns[runI]
+                nproc = modelRun.jobParams['nproc']
+                if nproc > freeCores and running: continue
+                queuedRuns.remove(runI)
+                if writeRecords == True:
+                    modelRun.writeInfoXML()
+                customOpts = modelSuite.getCustomOpts(runI, extraCmdLineOpts)
+                jobMI = self.submitRun(modelRun, prefixStr, customOpts, False,
+                    maxRunTime)
+                running[runI] = self._watchRun(modelRun, runI, jobMI,
+                    finishedRuns)
+                freeCores -= nproc
+
+        self._collectRuns(modelSuite, results, running, finishedRuns,
+            writeRecords, startQueuedRuns)
+        modelSuite.resultsList = results
+        return results
+
+    def getScheduleOrder(self, modelRuns, runIndices):
+        """Returns the given indices of runs in modelRuns, in the order
+        they should be started, according to :attr:`.scheduleOrder`."""
+        if self.scheduleOrder == SCHEDULE_LARGEST_FIRST:
+            sortKey = lambda runI: (-modelRuns[runI].jobParams['nproc'], runI)
+        elif self.scheduleOrder == SCHEDULE_SHORTEST_FIRST:
+            def sortKey(runI):
+                # Runs with no estimate go last.
+                estRunTime = self.runTimeEstimator(modelRuns[runI])
+                return (estRunTime is None, estRunTime, runI)
+        else:
+            raise ValueError("Error, unknown scheduleOrder '%s', should be"\
+                " one of %s." % (self.scheduleOrder,
+                    [SCHEDULE_LARGEST_FIRST, SCHEDULE_SHORTEST_FIRST]))
+        return sorted(runIndices, key=sortKey)
+
+    def _watchRun(self, modelRun, runI, jobMI, finishedRuns):
+        """Start a thread that waits on a run's process, and puts runI on
+        the finishedRuns queue when it exits (killing it if it passes its
+        maxRunTime). Returns the run's jobMetaInfo."""
+        killTimer = self._startKillTimer(modelRun, jobMI)
+        def waitForRun():
+            try:
+                self._waitForRun(jobMI)
+            finally:
+                if killTimer is not None: killTimer.cancel()
+                finishedRuns.put(runI)
+        waitThread = threading.Thread(target=waitForRun)
+        waitThread.setDaemon(True)
+        waitThread.start()
+        return jobMI
+
+    def _collectRuns(self, modelSuite, results, running, finishedRuns,
+            writeRecords, startQueuedRuns=None):
+        """Wait for each of the running runs (see :meth:`._watchRun`) to
+        complete, finishing each off as it does, and storing its ModelResult
+        in results. If given, startQueuedRuns is called first, and after
+        each run completes, to start any more runs.
+        If a run fails (or fails to start), no more runs are started, and
+        the error is raised once the other running runs have completed.
+        On any other error (e.g. a KeyboardInterrupt), the running runs are
+        terminated, and the error raised straight away."""
+        firstError = None
+        try:
+            while True:
+                if startQueuedRuns is not None and firstError is None:
+                    try:
+                        startQueuedRuns()
+                    except Exception:
+                        firstError = sys.exc_info()
+                if not running: break
+                try:
+                    # NB: wait with a timeout, as otherwise the wait can't
+                    #  be interrupted (e.g. by Ctrl-C) in Python 2.
+                    runI = finishedRuns.get(True, 1.0)
+                except Queue.Empty:
+                    continue
+                modelRun = modelSuite.runs[runI]
+                jobMI = running.pop(runI)
+                try:
+                    result = self._finishRun(modelRun, jobMI,
+                        jobMI.procHandle.returncode, jobMI.timedOut)
+                    print "ModelRun '%s' complete." % modelRun.name
+                    if writeRecords == True:
+                        result.writeRecordXML()
+                    results[runI] = result
+                except Exception:
+                    if firstError is None:
+                        firstError = sys.exc_info()
+        except:
+            self._terminateRuns(running.values())
+            raise
+        if firstError is not None:
+            raise firstError[0], firstError[1], firstError[2]
+
+    def _terminateRuns(self, jobMetaInfos):
+        """Send SIGTERM to the processes of each of the given runs that are
+        still running."""
+        for jobMI in jobMetaInfos:
+            if jobMI.procHandle.returncode is not None: continue
+            print "Terminating run process %d." % jobMI.procHandle.pid
+            try:
+                jobMI.procHandle.terminate()
+            except OSError:
+                # Already exited.
+                pass
+
     def archiveRunCommand(self, modelRun, runCommand):
         """Save the given runCommand to a file in output directory."""
         fName = os.path.join(modelRun.outputPath, "runCommand.sh")
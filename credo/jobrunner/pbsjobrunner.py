@@ -22,6 +22,9 @@
 ##  MA  02110-1301  USA
 
 import os
+import re
+import copy
+import pipes
 import signal
 import subprocess
 import time
@@ -36,14 +39,76 @@ MPI_RUN_COMMAND = "MPI_RUN_COMMAND"
 DEFAULT_MPI_RUN_COMMAND = "mpiexec"
 
 PBS_SUB_COMMAND = "qsub"
+PBS_STAT_COMMAND = "qstat"
 PBS_FIRSTLINE = "#!/bin/bash"
 PBS_PREFIX = "#PBS"
 
+#: States of jobs in qstat output that have finished: exiting, or
+#: cancelled (the latter treated as an error).
+PBS_FINISHED_STATES = ["E", "C"]
+#: State recorded for jobs qstat doesn't know about - i.e. that have
+#: finished, and been removed from the queue.
+PBS_STATE_UNKNOWN = "Unknown"
+
+#: PBS directive to submit a job array, and the environment variable each
+#: element's index is given in (these are for Torque).
+PBS_ARRAY_DIRECTIVE = "-t"
+PBS_ARRAY_ID_VAR = "PBS_ARRAYID"
+
+def getShortJobId(jobId):
+    """Returns the job number part of a PBS job ID (e.g. "3505" for
+    "3505.tweedle"), which is how jobs are matched in qstat output (since
+    qstat may truncate the server name)."""
+    return jobId.strip().split(".")[0]
+
+def getArrayElementJobId(arrayJobId, arrayIndex):
+    """Returns the job ID of an element of a PBS job array, given the ID
+    of the array (e.g. "3505[2].tweedle" for "3505[].tweedle" and 2)."""
+    arrayJobId = arrayJobId.strip()
+    elementStr = "[%d]" % arrayIndex
+    if "[]" in arrayJobId:
+        return arrayJobId.replace("[]", elementStr, 1)
+    idParts = arrayJobId.split(".", 1)
+    idParts[0] += elementStr
+    return ".".join(idParts)
+
+def parseQStatOutput(qstatOut):
+    """Parse the standard output of qstat (in its default table format, e.g.
+    as below), and return a dictionary of the state letter of each job
+    listed, keyed by short job ID (see :func:`.getShortJobId`).
+
+    ::
+
+      Job id                    Name             User            Time Use S Queue
+      ------------------------- ---------------- --------------- -------- - -----
+      3505.tweedle              cratonic30t2c3d2 WendySharples   00:15:16 R batch
+    """
+    jobStates = {}
+    for line in qstatOut.splitlines():
+        fields = line.split()
+        if len(fields) < 6 or fields[0] == "Job" or line.startswith("-"):
+            continue
+        jobStates[getShortJobId(fields[0])] = fields[-2]
+    return jobStates
+
+def parseQStatUnknownJobs(qstatErr):
+    """Returns the set of short job IDs (see :func:`.getShortJobId`) that
+    qstat's standard error output reports as unknown, e.g.
+    "qstat: Unknown Job Id 3506.tweedle"."""
+    return set([getShortJobId(jobId) for jobId in
+        re.findall(r"Unknown Job Id(?: Error)?\s+(\S+)", qstatErr)])
+
 class PBSJobMetaInfo(JobMetaInfo):
     def __init__(self):
-        JobMetaInfo.__init__(self)
+        JobMetaInfo.__init__(self, 0)
         self.runType = "PBS"
         self.jobId = None
+        # State of the job last reported by qstat (None if not yet checked)
+        self.pbsState = None
+        # Index of the job in its job array (None if not part of one).
+        self.arrayIndex = None
+        # File PBS will save the job's standard output to.
+        self.pbsOutputFilename = None
     
     def writeInfoXML(self, xmlNode):
         JobMetaInfo.writeInfoXML(self, xmlNode)
@@ -54,12 +119,33 @@ class PBSJobRunner(JobRunner):
     """A JobRunner to submit CREDO jobs via creating PBS script files,
     and submitting these via command-line utils like qsub.
 
+    When blocking on a suite, the status of all its outstanding jobs is
+    checked with a single qstat call each poll interval (see
+    :meth:`.waitForAnyRun`).
+
+    .. attribute:: useJobArrays
+
+       If True, suites are submitted as a single PBS job array, rather than
+       a job per run (see :meth:`.submitSuiteAsArray`).
+
+    .. attribute:: pbsSubCommand
+
+       Command used to submit jobs (default :data:`PBS_SUB_COMMAND`).
+
+    .. attribute:: pbsStatCommand
+
+       Command used to check the status of jobs (default
+       :data:`PBS_STAT_COMMAND`).
+
     .. note:: this module is currently still in development, and needs
        tuning for different HPC machines."""
-    def __init__(self):
+    def __init__(self, useJobArrays=False):
         JobRunner.__init__(self)
         # PBS Job Runners should by default submit all jobs first
         self.runSuiteNonBlockingDefault = True
+        self.useJobArrays = useJobArrays
+        self.pbsSubCommand = PBS_SUB_COMMAND
+        self.pbsStatCommand = PBS_STAT_COMMAND
         if MPI_RUN_COMMAND in os.environ:
             self.mpiRunCommand = os.environ[MPI_RUN_COMMAND]
         else:
@@ -80,6 +166,46 @@ class PBSJobRunner(JobRunner):
                 (modelRun.basePath)
             os.chdir(modelRun.basePath)
 
+        jobParams = self._getJobParams(modelRun, maxRunTime)
+        runCommand = self._prepareRunCommand(modelRun, prefixStr,
+            extraCmdLineOpts)
+        pbsFilename = self._writePBSFile(modelRun, runCommand, jobParams)
+
+        # Run the run command, sending stdout and stderr to defined log paths
+        print "Running model '%s' via PBS, submitted filename %s"\
+            " with command '%s', with underlying MPI command '%s' ..."\
+            % (modelRun.name, pbsFilename, self.pbsSubCommand, runCommand)
+
+        # If we're only doing a dry run, return here.
+        if dryRun == True:
+            os.chdir(startDir)
+            return None
+
+        # Submit the command to PBS
+        jobMetaInfo = PBSJobMetaInfo()
+        jobMetaInfo.submitTime = datetime.now()
+        jobId = self._submitPBSFile(modelRun.name, pbsFilename, jobParams)
+        jobMetaInfo.jobId = jobId
+        jobMetaInfo.pbsOutputFilename = os.path.join(modelRun.basePath,
+            "%s.o%s" % (modelRun.name, getShortJobId(jobId)))
+        # TODO: create further job meta info
+        if modelRun.basePath != startDir:
+            print "Restoring initial path '%s'" % (startDir)
+            os.chdir(startDir)
+        return jobMetaInfo
+
+    def _getJobParams(self, modelRun, maxRunTime):
+        """Returns the job parameters to submit the given run with: its
+        jobParams, but with maxRunTime (if not None) as its 'maxRunTime'."""
+        if maxRunTime is None:
+            return modelRun.jobParams
+        jobParams = copy.deepcopy(modelRun.jobParams)
+        jobParams['maxRunTime'] = maxRunTime
+        return jobParams
+
+    def _prepareRunCommand(self, modelRun, prefixStr, extraCmdLineOpts):
+        """Prepare a ModelRun to be run (from its base path, which should be
+        the current directory), and return the command to run it."""
         # For PBS runs, want to ensure the output path is an abs path:-
         #  given file system complexities etc.
         #  thus update here.
@@ -96,72 +222,67 @@ class PBSJobRunner(JobRunner):
             # NB: in the case of MPI runs, we prefix the prefixStr before MPI
             # command and args ... appropriate for things like timing stuff.
             runCommand = " ".join([prefixStr, runCommand])
-        
-        pbsFilename = self._writePBSFile(modelRun, runCommand)        
+        return runCommand
+
+    def _submitPBSFile(self, jobName, pbsFilename, jobParams):
+        """Submit a PBS script with qsub (from the current directory), and
+        return the job ID."""
         try:
-            pbsQueueStr = "-q %s" % (modelRun.jobParams['PBS']['queue'])
+            pbsQueueStr = "-q %s" % (jobParams['PBS']['queue'])
         except KeyError:
             pbsQueueStr = ""
-        pbsSubCmd = "%s %s %s" % (PBS_SUB_COMMAND, pbsQueueStr, pbsFilename)
-
-        # Run the run command, sending stdout and stderr to defined log paths
-        print "Running model '%s' via PBS, submitted filename %s"\
-            " with command '%s', with underlying MPI command '%s' ..."\
-            % (modelRun.name, pbsFilename, PBS_SUB_COMMAND, runCommand)
-
-        # If we're only doing a dry run, return here.
-        if dryRun == True:
-            os.chdir(startDir)
-            return None
-
-        # Submit the command to PBS
+        pbsSubCmd = "%s %s %s" % (self.pbsSubCommand, pbsQueueStr,
+            pbsFilename)
         pbsSubArgs = shlex.split(pbsSubCmd)
-        jobMetaInfo = PBSJobMetaInfo()
-        jobMetaInfo.submitTime = datetime.now()
         try:
             qsubStdOut = open("%s.stdout" % pbsFilename, "w+")
             qsubStdErr = open("%s.stderr" % pbsFilename, "w+")
             retCode = subprocess.call(pbsSubArgs, shell=False,
                 stdout=qsubStdOut, stderr=qsubStdErr)
         except OSError, ose:
-            raise ModelRunLaunchError(modelRun.name, pbsSubCmd,
+            raise ModelRunLaunchError(jobName, pbsSubCmd,
                 "Check qsub working properly, OSError was %s" % (ose))
         
         # Parse the result, get the job number
         qsubStdOut.seek(0)
         qsubStdErr.seek(0)
         jobId = self._parseQSubOutput(qsubStdOut.read(), qsubStdErr.read())
-        jobMetaInfo.jobId = jobId
-        # TODO: create further job meta info
         # TODO: record where the stdout and stderr were set, and archive?
         qsubStdOut.close()
         qsubStdErr.close()
         # TODO: delete the qsub files if successful?
-        if modelRun.basePath != startDir:
-            print "Restoring initial path '%s'" % (startDir)
-            os.chdir(startDir)
-        return jobMetaInfo
+        return jobId
 
     def _parseQSubOutput(self, qsubStdOut, qsubStdErr):
         #TODO
         print "Going to parse qsub output '%s', stderr '%s'" % \
             (qsubStdOut, qsubStdErr)
-        jobId = qsubStdOut
+        jobId = qsubStdOut.strip()
         return jobId
 
-    def _writePBSFile(self, modelRun, runCommand):
-        jobParams = modelRun.jobParams
+    def _writePBSFile(self, modelRun, runCommand, jobParams=None):
+        if jobParams is None:
+            jobParams = modelRun.jobParams
         #make the pbs file name
         pbsFileName = "%s_proc_%d.pbs" % (modelRun.name, jobParams['nproc'])
         #add all necessary lines for a basic pbs- might need to modify
         # this slightly depending on what needs to go in
         f = open(pbsFileName, 'w') 
-        f.write(PBS_FIRSTLINE+"\n")
         #name line:
         try:
             jobNameLine = jobParams['PBS']['jobNameLine']
         except KeyError:
             jobNameLine = "%s -N %s" % (PBS_PREFIX, modelRun.name)
+        self._writePBSHeader(f, jobParams, jobNameLine)
+        #cmd line:
+        f.write(runCommand+"\n")
+        f.close()
+        return pbsFileName
+
+    def _writePBSHeader(self, f, jobParams, jobNameLine):
+        """Write the PBS directives, and environment setup, for a job using
+        the given jobParams to open PBS script file f."""
+        f.write(PBS_FIRSTLINE+"\n")
         f.write(jobNameLine+"\n")
         # All the following can be rearranged to suit whatever cluster
         # this is running on
@@ -199,63 +320,211 @@ class PBSJobRunner(JobRunner):
                 f.write("module load %s\n" % modName)
         except KeyError:
             pass
-        #cmd line:
-        f.write(runCommand+"\n")
+
+    def submitSuite(self, modelSuite, prefixStr=None, extraCmdLineOpts=None,
+            dryRun=False, maxRunTime=None, writeRecords=True, skipRuns=None):
+        """See :meth:`credo.jobrunner.api.JobRunner.submitSuite`. If
+        :attr:`.useJobArrays` is set, uses :meth:`.submitSuiteAsArray`."""
+        if self.useJobArrays:
+            return self.submitSuiteAsArray(modelSuite, prefixStr,
+                extraCmdLineOpts, dryRun, maxRunTime, writeRecords, skipRuns)
+        return JobRunner.submitSuite(self, modelSuite, prefixStr,
+            extraCmdLineOpts, dryRun, maxRunTime, writeRecords, skipRuns)
+
+    def submitSuiteAsArray(self, modelSuite, prefixStr=None,
+            extraCmdLineOpts=None, dryRun=False, maxRunTime=None,
+            writeRecords=True, skipRuns=None):
+        """Submits the runs of a suite (except those whose indices are in
+        skipRuns) as a single PBS job array, with one qsub call. The
+        array's script runs the command of the run whose index in the array
+        is given by the :data:`PBS_ARRAY_ID_VAR` environment variable.
+
+        The script is written, and submitted, in the base path of the first
+        run, using its PBS job parameters - but with the largest
+        'maxRunTime' of all the runs (or maxRunTime, if given).
+        All elements of a job array get the same resources, so if the runs'
+        'nproc' or 'PBS' job parameters differ, the runs are submitted
+        as separate jobs instead, as for :meth:`.submitSuite`.
+
+        Returns a list of the JobMetaInfos of each run's array element (with
+        None for skipped runs), as for :meth:`.submitSuite`."""
+        runIndices = [runI for runI in range(len(modelSuite.runs))
+            if not (skipRuns and runI in skipRuns)]
+        if not runIndices:
+            if dryRun == True: return []
+            return [None] * len(modelSuite.runs)
+        arrayRuns = [modelSuite.runs[runI] for runI in runIndices]
+        if not self._haveSameResources(arrayRuns):
+            print "Warning: runs of suite '%s' need different PBS"\
+                " resources ('nproc' or 'PBS' job parameters), so"\
+                " submitting them as separate jobs rather than a job"\
+                " array." % (modelSuite.outputPathBase)
+            return JobRunner.submitSuite(self, modelSuite, prefixStr,
+                extraCmdLineOpts, dryRun, maxRunTime, writeRecords, skipRuns)
+        runCommands = []
+        for runI, modelRun in zip(runIndices, arrayRuns):
+            if writeRecords == True:
+                modelRun.writeInfoXML()
+            customOpts = modelSuite.getCustomOpts(runI, extraCmdLineOpts)
+            startDir = os.getcwd()
+            os.chdir(modelRun.basePath)
+            try:
+                runCommands.append(self._prepareRunCommand(modelRun,
+                    prefixStr, customOpts))
+            finally:
+                os.chdir(startDir)
+
+        arrayName = os.path.basename(os.path.normpath(
+            modelSuite.outputPathBase)) or "credoSuite"
+        submitPath = arrayRuns[0].basePath
+        startDir = os.getcwd()
+        os.chdir(submitPath)
+        try:
+            pbsFilename = self._writePBSArrayFile(arrayName, arrayRuns,
+                runCommands, maxRunTime)
+            print "Running %d models as PBS job array '%s', submitted"\
+                " filename %s with command '%s' ..." % (len(arrayRuns),
+                    arrayName, pbsFilename, self.pbsSubCommand)
+            if dryRun == True:
+                return []
+            submitTime = datetime.now()
+            arrayJobId = self._submitPBSFile(arrayName, pbsFilename,
+                arrayRuns[0].jobParams)
+        finally:
+            os.chdir(startDir)
+
+        jobMetaInfos = [None] * len(modelSuite.runs)
+        arrayJobNum = getShortJobId(arrayJobId).replace("[]", "")
+        for arrayIndex, runI in enumerate(runIndices):
+            jobMetaInfo = PBSJobMetaInfo()
+            jobMetaInfo.submitTime = submitTime
+            jobMetaInfo.jobId = getArrayElementJobId(arrayJobId, arrayIndex)
+            jobMetaInfo.arrayIndex = arrayIndex
+            # Torque names array elements' output files with their index.
+            jobMetaInfo.pbsOutputFilename = os.path.join(submitPath,
+                "%s.o%s-%d" % (arrayName, arrayJobNum, arrayIndex))
+            jobMetaInfos[runI] = jobMetaInfo
+        return jobMetaInfos
+
+    def _haveSameResources(self, modelRuns):
+        """Returns True if all the given runs have the same 'nproc' and
+        'PBS' job parameters, so can be submitted as one job array."""
+        firstParams = modelRuns[0].jobParams
+        for mRun in modelRuns[1:]:
+            if mRun.jobParams['nproc'] != firstParams['nproc'] \
+                    or mRun.jobParams.get('PBS') != firstParams.get('PBS'):
+                return False
+        return True
+
+    def _writePBSArrayFile(self, arrayName, modelRuns, runCommands,
+            maxRunTime=None):
+        """Write a PBS job array script, to run each of the given runs
+        (using the matching run command), by array index."""
+        jobParams = copy.deepcopy(modelRuns[0].jobParams)
+        if maxRunTime is not None:
+            maxRunTimes = [maxRunTime]
+        else:
+            maxRunTimes = [mRun.jobParams['maxRunTime'] for mRun in modelRuns]
+        if None in maxRunTimes:
+            jobParams['maxRunTime'] = None
+        else:
+            jobParams['maxRunTime'] = max(maxRunTimes)
+        pbsFileName = "%s_array_%d.pbs" % (arrayName, len(modelRuns))
+        f = open(pbsFileName, 'w')
+        self._writePBSHeader(f, jobParams, "%s -N %s" % (PBS_PREFIX,
+            arrayName))
+        f.write("%s %s 0-%d\n" % (PBS_PREFIX, PBS_ARRAY_DIRECTIVE,
+            len(modelRuns)-1))
+        #cmd line for each array index:
+        f.write("case $%s in\n" % PBS_ARRAY_ID_VAR)
+        for arrayIndex, (modelRun, runCommand) in enumerate(
+                zip(modelRuns, runCommands)):
+            f.write("    %d) cd %s && %s ;;\n" % (arrayIndex,
+                pipes.quote(modelRun.basePath), runCommand))
+        f.write("    *) echo \"Error: no run for array index $%s\" >&2;"\
+            " exit 1 ;;\n" % PBS_ARRAY_ID_VAR)
+        f.write("esac\n")
         f.close()
         return pbsFileName
 
+    def waitForAnyRun(self, modelSuite, jobMetaInfos, runIndices):
+        """See :meth:`credo.jobrunner.api.JobRunner.waitForAnyRun`.
+        
+        Checks the status of all the given runs' jobs with one qstat call
+        (see :meth:`.queryJobStates`) each poll interval (the smallest
+        'pollInterval' job parameter of the runs), until one has finished."""
+        pollInterval = min([modelSuite.runs[runI].jobParams['pollInterval']
+            for runI in runIndices])
+        while True:
+            for runI in runIndices:
+                if self._jobFinished(jobMetaInfos[runI]):
+                    return runI
+            time.sleep(pollInterval)
+            self.queryJobStates([jobMetaInfos[runI] for runI in runIndices])
+            stateCounts = {}
+            for runI in runIndices:
+                pbsState = jobMetaInfos[runI].pbsState
+                stateCounts[pbsState] = stateCounts.get(pbsState, 0) + 1
+            print "PBS job states: %s" % ", ".join(["%d %s" % (count, state)
+                for state, count in sorted(stateCounts.iteritems())])
+
+    def queryJobStates(self, jobMetaInfos):
+        """Check the current state of each of the given jobs with a single
+        qstat call, and update their pbsState attributes. (Jobs that qstat
+        reports as unknown are given the state :data:`PBS_STATE_UNKNOWN`.)
+        
+        Jobs qstat neither lists nor reports as unknown - e.g. if the call
+        fails, due to a server timeout - keep their previous state, so
+        they'll be checked again next time."""
+        qstatArgs = shlex.split(self.pbsStatCommand) + [jobMI.jobId for jobMI
+            in jobMetaInfos]
+        try:
+            qstatProc = subprocess.Popen(qstatArgs, shell=False,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            qstatOut, qstatErr = qstatProc.communicate()
+        except OSError, ose:
+            print "Warning: couldn't run '%s' to check job states (%s),"\
+                " will retry." % (self.pbsStatCommand, ose)
+            return
+        jobStates = parseQStatOutput(qstatOut)
+        unknownJobs = parseQStatUnknownJobs(qstatErr)
+        # NB: qstat exits with an error if any job ID is unknown, so only
+        #  warn if it failed without saying which.
+        if qstatProc.returncode != 0 and not unknownJobs:
+            print "Warning: '%s' failed (exit code %d), will retry: %s" % \
+                (self.pbsStatCommand, qstatProc.returncode, qstatErr.strip())
+        for jobMI in jobMetaInfos:
+            shortJobId = getShortJobId(jobMI.jobId)
+            if shortJobId in jobStates:
+                jobMI.pbsState = jobStates[shortJobId]
+            elif shortJobId in unknownJobs:
+                jobMI.pbsState = PBS_STATE_UNKNOWN
+
+    def _jobFinished(self, jobMetaInfo):
+        return jobMetaInfo.pbsState in PBS_FINISHED_STATES \
+            or jobMetaInfo.pbsState == PBS_STATE_UNKNOWN
+
     def blockResult(self, modelRun, jobMetaInfo):        
         # Check jobMetaInfo is of type PBS
         # via self.runType = "PBS" 
-        startDir = os.getcwd()
-        if modelRun.basePath != startDir:
-            print "Changing to ModelRun's specified base path '%s'" % \
-                (modelRun.basePath)
-            os.chdir(modelRun.basePath)
-        jobID = jobMetaInfo.jobId
         pollInterval = modelRun.jobParams['pollInterval']
-        checkOutput = 0
         # NB: unlike with the MPI Job Runner, we don't check the "maxJobTime" here:- since that was encoded
         #  in the PBS Walltime used. Wait as long as necessary for job to be queued, run, and completed 
         #  in PBS system.
-        pbsWaitTime = 0
-        gotResult = False
-        pbsError = False
-        while gotResult == False:
+        # The job may already be known to have finished, e.g. from
+        #  waitForAnyRun().
+        while not self._jobFinished(jobMetaInfo):
             time.sleep(pollInterval)
-            pbsWaitTime += pollInterval
-            # check PBS job output ... (eg using qstat on jobID)
-            qstat = os.popen("qstat "+jobID).readlines()
-            qstatus = "%s" % (qstat)
-            # when the job has been submitted and we query the job ID we should get something like:
-            # if the job has ended:
-            #qstat: Unknown Job Id 3506.tweedle
-            # OR
-            #3505.tweedle              cratonic30t2c3d2 WendySharples   00:15:16 E batch
-            # if the job has not commenced running or is still running:
-            #3505.tweedle              cratonic30t2c3d2 WendySharples   00:15:16 Q batch
-            #3505.tweedle              cratonic30t2c3d2 WendySharples   00:15:16 R batch
-            #3505.tweedle              cratonic30t2c3d2 WendySharples   00:15:16 S batch
-            # if the job has not been able to be run:
-            #3505.tweedle              cratonic30t2c3d2 WendySharples   00:15:16 C batch
-            # So if we break the command line up into an array of words separated by spaces:
-            qstatus = qstatus.split(" ")
-            #jobName and modelName MUST be THE SAME 
-            for ii in range(len(qstatus)):
-                if qstatus[ii] == "Unknown":
-                    print "job has already run\n"
-                    gotResult = True
-                elif qstatus[ii] == "R":
-                    print "job is still running\n"
-                elif qstatus[ii] == "Q":
-                    print "job is queued\n"
-                elif qstatus[ii] == "C":
-                    print "job is cancelled\n"
-                    gotResult = True
-                    pbsError = True
-                elif qstatus[ii] == "E":
-                    print "job has ended\n"
-                    gotResult = True
+            self.queryJobStates([jobMetaInfo])
+        jobID = jobMetaInfo.jobId
+        pbsError = (jobMetaInfo.pbsState == "C")
+        if pbsError:
+            print "job is cancelled\n"
+        startDir = os.getcwd()
+        if modelRun.basePath != startDir:
+            print "Changing to ModelRun's specified base path '%s'" % \
+                (modelRun.basePath)
+            os.chdir(modelRun.basePath)
 
         # Check status of run (eg error status)
         # TODO: archive PBS file in modelRun output directory.
@@ -273,15 +542,11 @@ class PBSJobRunner(JobRunner):
             # TODO: Move and rename output and error files created by PBS,
             #  ... to stdOutFilename, stdErrFilename
             # check PBS output file and make sure there's something in it
-            jobName = "%s" % (modelRun.name)           
-            jobid = jobID.split(".")
-            jobNo = jobid[0] 
-            fileName = jobName+".o"+jobNo
-            f = open(fileName, 'r')
+            f = open(jobMetaInfo.pbsOutputFilename, 'r')
             lines = f.read()
             if lines == "":
                 print "error in file no output obtained\n"
-                raise ModelRunRegularError(modelRun.name, retCode,
+                raise ModelRunRegularError(modelRun.name, -1,
                     stdOutFilename, stdErrFilename)
             else:    
                 print "Model ran successfully (output saved to %s, std out"\
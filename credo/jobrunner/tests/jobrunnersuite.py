@@ -103,6 +103,44 @@ class JobRunnerTestCase(unittest.TestCase):
             self.assertEqual(jobMetaInfo.modelName,
                 self.skelMSuite.runs[runI].name)
 
+    def test_submitSuite_recordWrites(self):
+        # Each ModelRun record should only be written once.
+        writeCounts = {}
+        def countWrite(modelRun):
+            writeCounts[modelRun.name] = writeCounts.get(modelRun.name, 0) + 1
+        for runI in range(50):
+            mRun = SkeletonModelRun("skelMRun%d" % runI, "output/test")
+            mRun.writeInfoXML = lambda mRun=mRun: countWrite(mRun)
+            self.skelMSuite.runs.append(mRun)
+            self.skelMSuite.runCustomOptSets.append(None)
+        jobMetaInfos = self.jobRunner.submitSuite(self.skelMSuite)
+        self.assertEqual(len(jobMetaInfos), len(self.skelMSuite.runs))
+        self.assertEqual(sum(writeCounts.values()), 50)
+        self.assertEqual(set(writeCounts.values()), set([1]))
+
+    def test_submitSuite_submitError(self):
+        # Runs submitted before a failure should already have records, and
+        # the submission error should be raised.
+        writtenRuns = []
+        for mRun in self.skelMSuite.runs:
+            mRun.writeInfoXML = lambda mRun=mRun: writtenRuns.append(mRun.name)
+        submitError = ValueError("Couldn't submit run")
+        submittedRuns = []
+        def failingSubmitRun(modelRun, *args):
+            if modelRun is self.skelMRun2:
+                raise submitError
+            submittedRuns.append(modelRun.name)
+            return JobMetaInfo(0)
+        self.jobRunner.submitRun = failingSubmitRun
+        try:
+            self.jobRunner.submitSuite(self.skelMSuite)
+        except ValueError, e:
+            self.assertTrue(e is submitError)
+        else:
+            self.fail("Submission error not raised.")
+        self.assertEqual(submittedRuns, ["skelMRun1"])
+        self.assertTrue("skelMRun1" in writtenRuns)
+
     def test_blockSuite(self):
         # Set up some fake jobMetaInfos
         jobMetaInfos = [JobMetaInfo(0) for run in self.skelMSuite.runs]
@@ -115,6 +153,20 @@ class JobRunnerTestCase(unittest.TestCase):
             self.assertTrue(isinstance(res, ModelResult))
             self.assertEqual(res.modelName,
                 self.skelMSuite.runs[runI].name)
+        # Runs completing in a different order still give results in suite
+        #  order.
+        blocked = []
+        origBlockResult = self.jobRunner.blockResult
+        def blockResult(modelRun, jobMetaInfo):
+            blocked.append(modelRun.name)
+            return origBlockResult(modelRun, jobMetaInfo)
+        self.jobRunner.blockResult = blockResult
+        self.jobRunner.waitForAnyRun = lambda mSuite, jobMIs, runIndices: \
+            runIndices[-1]
+        results = self.jobRunner.blockSuite(self.skelMSuite, jobMetaInfos)
+        self.assertEqual(blocked, ["skelMRun2", "skelMRun1"])
+        self.assertEqual([res.modelName for res in results],
+            ["skelMRun1", "skelMRun2"])
 
     def test_runSuite(self):
         # Try with dryRun set to True, should be no results
@@ -22,21 +22,157 @@
 ##  MA  02110-1301  USA
 
 import os
+import re
+import time
 import shutil
 import tempfile
 import unittest
 
-from credo.modelrun import ModelRun
+from credo.modelrun import ModelRun, SimParams
 from credo.modelresult import ModelResult
 from credo.modelsuite import ModelSuite
+from credo.io import stgpath
+import credo.jobrunner.mpijobrunner as mpijobrunner
 from credo.jobrunner.mpijobrunner import MPIJobRunner, MPIJobMetaInfo
 
+_modelXML = """<?xml version="1.0"?>
+<StGermainData xmlns="http://www.vpac.org/StGermain/XML_IO_Handler/Jun2003">
+</StGermainData>
+"""
+
+# Stand-in for mpiexec: logs when each run starts and stops, and how many
+#  processors it uses, then "runs" for a short time (0.2s, or as given by
+#  a --sleep option). With --ignoreTerm=1, ignores SIGTERM.
+_fakeMPIRun = """#!/bin/sh
+echo "+ $2 $*" >> "$FAKE_MPI_LOG"
+case "$*" in *--ignoreTerm=1*) trap '' TERM;; esac
+sleepTime=`echo "$*" | sed -n 's/.*--sleep=\\([0-9.]*\\).*/\\1/p'`
+sleep ${sleepTime:-0.2}
+echo "- $2 $*" >> "$FAKE_MPI_LOG"
+case "$*" in *--fail=1*) exit 1;; esac
+exit 0
+"""
+
 class MPIJobRunnerTestCase(unittest.TestCase):
     def setUp(self):
+        self.basedir = os.path.realpath(tempfile.mkdtemp())
+        for fname, contents in [("model.xml", _modelXML),
+                ("StGermain", "#!/bin/sh\n"), ("fakempirun", _fakeMPIRun)]:
+            outFile = open(os.path.join(self.basedir, fname), "w")
+            outFile.write(contents)
+            outFile.close()
+        os.chmod(os.path.join(self.basedir, "fakempirun"), 0755)
+        self.logFilename = os.path.join(self.basedir, "mpi.log")
+        self.origEnv = {}
+        for envKey, value in [(stgpath.STG_BINDIRKEY, self.basedir),
+                (mpijobrunner.MPI_RUN_COMMAND,
+                    os.path.join(self.basedir, "fakempirun")),
+                ("FAKE_MPI_LOG", self.logFilename)]:
+            self.origEnv[envKey] = os.environ.get(envKey)
+            os.environ[envKey] = value
         self.jobRunner = MPIJobRunner()
 
     def tearDown(self):
-        pass
+        for envKey, value in self.origEnv.iteritems():
+            if value is None:
+                del os.environ[envKey]
+            else:
+                os.environ[envKey] = value
+        shutil.rmtree(self.basedir)
+
+    def _makeSuite(self, nprocs, estRunTimes=None):
+        mSuite = ModelSuite(os.path.join(self.basedir, "output"))
+        for runI, nproc in enumerate(nprocs):
+            mRun = ModelRun("run%d" % runI, ["model.xml"],
+                os.path.join("output", "run%d" % runI),
+                basePath=self.basedir, paramOverrides={"runId":runI},
+                simParams=SimParams(nsteps=5), nproc=nproc)
+            if estRunTimes is not None:
+                mRun.jobParams['estRunTime'] = estRunTimes[runI]
+            mSuite.addRun(mRun)
+        return mSuite
+
+    def _readLog(self):
+        """Returns a list of (started, nproc, runI) for each event logged by
+        the fake MPI run command."""
+        events = []
+        for line in open(self.logFilename):
+            runI = int(re.search("--runId=(\d+)", line).group(1))
+            events.append((line[0] == "+", int(line.split()[1]), runI))
+        return events
+
+    def test_getScheduleOrder(self):
+        mSuite = self._makeSuite([1, 4, 2, 4], [5, None, 1, 3])
+        runIndices = range(4)
+        self.assertEqual(self.jobRunner.getScheduleOrder(mSuite.runs,
+            runIndices), [1, 3, 2, 0])
+        self.jobRunner.scheduleOrder = mpijobrunner.SCHEDULE_SHORTEST_FIRST
+        self.assertEqual(self.jobRunner.getScheduleOrder(mSuite.runs,
+            runIndices), [2, 3, 0, 1])
+        self.jobRunner.scheduleOrder = "unknown"
+        self.assertRaises(ValueError, self.jobRunner.getScheduleOrder,
+            mSuite.runs, runIndices)
+
+    def test_blockSuiteCompletionOrder(self):
+        mSuite = self._makeSuite([1, 1, 1])
+        mSuite.runs[0].paramOverrides["sleep"] = 0.6
+        mSuite.runs[1].paramOverrides["sleep"] = 0.05
+        self.jobRunner.profilers = []
+        finished = []
+        origFinishRun = self.jobRunner._finishRun
+        def finishRun(modelRun, *args):
+            finished.append(modelRun.name)
+            return origFinishRun(modelRun, *args)
+        self.jobRunner._finishRun = finishRun
+        results = self.jobRunner.runSuite(mSuite, runSuiteNonBlocking=True)
+        # Each run finished off (and its record written) as it completed,
+        #  but results still in suite order.
+        self.assertEqual(finished, ["run1", "run2", "run0"])
+        self.assertEqual([res.modelName for res in results],
+            ["run0", "run1", "run2"])
+        recordFiles = [os.path.join(res.outputPath,
+            res.defaultRecordFilename()) for res in results]
+        recordMTimes = map(os.path.getmtime, recordFiles)
+        self.assertTrue(recordMTimes[1] < recordMTimes[0])
+
+    def test_runSuiteScheduled(self):
+        nprocs = [1, 2, 3, 2, 6]
+        mSuite = self._makeSuite(nprocs)
+        jobRunner = MPIJobRunner(maxCores=4)
+        jobRunner.profilers = []
+        results = jobRunner.runSuite(mSuite, writeRecords=False)
+        self.assertEqual([res.modelName for res in results],
+            ["run%d" % runI for runI in range(len(nprocs))])
+        events = self._readLog()
+        # Runs started largest first, as cores became free. (The 1-core run
+        #  may back-fill alongside run2, so log its start in either order.)
+        startOrder = [runI for started, nproc, runI in events if started]
+        self.assertEqual(startOrder[0], 4)
+        self.assertTrue(startOrder.index(2) < startOrder.index(1))
+        self.assertTrue(startOrder.index(2) < startOrder.index(3))
+        # Never more than maxCores in use, except by a single large run.
+        inUse, running = 0, 0
+        for started, nproc, runI in events:
+            if started:
+                inUse += nproc
+                running += 1
+            else:
+                inUse -= nproc
+                running -= 1
+            self.assertTrue(inUse <= 4 or running == 1)
+        self.assertEqual(len(events), 2 * len(nprocs))
+
+    def test_runSuiteScheduledError(self):
+        mSuite = self._makeSuite([2, 2, 2])
+        mSuite.runs[0].paramOverrides["fail"] = 1
+        jobRunner = MPIJobRunner(maxCores=4)
+        jobRunner.profilers = []
+        self.assertRaises(mpijobrunner.ModelRunRegularError,
+            jobRunner.runSuite, mSuite, writeRecords=False)
+        # The run started with the failed one was completed, no more
+        # were started.
+        self.assertEqual(sorted(self._readLog()), [(False, 2, 0),
+            (False, 2, 1), (True, 2, 0), (True, 2, 1)])
 
     def test_submitRun(self):
         self.fail()
@@ -49,6 +185,85 @@ class MPIJobRunnerTestCase(unittest.TestCase):
         # TODO: set up a fake MPI jobHandle
         result = self.jobRunner.blockResult(self, modelRun, jobMetaInfo)
     
+    def test_runSuiteScheduledSubmitError(self):
+        mSuite = self._makeSuite([2, 2, 2])
+        jobRunner = MPIJobRunner(maxCores=4)
+        jobRunner.profilers = []
+        origSubmitRun = jobRunner.submitRun
+        def submitRun(modelRun, *args):
+            if modelRun.name == "run1":
+                raise mpijobrunner.ModelRunLaunchError(modelRun.name,
+                    "fakempirun")
+            return origSubmitRun(modelRun, *args)
+        jobRunner.submitRun = submitRun
+        finished = []
+        origFinishRun = jobRunner._finishRun
+        def finishRun(modelRun, *args):
+            finished.append(modelRun.name)
+            return origFinishRun(modelRun, *args)
+        jobRunner._finishRun = finishRun
+        self.assertRaises(mpijobrunner.ModelRunLaunchError,
+            jobRunner.runSuite, mSuite, writeRecords=False)
+        # The run already started was completed and finished off, no more
+        #  were started.
+        self.assertEqual(finished, ["run0"])
+        self.assertEqual(sorted(self._readLog()), [(False, 2, 0),
+            (True, 2, 0)])
+
+    def test_collectRunsInterrupted(self):
+        mSuite = self._makeSuite([1, 1])
+        mSuite.runs[0].paramOverrides["sleep"] = 0.05
+        mSuite.runs[1].paramOverrides["sleep"] = 5
+        self.jobRunner.profilers = []
+        jobMIs = []
+        origSubmitRun = self.jobRunner.submitRun
+        def submitRun(*args):
+            jobMIs.append(origSubmitRun(*args))
+            return jobMIs[-1]
+        self.jobRunner.submitRun = submitRun
+        def finishRun(modelRun, *args):
+            raise KeyboardInterrupt()
+        self.jobRunner._finishRun = finishRun
+        startTime = time.time()
+        self.assertRaises(KeyboardInterrupt, self.jobRunner.runSuite,
+            mSuite, runSuiteNonBlocking=True, writeRecords=False)
+        # The still running run is terminated. (Its returncode is set by the
+        #  thread waiting on it.)
+        procHandle = jobMIs[1].procHandle
+        while procHandle.returncode is None and time.time() - startTime < 3:
+            time.sleep(0.01)
+        self.assertEqual(procHandle.returncode, -15)
+
+    def test_blockResultWaits(self):
+        mRun = self._makeSuite([1]).runs[0]
+        mRun.paramOverrides["sleep"] = 0.05
+        mRun.jobParams['maxRunTime'] = 20
+        mRun.jobParams['pollInterval'] = 10
+        self.jobRunner.profilers = []
+        startTime = time.time()
+        jobMI = self.jobRunner.submitRun(mRun)
+        mResult = self.jobRunner.blockResult(mRun, jobMI)
+        # Finished as soon as the run exited, not after a poll interval.
+        self.assertTrue(time.time() - startTime < 5)
+        self.assertTrue(0.05 <= jobMI.walltime < 5)
+        self.assertFalse(jobMI.timedOut)
+
+    def test_blockResultTimeout(self):
+        mRun = self._makeSuite([1]).runs[0]
+        mRun.paramOverrides["sleep"] = 3
+        mRun.jobParams['maxRunTime'] = 0.3
+        self.jobRunner.profilers = []
+        self.jobRunner.killGracePeriod = 0.3
+        for ignoreTerm in [0, 1]:
+            # If SIGTERM is ignored, SIGKILL is sent after the grace period.
+            mRun.paramOverrides["ignoreTerm"] = ignoreTerm
+            startTime = time.time()
+            jobMI = self.jobRunner.submitRun(mRun)
+            self.assertRaises(mpijobrunner.ModelRunTimeoutError,
+                self.jobRunner.blockResult, mRun, jobMI)
+            self.assertTrue(jobMI.timedOut)
+            self.assertTrue(0.3 <= time.time() - startTime < 2.5)
+
     def test_attachPlatformInfo(self):
         jobMI = MPIJobMetaInfo()
         self.jobRunner.attachPlatformInfo(jobMI)
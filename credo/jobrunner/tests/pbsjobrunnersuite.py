@@ -23,20 +23,126 @@
 
 import os
 import shutil
+import subprocess
 import tempfile
 import unittest
 
-from credo.modelrun import JobParams
+from credo.modelrun import ModelRun, JobParams, SimParams
 from credo.modelresult import ModelResult
+from credo.modelsuite import ModelSuite
+from credo.io import stgpath
+import credo.jobrunner.pbsjobrunner as pbsjobrunner
 from credo.jobrunner.pbsjobrunner import PBSJobRunner
 from skeleton import SkeletonModelRun, SkeletonModelResult, SkeletonModelSuite
 
+_modelXML = """<?xml version="1.0"?>
+<StGermainData xmlns="http://www.vpac.org/StGermain/XML_IO_Handler/Jun2003">
+</StGermainData>
+"""
+
+# Stand-ins for qsub and qstat. Each job (or job array element) stays in
+#  the queue for the number of qstat calls given by its run's --polls
+#  option, then writes its PBS output file, and is forgotten. While the
+#  file "failures" holds a count above zero, qstat fails instead.
+_fakeQSub = """#!/bin/sh
+for arg; do pbsFile=$arg; done
+jobNum=$((`cat count 2>/dev/null || echo 0` + 1))
+echo $jobNum > count
+jobName=`sed -n 's/^#PBS -N //p' "$pbsFile"`
+getPolls() {
+    polls=`echo "$1" | sed -n 's/.*--polls=\\([0-9]*\\).*/\\1/p'`
+    echo ${polls:-1}
+}
+if grep -q "^#PBS -t" "$pbsFile"; then
+    grep "^ *[0-9]*)" "$pbsFile" | while read line; do
+        index=${line%%)*}
+        getPolls "$line" > "$jobNum[$index].left"
+        echo "$jobName.o$jobNum-$index" > "$jobNum[$index].out"
+    done
+    echo "$jobNum[].fakeserver"
+else
+    getPolls "`cat $pbsFile`" > "$jobNum.left"
+    echo "$jobName.o$jobNum" > "$jobNum.out"
+    echo "$jobNum.fakeserver"
+fi
+"""
+
+_fakeQStat = """#!/bin/sh
+cd "$FAKE_PBS_DIR"
+echo "$*" >> qstat.log
+failures=`cat failures 2>/dev/null || echo 0`
+if [ $failures -gt 0 ]; then
+    echo $(($failures - 1)) > failures
+    echo "qstat: cannot connect to server fakeserver" >&2
+    exit 1
+fi
+echo "Job id                    Name             User            Time Use S Queue"
+echo "------------------------- ---------------- --------------- -------- - -----"
+for jobId; do
+    jobNum=${jobId%%.*}
+    left=`cat "$jobNum.left" 2>/dev/null || echo 0`
+    if [ $left -le 0 ]; then
+        if [ -f "$jobNum.out" ]; then
+            echo "ran" > "`cat "$jobNum.out"`"
+            rm "$jobNum.out"
+        fi
+        echo "qstat: Unknown Job Id $jobId" >&2
+        unknown=1
+        continue
+    fi
+    echo $(($left - 1)) > "$jobNum.left"
+    echo "$jobId          job$jobNum     user     00:00:01 R batch"
+done
+if [ -n "$unknown" ]; then exit 153; fi
+exit 0
+"""
+
 class PBSJobRunnerTestCase(unittest.TestCase):
     def setUp(self):
         self.jobRunner = PBSJobRunner()
+        self.basedir = os.path.realpath(tempfile.mkdtemp())
+        for fname, contents in [("model.xml", _modelXML),
+                ("StGermain", "#!/bin/sh\n"), ("fakeqsub", _fakeQSub),
+                ("fakeqstat", _fakeQStat)]:
+            outFile = open(os.path.join(self.basedir, fname), "w")
+            outFile.write(contents)
+            outFile.close()
+        for fname in ["fakeqsub", "fakeqstat"]:
+            os.chmod(os.path.join(self.basedir, fname), 0755)
+        self.origEnv = {}
+        for envKey, value in [(stgpath.STG_BINDIRKEY, self.basedir),
+                ("FAKE_PBS_DIR", self.basedir)]:
+            self.origEnv[envKey] = os.environ.get(envKey)
+            os.environ[envKey] = value
 
     def tearDown(self):
-        pass
+        for envKey, value in self.origEnv.iteritems():
+            if value is None:
+                del os.environ[envKey]
+            else:
+                os.environ[envKey] = value
+        shutil.rmtree(self.basedir)
+
+    def _makeFakePBSSuite(self, pollCounts):
+        """Make a suite of runs to submit with the fake qsub and qstat, each
+        taking the given number of qstat polls to complete."""
+        self.jobRunner.pbsSubCommand = os.path.join(self.basedir, "fakeqsub")
+        self.jobRunner.pbsStatCommand = os.path.join(self.basedir,
+            "fakeqstat")
+        mSuite = ModelSuite(os.path.join(self.basedir, "output"))
+        for runI, polls in enumerate(pollCounts):
+            mRun = ModelRun("run%d" % runI, ["model.xml"],
+                os.path.join("output", "run%d" % runI),
+                basePath=self.basedir,
+                paramOverrides={"polls":polls, "runId":runI},
+                simParams=SimParams(nsteps=5))
+            mRun.jobParams['pollInterval'] = 0.01
+            mSuite.addRun(mRun)
+        return mSuite
+
+    def _readQStatLog(self):
+        return [line.split() for line in
+            open(os.path.join(self.basedir, "qstat.log"))]
 
     def test_writePBSFile_basic(self):
         modelRun = SkeletonModelRun("skelMRun1", "output/test1")
@@ -58,6 +164,122 @@ class PBSJobRunnerTestCase(unittest.TestCase):
         runCommand = "mpiexec ./someApp Input.xml"
         self.jobRunner._writePBSFile(modelRun, runCommand)       
 
+    def test_parseQStatOutput(self):
+        qstatOut = """Job id                    Name             User            Time Use S Queue
+------------------------- ---------------- --------------- -------- - -----
+3505.tweedle              cratonic30t2c3d2 WendySharples   00:15:16 R batch
+3506.tweedle              cratonic30t2c3d3 WendySharples   0        Q batch
+"""
+        self.assertEqual(pbsjobrunner.parseQStatOutput(qstatOut),
+            {"3505":"R", "3506":"Q"})
+        self.assertEqual(pbsjobrunner.parseQStatOutput(""), {})
+
+    def test_blockSuiteBatchedPolling(self):
+        mSuite = self._makeFakePBSSuite([3, 1, 2])
+        finished = []
+        origBlockResult = self.jobRunner.blockResult
+        def blockResult(modelRun, jobMetaInfo):
+            finished.append(modelRun.name)
+            return origBlockResult(modelRun, jobMetaInfo)
+        self.jobRunner.blockResult = blockResult
+        results = self.jobRunner.runSuite(mSuite, writeRecords=False)
+        self.assertEqual(finished, ["run1", "run2", "run0"])
+        self.assertEqual([res.modelName for res in results],
+            ["run0", "run1", "run2"])
+        # One qstat call per poll, for all the outstanding jobs.
+        qstatCalls = self._readQStatLog()
+        self.assertEqual(qstatCalls[0],
+            ["1.fakeserver", "2.fakeserver", "3.fakeserver"])
+        self.assertEqual(len(qstatCalls), 4)
+        self.assertEqual(qstatCalls[-1], ["1.fakeserver"])
+
+    def test_parseQStatUnknownJobs(self):
+        qstatErr = "qstat: Unknown Job Id 3506.tweedle\n"\
+            "qstat: Unknown Job Id Error 3507[2].tweedle.vpac.org\n"
+        self.assertEqual(pbsjobrunner.parseQStatUnknownJobs(qstatErr),
+            set(["3506", "3507[2]"]))
+        self.assertEqual(pbsjobrunner.parseQStatUnknownJobs(
+            "qstat: cannot connect to server fakeserver\n"), set())
+
+    def test_blockSuiteQStatFailure(self):
+        mSuite = self._makeFakePBSSuite([1, 2])
+        # qstat fails (with no output) for the first polls: the jobs
+        #  should still be waited on, not taken as finished.
+        failuresFile = open(os.path.join(self.basedir, "failures"), "w")
+        failuresFile.write("2\n")
+        failuresFile.close()
+        results = self.jobRunner.runSuite(mSuite, writeRecords=False)
+        self.assertEqual([res.modelName for res in results],
+            ["run0", "run1"])
+        self.assertEqual(len(self._readQStatLog()), 5)
+
+    def test_getArrayElementJobId(self):
+        self.assertEqual(pbsjobrunner.getArrayElementJobId(
+            "3505[].tweedle\n", 2), "3505[2].tweedle")
+        self.assertEqual(pbsjobrunner.getArrayElementJobId(
+            "3505.tweedle", 0), "3505[0].tweedle")
+
+    def test_submitSuiteAsArray(self):
+        mSuite = self._makeFakePBSSuite([3, 1, 2, 1])
+        for runI in range(3):
+            mSuite.runs[runI].jobParams['nproc'] = 4
+        mSuite.runs[1].jobParams['maxRunTime'] = 60
+        self.jobRunner.useJobArrays = True
+        self.jobRunner.mpiRunCommand = "echo"
+        # Run 3 is re-used, so not part of the array.
+        reused = ModelResult("run3", "output/run3")
+        results = self.jobRunner.submitAndBlockSuite(mSuite,
+            maxRunTime=600, writeRecords=False, reusedResults={3:reused})
+        self.assertEqual([res.modelName for res in results],
+            ["run0", "run1", "run2", "run3"])
+        self.assertTrue(results[3] is reused)
+        # One qsub, of a script for all the runs.
+        self.assertEqual(open(os.path.join(self.basedir, "count")).read(),
+            "1\n")
+        pbsFilename = os.path.join(self.basedir, "output_array_3.pbs")
+        pbsScript = open(pbsFilename).read()
+        self.assertTrue("#PBS -t 0-2\n" in pbsScript)
+        self.assertTrue("#PBS -l nodes=4\n" in pbsScript)
+        # The suite's maxRunTime applies to all the array elements.
+        self.assertTrue("#PBS -l walltime=0:10:00\n" in pbsScript)
+        # Each array index runs the matching run's command.
+        for arrayIndex in range(3):
+            env = dict(os.environ)
+            env[pbsjobrunner.PBS_ARRAY_ID_VAR] = str(arrayIndex)
+            scriptProc = subprocess.Popen(["sh", pbsFilename], env=env,
+                stdout=subprocess.PIPE)
+            self.assertTrue("--runId=%d" % arrayIndex in
+                scriptProc.communicate()[0])
+        # Status tracked per array element, with one qstat call per poll.
+        qstatCalls = self._readQStatLog()
+        self.assertEqual(qstatCalls[0], ["1[0].fakeserver",
+            "1[1].fakeserver", "1[2].fakeserver"])
+        self.assertEqual(qstatCalls[-1], ["1[0].fakeserver"])
+        self.assertEqual(len(qstatCalls), 4)
+
+    def test_submitSuiteAsArray_mixedNProc(self):
+        mSuite = self._makeFakePBSSuite([2, 1, 1])
+        mSuite.runs[1].jobParams['nproc'] = 4
+        self.jobRunner.useJobArrays = True
+        self.jobRunner.mpiRunCommand = "echo"
+        results = self.jobRunner.submitAndBlockSuite(mSuite,
+            maxRunTime=600, writeRecords=False)
+        self.assertEqual([res.modelName for res in results],
+            ["run0", "run1", "run2"])
+        # Array elements would all get the largest nproc, so each run
+        #  should be submitted separately, with its own nproc.
+        self.assertEqual(open(os.path.join(self.basedir, "count")).read(),
+            "3\n")
+        self.assertFalse(os.path.exists(os.path.join(self.basedir,
+            "output_array_3.pbs")))
+        for runI, nproc in enumerate([1, 4, 1]):
+            pbsScript = open(os.path.join(self.basedir,
+                "run%d_proc_%d.pbs" % (runI, nproc))).read()
+            self.assertTrue("#PBS -l nodes=%d\n" % nproc in pbsScript)
+            self.assertTrue("#PBS -l walltime=0:10:00\n" in pbsScript)
+        self.assertEqual(self._readQStatLog()[0],
+            ["1.fakeserver", "2.fakeserver", "3.fakeserver"])
+
     def test_blockResult(self):
         self.fail()
         # TODO: set up a fake PBS jobHandle
@@ -50,3 +50,6 @@ class SkeletonModelSuite(ModelSuite):
     def __init__(self):
         self.runs = []
         self.resultsList = []
+
+    def updateResultIndex(self, mResults=None):
+        print "updateResultIndex() called for ModelSuite."
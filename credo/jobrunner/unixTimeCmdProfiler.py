@@ -66,6 +66,7 @@ class UnixTimeCmdProfiler(PerformanceProfiler):
         #  e.g. units of memory, or time units. 
         resDict = getResDict(h.resFName)
         jobMetaInfo.performance[self.typeStr] = dict(resDict)
+        modelResult.markRecordStale()
 
 def getFmtString(fmtEls, fmtSpec=TIME_FMT_SPEC, fmtSep=TIME_FMT_SEP):
     """Return the format string to use, given a list of format elements,
@@ -33,9 +33,15 @@ import glob
 from xml.etree import ElementTree as etree
 
 from credo.io import stgfreq
+from credo.io import stgxml
 from credo.io.stgxml import writeXMLDoc
+from credo import utils
 from credo.analysis import fields
 
+# Attributes recording the state of a ModelResult's XML record, that don't
+#  make the record stale when set.
+_RECORD_STATE_ATTRS = ('_recordStamp', '_recordStale')
+
 class ModelResult:
     """A class to keep records about the results of a StgDomain/Underworld
      model run. These are normally produced as a result of running a
@@ -84,13 +90,36 @@ class ModelResult:
         self.fieldResults = []
         self.freqOutput = None
 
-    def readFrequentOutput(self):
+    def __setattr__(self, attrName, value):
+        self.__dict__[attrName] = value
+        if attrName not in _RECORD_STATE_ATTRS:
+            self.__dict__['_recordStale'] = True
+
+    def markRecordStale(self):
+        """Mark the XML record of this ModelResult as needing to be
+        re-written by :meth:`.writeRecordXML`. Setting any of its attributes,
+        or :meth:`.recordFieldResult`, does this automatically, but this
+        needs to be called after changing one in place, e.g. the
+        performance info of its :attr:`.jobMetaInfo`."""
+        self._recordStale = True
+
+    def readFrequentOutput(self, columnar=False, lazy=False,
+            useCache=False):
         """Opens and reads in info from the Frequent Output file produced
         as part of the run, and saves to the attribute :attr:`.freqOutput`.
 
+        :keyword columnar: if True, store the records in columnar form
+          (requires numpy, recommended for long runs).
+        :keyword lazy: if True, look up individual timesteps by seeking
+          to them in the file, rather than reading in all records.
+        :keyword useCache: if True, save the parsed records to a binary
+          cache file next to the FrequentOutput file, and re-use it on
+          later reads (requires numpy).
+
         .. seealso: :class:`credo.io.stgfreq.FreqOutput` for info on how to
            use this attribute once created."""
-        self.freqOutput = stgfreq.FreqOutput(self.outputPath)    
+        self.freqOutput = stgfreq.FreqOutput(self.outputPath,
+            columnar=columnar, lazy=lazy, useCache=useCache)
 
     # TODO: is this function still appropriate?
     def recordFieldResult(self, fieldName, tol, errors):
@@ -99,6 +128,7 @@ class ModelResult:
          to the just-added FieldResult.'''
         fieldResult = fields.FieldComparisonResult(fieldName, errors)
         self.fieldResults.append(fieldResult)
+        self.markRecordStale()
         return fieldResult
     
     def defaultRecordFilename(self):
@@ -107,11 +137,19 @@ class ModelResult:
         return 'ModelResult-' + self.modelName + '.xml'
 
     def writeRecordXML(self, outputDir="", filename="", prettyPrint=True):
-        """Write an XML record of a :class:`.ModelResult`."""
+        """Write an XML record of a :class:`.ModelResult`. If the record is
+        unchanged since this ModelResult last wrote it, the file isn't
+        re-written - and if the ModelResult hasn't been changed since either
+        (see :meth:`.markRecordStale`), the record isn't even re-generated."""
         if filename == "":
             filename = self.defaultRecordFilename()
         if outputDir == "":
             outputDir = self.outputPath
+        fullPath = os.path.join(outputDir, filename)
+        recordStamp = getattr(self, '_recordStamp', None)
+        if not getattr(self, '_recordStale', True) \
+                and stgxml.isFileUnchangedSince(fullPath, recordStamp):
+            return fullPath
 
         # Write extra model results, e.g.
         # create model file
@@ -129,10 +167,9 @@ class ModelResult:
 
         # Write the files
         if not os.path.exists(outputDir): os.makedirs(outputDir)
-        fullPath = os.path.join(outputDir, filename)
-        outFile = open(fullPath, 'w')
-        writeXMLDoc(xmlDoc, outFile, prettyPrint)
-        outFile.close()
+        self._recordStamp = stgxml.writeXMLDocToFile(xmlDoc, fullPath,
+            prettyPrint, recordStamp)
+        self._recordStale = False
         return fullPath
 
     def readFromRecordXML(self, xmlFilename):
@@ -146,6 +183,15 @@ class ModelResult:
         #TODO: temporarily put import in here to avoid cyclic import
         import credo.jobrunner
         self.jobMetaInfo = credo.jobrunner.readJobMetaInfoFromXMLNode(jmiNode)
+        self.fieldResults = []
+        frNodes = root.find(fields.FieldComparisonResult.XML_INFO_LIST_TAG)
+        if frNodes is not None:
+            for frNode in frNodes.findall(
+                    fields.FieldComparisonResult.XML_INFO_TAG):
+                dofErrors = [drNode.attrib['error'] for drNode in
+                    frNode.findall('dofResult')]
+                self.fieldResults.append(fields.FieldComparisonResult(
+                    frNode.attrib['fieldName'], dofErrors))
         # TODO: here we would also read analysisOp results, if they were
         #  being recorded.
 
@@ -159,6 +205,42 @@ def readModelResultFromPath(path):
     mRes.readFromRecordXML(recordFile)
     return mRes
 
+def readModelResultsFromPaths(paths, numWorkers=None):
+    """Read the ModelResults recorded in each of a list of paths (see
+    :func:`.readModelResultFromPath`), using several threads at once (see
+    :func:`credo.utils.parallelMap` for the meaning of `numWorkers`, and how
+    errors are reported). Returns the list of results, in the same order as
+    the paths."""
+    return utils.parallelMap(readModelResultFromPath, paths, numWorkers)
+
+def readFrequentOutputs(mResults, numWorkers=None, useProcesses=False,
+        columnar=False, lazy=False, useCache=False):
+    """Read in the Frequent Output file of each of a list of ModelResults,
+    as per :meth:`ModelResult.readFrequentOutput` (with the same keyword
+    args), but concurrently, using `numWorkers` threads - or processes, if
+    `useProcesses` is True, which is faster for parsing large files.
+
+    Unlike :meth:`ModelResult.readFrequentOutput`, each file's records are
+    read (or, if `lazy`, indexed) straight away.
+
+    .. seealso:: :func:`credo.utils.parallelMap`."""
+    readArgs = [(mRes.outputPath, columnar, lazy, useCache)
+        for mRes in mResults]
+    freqOutputs = utils.parallelMap(_readFreqOutput, readArgs, numWorkers,
+        useProcesses)
+    for mRes, freqOutput in zip(mResults, freqOutputs):
+        mRes.freqOutput = freqOutput
+
+def _readFreqOutput(readArgs):
+    outputPath, columnar, lazy, useCache = readArgs
+    freqOutput = stgfreq.FreqOutput(outputPath, columnar=columnar, lazy=lazy,
+        useCache=useCache)
+    if lazy:
+        freqOutput.buildIndex()
+    else:
+        freqOutput.populateFromFile()
+    return freqOutput
+
 #####
 
 def getSimInfoFromFreqOutput(outputPath):
@@ -167,8 +249,8 @@ def getSimInfoFromFreqOutput(outputPath):
     
     .. seealso:: :mod:`credo.io.stgfreq`."""
 
-    freqOut = stgfreq.FreqOutput(path=outputPath)
-    freqOut.populateFromFile()
+    # Only the final step is needed, so no need to read the whole file.
+    freqOut = stgfreq.FreqOutput(path=outputPath, lazy=True)
     recordDict = freqOut.getRecordDictAtStep(freqOut.finalStep())
     tSteps = freqOut.finalStep()
     try:
@@ -33,8 +33,8 @@ import os, sys
 from datetime import timedelta
 import shutil
 import inspect
+import tempfile
 from xml.etree import ElementTree as etree
-from credo.io.stgxml import writeXMLDoc
 import credo.modelresult
 from credo.io import stgxml
 from credo.io import stgpath
@@ -54,6 +54,10 @@ DEF_NPROC = 1
 DEF_MAX_RUN_TIME = None
 DEF_POLL_INTERVAL = 1
 
+# Attributes recording the state of a ModelRun's XML record, that don't make
+#  the record stale when set.
+_RECORD_STATE_ATTRS = ('_recordStamp', '_recordStale')
+
 class ModelRun:
     """A class to keep records about a StgDomain/Underworld Model Run,
     including access to the underlying XML of the actual model.
@@ -222,6 +226,18 @@ class ModelRun:
         self.cpFields = []
         self.analysisXML = None
 
+    def __setattr__(self, attrName, value):
+        self.__dict__[attrName] = value
+        if attrName not in _RECORD_STATE_ATTRS:
+            self.__dict__['_recordStale'] = True
+
+    def markRecordStale(self):
+        """Mark the XML record of this ModelRun as needing to be re-written
+        by :meth:`.writeInfoXML`. Setting any of its attributes does this
+        automatically, but this needs to be called after changing one in
+        place, e.g. adding an entry to :attr:`.paramOverrides`."""
+        self._recordStale = True
+
     def checkValidRunConfig(self):
         """Check the given modelRun is valid and ready to be run."""
         stgpath.checkAllXMLInputFilesExist(self.modelInputFiles)
@@ -373,12 +389,22 @@ class ModelRun:
         
         `writePath` and `filename` can be specified, if not they will use
         default values (the outputPath of the model, and the value returned by
-        :attr:`defaultModelRunFilename()`, respectively)."""    
+        :attr:`defaultModelRunFilename()`, respectively).
+        
+        If the record is unchanged since this ModelRun last wrote it, the file
+        isn't re-written - and if the ModelRun hasn't been changed since
+        either (see :meth:`.markRecordStale`), the record isn't even
+        re-generated."""    
         if filename == "":
             filename = self.defaultModelRunFilename()
         if writePath == "":
             writePath=os.path.join(self.basePath, self.outputPath)
         writePath+=os.sep
+        recordStamp = getattr(self, '_recordStamp', None)
+        if not getattr(self, '_recordStale', True) \
+                and stgxml.isFileUnchangedSince(writePath+filename,
+                    recordStamp):
+            return writePath+filename
 
         # create XML document
         root = etree.Element('StgModelRun')
@@ -415,9 +441,9 @@ class ModelRun:
         # Write the file
         if not os.path.exists(writePath):
             os.makedirs(writePath)
-        outFile = open(writePath+filename, 'w')
-        writeXMLDoc(xmlDoc, outFile, prettyPrint)
-        outFile.close()
+        self._recordStamp = stgxml.writeXMLDocToFile(xmlDoc,
+            writePath+filename, prettyPrint, recordStamp)
+        self._recordStale = False
         return writePath+filename
 
     def analysisXMLGen(self, filename=None):
@@ -439,6 +465,21 @@ class ModelRun:
            the user can over-ride particular parameters in the ModelRun via the
            command line by setting the self.paramOverrides member dictionary.
         """ 
+        xmlDoc = self.analysisXMLDoc()
+        if filename is None:
+            #By default, store this file in the output path.
+            absOutputPath = os.path.join(self.basePath, self.outputPath)
+            if not os.path.exists(absOutputPath):
+                os.makedirs(absOutputPath)
+            filename = os.path.join(absOutputPath,
+                CREDO_ANALYSIS_RECORD_FILENAME)
+        stgxml.writeStgDataDocToFile(xmlDoc, filename)
+        self.analysisXML = filename
+        return filename
+
+    def analysisXMLDoc(self):
+        """Returns the XML doc written by :meth:`.analysisXMLGen`, without
+        writing it to a file."""
         xmlDoc, root = stgxml.createNewStgDataDoc()
         # Write key entries:
         stgxml.writeParam(root, 'outputPath', self.outputPath, mt='replace')
@@ -456,17 +497,7 @@ class ModelRun:
             # models in use may have a minimum set of fields to checkpoint.
             stgxml.writeParamList(root, 'FieldVariablesToCheckpoint',
                 self.cpFields, mt='merge')
-
-        if filename is None:
-            #By default, store this file in the output path.
-            absOutputPath = os.path.join(self.basePath, self.outputPath)
-            if not os.path.exists(absOutputPath):
-                os.makedirs(absOutputPath)
-            filename = os.path.join(absOutputPath,
-                CREDO_ANALYSIS_RECORD_FILENAME)
-        stgxml.writeStgDataDocToFile(xmlDoc, filename)
-        self.analysisXML = filename
-        return filename
+        return xmlDoc
     
     def genFlattenedXML(self, cmdLineOverrides=None, flatFilename=None):
         self.analysisXMLGen()
@@ -661,8 +692,19 @@ class SimParams:
         set of input files'''
         absInputFiles = stgpath.convertLocalXMLFilesToAbsPaths(
             inputFilesList, basePath)
-        ffile=stgxml.createFlattenedXML(absInputFiles, cmdLineOverrides)
-        xmlDoc = etree.parse(ffile)
+        if stgxml.DEFAULT_FLATTEN_BACKEND == 'FlattenXML':
+            # Only a few params needed, so stream these from the flattened
+            # file rather than parsing it all in.
+            fd, flatFilename = tempfile.mkstemp(suffix=".xml")
+            os.close(fd)
+            try:
+                stgxml.createFlattenedXML(absInputFiles, cmdLineOverrides,
+                    flatFilename)
+                self.readFromFlattenedXML(flatFilename)
+            finally:
+                os.remove(flatFilename)
+            return
+        xmlDoc = stgxml.getFlattenedXMLDoc(absInputFiles, cmdLineOverrides)
         stgRoot = xmlDoc.getroot()
         for param, stgParam in self.stgParamInfos.iteritems():
             # some of these may be none, but is ok since will check below
@@ -671,7 +713,20 @@ class SimParams:
             self.setParam(param, val)
 
         self.checkValidParams()
-        os.remove(ffile)
+
+    def readFromFlattenedXML(self, flatFilename):
+        '''Reads all the parameters of this class from an already flattened
+        StGermain XML file (e.g. as saved in a model's output directory),
+        reading only as much of the file as needed.'''
+        paramCasts = dict([(stgParam.stgName, stgParam.pType) for stgParam
+            in self.stgParamInfos.itervalues()])
+        paramVals = stgxml.getParamValuesFromStgXMLFile(flatFilename,
+            paramCasts)
+        for param, stgParam in self.stgParamInfos.iteritems():
+            # some of these may be none, but is ok since will check below
+            self.setParam(param, paramVals[stgParam.stgName])
+
+        self.checkValidParams()
 
 # Stuff for managing a paramOverrides list
 # TODO: as a class, sub-classing dict?
@@ -43,6 +43,7 @@ import csv
 import credo
 from credo import modelrun as mrun
 from credo import modelresult as mres
+from credo import resultindex
 
 # The below is for Python 2.5 compatibility
 try:
@@ -71,7 +72,8 @@ class ModelVariant:
        over. E.g. [0,1,2], or [5.6, 7.8, 9.9]. Needs to be of the correct
        type for the particular parameter. The Python 
        `range() <http://docs.python.org/library/functions.html#range>`_
-       function can be useful in generating such a list."""
+       function can be useful in generating such a list.
+    """
 
     def __init__(self, paramRange):
         self.paramRange = paramRange
@@ -111,6 +113,7 @@ class StgXMLVariant(ModelVariant):
        "components.initialConditionsShape.startX" would override the
        startX parameter, within the initialConditionsShape component.
     """   
+
     def __init__(self, paramPath, paramRange):
         ModelVariant.__init__(self, paramRange)
         self.paramPath = paramPath
@@ -119,6 +122,7 @@ class StgXMLVariant(ModelVariant):
         """Apply the ii-th value in the attr:`.paramRange` to a particular
         :class:`~credo.modelrun.ModelRun`."""
         modelRun.paramOverrides[self.paramPath] = self.paramRange[ii]
+        modelRun.markRecordStale()
     
     def cmdLineStr(self, ii):
         """Return the command-line string to apply this value."""
@@ -132,6 +136,7 @@ class JobParamVariant(ModelVariant):
     
        string name of parameter you wish to vary (eg "nproc").
     """   
+
     def __init__(self, jobParam, paramRange):
         ModelVariant.__init__(self, paramRange)
         self.jobParam = jobParam
@@ -140,6 +145,7 @@ class JobParamVariant(ModelVariant):
         """Apply the ii-th value in the attr:`.paramRange` to a particular
         :class:`~credo.modelrun.ModelRun`."""
         modelRun.jobParams[self.jobParam] = self.paramRange[ii]
+        modelRun.markRecordStale()
     
     def cmdLineStr(self, ii):
         """Return the command-line string to apply this value."""
@@ -282,6 +288,141 @@ def getSubdir_RunIndexAndText(modelRun, modelVariants, paramIndices, runIndex):
     subPath = getSubdirTextParamVals(modelVariants, paramIndices)
     return "%.5d-%s" % (runIndex, subPath)
 
+class LazyRunList:
+    """A list of the :class:`~credo.modelrun.ModelRun` s of a parameter
+    sweep, as generated by :meth:`ModelSuite.generateRuns`, that only stores
+    the template run and the variant indices of each run. Each run is created
+    when first accessed (and then kept, so later changes to it are kept),
+    as a full copy of the template, just like when generating eagerly.
+
+    Supports indexing, iterating, :meth:`.append` (e.g. by
+    :meth:`ModelSuite.addRun`) and replacing runs, but isn't a real `list`:
+    other list methods, such as `insert` or `remove`, aren't available.
+    (Use `list(lazyRuns)` to get one, creating all runs.)"""
+
+    def __init__(self, templateMRun, modelVariants, indicesList,
+            subOutputPathGenFunc, outputPathBase):
+        self.templateMRun = templateMRun
+        self.modelVariants = modelVariants
+        self.indicesList = indicesList
+        self.subOutputPathGenFunc = subOutputPathGenFunc
+        self.outputPathBase = outputPathBase
+        self._runs = {}
+        self._subPaths = {}
+        self._extraRuns = []
+
+    def __len__(self):
+        return len(self.indicesList) + len(self._extraRuns)
+
+    def __iter__(self):
+        for runI in xrange(len(self)):
+            yield self[runI]
+
+    def __getitem__(self, runI):
+        if isinstance(runI, slice):
+            return [self[ii] for ii in xrange(*runI.indices(len(self)))]
+        runI = self._checkIndex(runI)
+        if runI >= len(self.indicesList):
+            return self._extraRuns[runI - len(self.indicesList)]
+        try:
+            return self._runs[runI]
+        except KeyError:
+            newMRun = self._createRun(runI)
+            self._runs[runI] = newMRun
+            return newMRun
+
+    def __setitem__(self, runI, modelRun):
+        runI = self._checkIndex(runI)
+        if runI >= len(self.indicesList):
+            self._extraRuns[runI - len(self.indicesList)] = modelRun
+        else:
+            # Its sub-path is still that of the generated run it replaces.
+            if runI not in self._subPaths:
+                self._createRun(runI)
+            self._runs[runI] = modelRun
+
+    def _checkIndex(self, runI):
+        if runI < 0: runI += len(self)
+        if not 0 <= runI < len(self):
+            raise IndexError("run index %d out of range" % runI)
+        return runI
+
+    def append(self, modelRun):
+        """Add a ModelRun to the end of the list."""
+        self._extraRuns.append(modelRun)
+
+    def index(self, modelRun):
+        """Returns the index of the given ModelRun in the list."""
+        for runI, listRun in enumerate(self):
+            if listRun is modelRun: return runI
+        raise ValueError("ModelRun not in list")
+
+    def numCreated(self):
+        """Returns the number of generated runs that have been created so
+        far."""
+        return len(self._runs)
+
+    def getSubPath(self, runI):
+        """Returns the output sub-path of the generated run runI (also used
+        as its description)."""
+        self[runI]
+        return self._subPaths[self._checkIndex(runI)]
+
+    def _createRun(self, runI):
+        paramIndices = self.indicesList[runI]
+        newMRun = copy.deepcopy(self.templateMRun)
+        # Now, apply each variant to it as appropriate
+        for varI, modelVar in enumerate(self.modelVariants.itervalues()):
+            modelVar.applyToModel(newMRun, paramIndices[varI])
+        subPath = self.subOutputPathGenFunc(newMRun, self.modelVariants,
+            paramIndices, runI)
+        newMRun.name += "-%s" % (subPath)
+        newMRun.outputPath = os.path.join(self.outputPathBase, subPath)
+        newMRun.logPath = os.path.join(self.outputPathBase, subPath)
+        self._subPaths[runI] = subPath
+        return newMRun
+
+
+class _LazyRunDescripList:
+    """The descriptions of the runs in a :class:`.LazyRunList` (i.e. their
+    output sub-paths), which can also be appended to or replaced."""
+
+    def __init__(self, lazyRuns):
+        self.lazyRuns = lazyRuns
+        self._descrips = {}
+        self._extraDescrips = []
+
+    def __len__(self):
+        return len(self.lazyRuns.indicesList) + len(self._extraDescrips)
+
+    def __iter__(self):
+        for runI in xrange(len(self)):
+            yield self[runI]
+
+    def __getitem__(self, runI):
+        if isinstance(runI, slice):
+            return [self[ii] for ii in xrange(*runI.indices(len(self)))]
+        if runI < 0: runI += len(self)
+        numGenerated = len(self.lazyRuns.indicesList)
+        if runI >= numGenerated:
+            return self._extraDescrips[runI - numGenerated]
+        try:
+            return self._descrips[runI]
+        except KeyError:
+            return self.lazyRuns.getSubPath(runI)
+
+    def __setitem__(self, runI, descrip):
+        if runI < 0: runI += len(self)
+        numGenerated = len(self.lazyRuns.indicesList)
+        if runI >= numGenerated:
+            self._extraDescrips[runI - numGenerated] = descrip
+        else:
+            self._descrips[runI] = descrip
+
+    def append(self, descrip):
+        self._extraDescrips.append(descrip)
+
+
 class ModelSuite:
     '''A class for running a suite of Models (e.g. a group for profiling,
     or a System Test that requires multiple runs).
@@ -438,7 +579,7 @@ class ModelSuite:
         template run. See :attr:`.modelVariants`."""
         self.modelVariants[name] = modelVariant
 
-    def generateRuns(self, iterGen=product):        
+    def generateRuns(self, iterGen=product, lazy=False):        
         """When using a template modelRun, will generate runs for the suite
         based on it. The generated runs are saved to 
         the :attr:`.runs` attribute ready to be run using :meth:`.runAll`.
@@ -451,20 +592,37 @@ class ModelSuite:
           "zip" style can be achieved using the itertools.izip iterator
           generating function.
           See the Python :mod:`itertools` module for more.
+        :keyword lazy: if True, :attr:`.runs` is set to a
+          :class:`.LazyRunList`, which only creates each run when it's
+          accessed (useful for large sweeps). Otherwise (the default),
+          all runs are created immediately, as a list.
         """
 
         assert self.templateMRun
 
         # Save the strategy passed in.
         self.iterGen = iterGen
-        # Empty the "runs", in case it has values in there already
-        self.runs = []
 
         # Strategy used below is instead of iterating directly over the 
         # parameters we are applying to each run, create indices into the
         # modelVariants lists to work out which to apply for each run.
         indexIterator = getVariantIndicesIter(self.modelVariants, self.iterGen)
 
+        if lazy:
+            # Copy the template and variants, so later changes to them don't
+            # affect runs not yet created.
+            self.runs = LazyRunList(copy.deepcopy(self.templateMRun),
+                copy.deepcopy(self.modelVariants), list(indexIterator),
+                self.subOutputPathGenFunc, self.outputPathBase)
+            self.runDescrips = _LazyRunDescripList(self.runs)
+            self.runCustomOptSets = [None] * len(self.runs)
+            return
+
+        # Empty the "runs", in case it has values in there already
+        self.runs = []
+        self.runDescrips = []
+        self.runCustomOptSets = []
+
         for runI, paramIndices in enumerate(indexIterator):
             # First create a copy of the template model run
             newMRun = copy.deepcopy(self.templateMRun)
@@ -488,9 +646,44 @@ class ModelSuite:
 
     def writeAllModelResultXMLs(self):
         """Save an XML record of each ModelResult currently in
-        :attr:`.resultsList`."""
+        :attr:`.resultsList`, and add them to the suite's result index (see
+        :meth:`.updateResultIndex`)."""
         for runI, mResult in enumerate(self.resultsList):
             mResult.writeRecordXML()
+        self.updateResultIndex()
+
+    def readAllFrequentOutputs(self, numWorkers=None, useProcesses=False,
+            **readKWs):
+        """Read in the Frequent Output file of each ModelResult in
+        :attr:`.resultsList` concurrently, using numWorkers threads or
+        processes. See :func:`credo.modelresult.readFrequentOutputs`."""
+        mres.readFrequentOutputs(self.resultsList, numWorkers, useProcesses,
+            **readKWs)
+
+    def resultIndexFilename(self, basePath=None):
+        """Returns the filename of the suite's result index (see
+        :mod:`credo.resultindex`), in its output directory off basePath (by
+        default, the basePath of the suite's runs)."""
+        if basePath is None:
+            basePath = self.runs[0].basePath
+        return os.path.join(basePath, self.outputPathBase,
+            resultindex.RESULT_INDEX_FILENAME)
+
+    def updateResultIndex(self, mResults=None):
+        """Add the suite's runs, and the given ModelResults (by default,
+        :attr:`.resultsList`), whose XML records should already be written,
+        to the suite's result index - so they can be read more quickly by
+        :meth:`.readResultsFromPath`. Does nothing if the :mod:`sqlite3`
+        module isn't available."""
+        if not resultindex.HAVE_SQLITE or len(self.runs) == 0: return
+        if mResults is None:
+            mResults = self.resultsList
+        resIndex = resultindex.ResultIndex(self.resultIndexFilename())
+        try:
+            resIndex.addRuns(self.runs)
+            resIndex.addResults(mResults)
+        finally:
+            resIndex.close()
     
     def getCustomOpts(self, runI, extraCmdLineOpts):
         """Get the custom opts (as a string) to apply for modelRun runI."""
@@ -503,18 +696,26 @@ class ModelSuite:
         return customOpts    
 
     def readResultsFromPath(self, basePath, overrideOutputPath=None,
-            checkAllPresent=True):
+            checkAllPresent=True, useIndex=True, numWorkers=None):
         """Read the results generated for a given ModelSuite located off the 
         given basePath where the suite was run, and return the list of results.
 
         This will ignore results in the directory not related to this suite.
 
+        If the suite's result index (see :meth:`.updateResultIndex`) is
+        present in the output directory, and has results for all the suite's
+        runs, results are read from it. Otherwise, each result directory in
+        the output directory is read, and the index re-created.
+
         :arg overrideOutputPath: if specified, this path overrides the default
           outputPath of the suite itself to search for the results.
           (I.e. useful if you are reading from a previous suite with different
           output path.)
         :arg checkAllPresent: if True this will check that all runs expected
           for the suite were found in the list of results.
+        :arg useIndex: if False, don't read or update the result index.
+        :arg numWorkers: number of threads to read result XMLs with, if
+          not using the index (see :func:`.getModelResultsArray`).
 
         .. note:
            Currently this just relies on model result names for the suite
@@ -525,6 +726,19 @@ class ModelSuite:
             outputPathBase = overrideOutputPath
         else:
             outputPathBase = self.outputPathBase
+        runIndices = dict((mRun.name, runI) for runI, mRun in
+            enumerate(self.runs))
+        useIndex = useIndex and resultindex.HAVE_SQLITE
+        indexFilename = os.path.join(basePath, outputPathBase,
+            resultindex.RESULT_INDEX_FILENAME)
+        if useIndex and os.path.exists(indexFilename):
+            resIndex = resultindex.ResultIndex(indexFilename)
+            try:
+                indexedResults = resIndex.getResults(runIndices.keys())
+            finally:
+                resIndex.close()
+            if len(indexedResults) == len(runIndices):
+                return [indexedResults[mRun.name] for mRun in self.runs]
         # First read all results
         # TODO: passing in the 'name' below is hacky:- really should be 
         #  reading this in from model result XMLs
@@ -533,11 +747,11 @@ class ModelSuite:
         else:
             baseName = None
         readResults = getModelResultsArray(baseName,
-            os.path.join(basePath, outputPathBase))
+            os.path.join(basePath, outputPathBase), numWorkers)
         # Now check through, and build a new list only contained in this index
         sResults = []
         for result in readResults:
-            runIndex = self.getRunIndex(result.modelName)
+            runIndex = runIndices.get(result.modelName)
             if runIndex == None: continue
             else:
                 sResults.append((runIndex, result))
@@ -546,10 +760,11 @@ class ModelSuite:
         for runIndex, result in sResults:
             mResults[runIndex] = result
         # Finally, check each run in the suite is present in the returned list
+        resultNames = [res.modelName for res in mResults if res is not None]
         if checkAllPresent:
-            resultNames = [res.modelName for res in mResults]
+            resultNameSet = set(resultNames)
             for runI, mRun in enumerate(self.runs):
-                if mRun.name not in resultNames:
+                if mRun.name not in resultNameSet:
                     raise ModelResultNotExistError("Error, given basePath"\
                         " for reading model"\
                         " results from, %s, with output path %s, is missing"\
@@ -557,6 +772,14 @@ class ModelSuite:
                         "\n(names read are %s)." %\
                         (basePath, outputPathBase, mRun.name, runI,
                          resultNames))
+        if useIndex:
+            resIndex = resultindex.ResultIndex(indexFilename)
+            try:
+                resIndex.addRuns(self.runs)
+                resIndex.addResults([res for res in mResults
+                    if res is not None])
+            finally:
+                resIndex.close()
         return mResults  
             
 # TODO: here perhaps would be where we have tools to generate stats/plots
@@ -588,27 +811,19 @@ def writeInputsOutputsToCSV(mSuite, observablesDict, fname):
         wtr.writerow(sortedValues + list(observs))
     target.close()
 
-def getModelResultsArray(baseName, baseDir):
+def getModelResultsArray(baseName, baseDir, numWorkers=None):
     """Post-processing: given a base model name and base output directory,
     search this directory for model results, and read into a list of
-    :class:`~credo.modelresult.ModelResult` . 
+    :class:`~credo.modelresult.ModelResult` (in order of sub-directory name).
+    The results are read concurrently, using numWorkers threads (see
+    :func:`credo.modelresult.readModelResultsFromPaths`).
 
     .. note:: Needs more checking added, and ability to recover metadata
        about the ModelRuns.
     """
-    modelResults = []
-    for fName in os.listdir(baseDir):
+    resultPaths = []
+    for fName in sorted(os.listdir(baseDir)):
         fullPath = os.path.join(baseDir, fName)
         if os.path.isdir(os.path.join(baseDir, fName)):
-            dirName = fName
-            if baseName == None:
-                modelName = dirName
-            else:    
-                modelName = "%s-%s" % (baseName, dirName)
-            mResult = mres.readModelResultFromPath(fullPath)
-            #ModelResult(modelName, fullPath)
-            # TODO: When func ready, search for an XML file containing
-            #  job meta info, and attach here
-            # mResult.jobMetaInfo = ...
-            modelResults.append(mResult)
-    return modelResults
+            resultPaths.append(fullPath)
+    return mres.readModelResultsFromPaths(resultPaths, numWorkers)
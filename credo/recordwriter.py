@@ -0,0 +1,182 @@
+##  Copyright (C), 2010, Monash University
+##  Copyright (C), 2010, Victorian Partnership for Advanced Computing (VPAC)
+##  
+##  This file is part of the CREDO library.
+##  Developed as part of the Simulation, Analysis, Modelling program of 
+##  AuScope Limited, and funded by the Australian Federal Government's
+##  National Collaborative Research Infrastructure Strategy (NCRIS) program.
+##
+##  This library is free software; you can redistribute it and/or
+##  modify it under the terms of the GNU Lesser General Public
+##  License as published by the Free Software Foundation; either
+##  version 2.1 of the License, or (at your option) any later version.
+##
+##  This library is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##  Lesser General Public License for more details.
+##
+##  You should have received a copy of the GNU Lesser General Public
+##  License along with this library; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+##  MA  02110-1301  USA
+
+"""This module manages writing the XML records of
+:class:`~credo.modelrun.ModelRun` s and
+:class:`~credo.modelresult.ModelResult` s in batches, so that each record is
+written once however many times it's requested, e.g. while submitting a
+whole :class:`~credo.modelsuite.ModelSuite`.
+
+The key class in this module is the :class:`.RecordWriter`. (Individual
+records also aren't re-written if unchanged since last written, see
+:func:`credo.io.stgxml.writeXMLDocToFile`.)"""
+
+import threading
+
+class RecordWriter:
+    """Collects objects whose XML records need to be written - i.e.
+    :class:`~credo.modelrun.ModelRun` s (using their `writeInfoXML()`
+    method) and :class:`~credo.modelresult.ModelResult` s (using
+    `writeRecordXML()`) - and writes each record once when :meth:`.flush` is
+    called, however many times it was added since the last flush.
+
+    If `background` is True, records are instead written by a separate
+    thread as soon as possible after being added. :meth:`.flush` then waits
+    until all added records are written. Call :meth:`.close` when done, to
+    stop the thread.
+
+    .. attribute:: writes
+
+       Number of records written so far.
+
+    .. attribute:: merged
+
+       Number of times a record was added that was already waiting to be
+       written (so didn't need writing again).
+    """
+
+    def __init__(self, background=False):
+        self.writes = 0
+        self.merged = 0
+        self._pending = []
+        self._pendingIDs = {}
+        self._writing = 0
+        self._errors = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._writeLoop,
+                name="CREDO-RecordWriter")
+            self._thread.setDaemon(True)
+            self._thread.start()
+
+    def add(self, recordObj):
+        """Add recordObj to the records to be written."""
+        self._cond.acquire()
+        try:
+            if self._closed:
+                raise ValueError("Error, RecordWriter already closed.")
+            if id(recordObj) in self._pendingIDs:
+                self.merged += 1
+                return
+            self._pendingIDs[id(recordObj)] = recordObj
+            self._pending.append(recordObj)
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def addAll(self, recordObjs):
+        """Add each of the given objects to the records to be written."""
+        for recordObj in recordObjs:
+            self.add(recordObj)
+
+    def flush(self):
+        """Write all records added so far (or, if writing in the background,
+        wait until they have been written). If any records failed to be
+        written, raises the first error."""
+        if self._thread is None:
+            self._writePending()
+        else:
+            self._cond.acquire()
+            try:
+                while (self._pending or self._writing) and not self._errors:
+                    self._cond.wait()
+            finally:
+                self._cond.release()
+        self._raiseErrors()
+
+    def close(self):
+        """Flush all records, and stop the background thread if any."""
+        try:
+            self.flush()
+        finally:
+            self._cond.acquire()
+            try:
+                self._closed = True
+                self._cond.notifyAll()
+            finally:
+                self._cond.release()
+            if self._thread is not None:
+                self._thread.join()
+
+    def _takePending(self):
+        pending = self._pending
+        self._pending = []
+        self._pendingIDs = {}
+        return pending
+
+    def _writePending(self):
+        self._cond.acquire()
+        try:
+            pending = self._takePending()
+        finally:
+            self._cond.release()
+        for recordObj in pending:
+            _writeRecord(recordObj)
+            self.writes += 1
+
+    def _writeLoop(self):
+        while True:
+            self._cond.acquire()
+            try:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending: return
+                pending = self._takePending()
+                self._writing = len(pending)
+            finally:
+                self._cond.release()
+            for recordObj in pending:
+                error = None
+                try:
+                    _writeRecord(recordObj)
+                except Exception, e:
+                    error = e
+                self._cond.acquire()
+                try:
+                    if error is None:
+                        self.writes += 1
+                    else:
+                        self._errors.append(error)
+                    self._writing -= 1
+                    self._cond.notifyAll()
+                finally:
+                    self._cond.release()
+
+    def _raiseErrors(self):
+        self._cond.acquire()
+        try:
+            errors = self._errors
+            self._errors = []
+        finally:
+            self._cond.release()
+        if errors:
+            raise errors[0]
+
+def _writeRecord(recordObj):
+    """Write the XML record of a ModelRun or ModelResult."""
+    if hasattr(recordObj, 'writeRecordXML'):
+        recordObj.writeRecordXML()
+    else:
+        recordObj.writeInfoXML()
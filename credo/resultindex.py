@@ -0,0 +1,303 @@
+##  Copyright (C), 2010, Monash University
+##  Copyright (C), 2010, Victorian Partnership for Advanced Computing (VPAC)
+##
+##  This file is part of the CREDO library.
+##  Developed as part of the Simulation, Analysis, Modelling program of
+##  AuScope Limited, and funded by the Australian Federal Government's
+##  National Collaborative Research Infrastructure Strategy (NCRIS) program.
+##
+##  This library is free software; you can redistribute it and/or
+##  modify it under the terms of the GNU Lesser General Public
+##  License as published by the Free Software Foundation; either
+##  version 2.1 of the License, or (at your option) any later version.
+##
+##  This library is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##  Lesser General Public License for more details.
+##
+##  You should have received a copy of the GNU Lesser General Public
+##  License along with this library; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+##  MA  02110-1301  USA
+
+"""This module maintains an index (an SQLite database, stored in a
+:class:`~credo.modelsuite.ModelSuite` 's output directory) of the
+:class:`~credo.modelrun.ModelRun` s of a suite, and the
+:class:`~credo.modelresult.ModelResult` s they produced - including their
+JobMetaInfo performance data and field results.
+
+The index is updated as a suite's result records are written (see
+:meth:`credo.modelsuite.ModelSuite.updateResultIndex`), so that reading a
+suite's results back in (:meth:`credo.modelsuite.ModelSuite.readResultsFromPath`)
+is a query, rather than a scan of the output directory and a parse of every
+ModelResult XML.
+
+The key class in this module is the :class:`.ResultIndex`.
+
+.. note:: Requires the Python :mod:`sqlite3` module (part of the standard
+   library since Python 2.5, but may be left out of some builds). If it's not
+   available, :data:`.HAVE_SQLITE` is False, and suites fall back to reading
+   results from their XML records."""
+
+import os
+
+try:
+    import sqlite3
+    HAVE_SQLITE = True
+except ImportError:
+    HAVE_SQLITE = False
+
+from credo import modelresult as mres
+from credo.analysis import fields
+
+#: Default filename of the index, inside a suite's output directory.
+RESULT_INDEX_FILENAME = "credo-results.db"
+
+# Version of the schema below, stored in the database: indexes with other
+#  versions are re-created (their results re-read from the XML records).
+_SCHEMA_VERSION = 1
+
+_TABLES = ['runs', 'results', 'platform', 'performance', 'fieldResults']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    name TEXT PRIMARY KEY,
+    runIndex INTEGER,
+    outputPath TEXT,
+    nproc INTEGER,
+    paramOverrides TEXT);
+CREATE TABLE IF NOT EXISTS results (
+    modelName TEXT PRIMARY KEY,
+    outputPath TEXT,
+    recordFile TEXT,
+    recordMTime REAL,
+    recordSize INTEGER,
+    runType TEXT,
+    simtime);
+CREATE TABLE IF NOT EXISTS platform (
+    modelName TEXT,
+    key TEXT,
+    value TEXT,
+    PRIMARY KEY (modelName, key));
+CREATE TABLE IF NOT EXISTS performance (
+    modelName TEXT,
+    profType TEXT,
+    stat TEXT,
+    value REAL,
+    PRIMARY KEY (modelName, profType, stat));
+CREATE TABLE IF NOT EXISTS fieldResults (
+    modelName TEXT,
+    position INTEGER,
+    fieldName TEXT,
+    dofIndex INTEGER,
+    error REAL,
+    PRIMARY KEY (modelName, position, dofIndex));
+CREATE INDEX IF NOT EXISTS performanceByStat ON performance (profType, stat);
+"""
+
+# Tables with per-result entries, to clear when a result is re-indexed.
+_RESULT_DETAIL_TABLES = ['platform', 'performance', 'fieldResults']
+
+# Max model names to query at once (SQLite allows 999 parameters a query).
+_MAX_QUERY_NAMES = 500
+
+class ResultIndex:
+    """An index of the runs and results of a suite, stored in an SQLite
+    database file.
+
+    Changes are made in a single transaction per call of
+    :meth:`.addRuns` or :meth:`.addResults`, so prefer adding many at once.
+    Call :meth:`.close` when done.
+
+    .. attribute:: filename
+
+       The database filename. Result record filenames are stored relative
+       to its directory, so a suite's output directory can be moved.
+    """
+
+    def __init__(self, filename):
+        if not HAVE_SQLITE:
+            raise ImportError("Error, the Python sqlite3 module is required"\
+                " to use a ResultIndex.")
+        self.filename = filename
+        self.indexDir = os.path.dirname(os.path.abspath(filename))
+        if not os.path.exists(self.indexDir):
+            os.makedirs(self.indexDir)
+        self.conn = sqlite3.connect(filename)
+        self.conn.text_factory = str
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != _SCHEMA_VERSION:
+            for tableName in _TABLES:
+                self.conn.execute("DROP TABLE IF EXISTS %s" % tableName)
+            self.conn.execute("PRAGMA user_version = %d" % _SCHEMA_VERSION)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+    def addRuns(self, modelRuns):
+        """Add (or update) entries for the given
+        :class:`~credo.modelrun.ModelRun` s, indexed by their position in
+        the given list."""
+        rows = []
+        for runI, modelRun in enumerate(modelRuns):
+            rows.append((modelRun.name, runI, modelRun.outputPath,
+                modelRun.jobParams['nproc'],
+                repr(sorted(modelRun.paramOverrides.items()))))
+        self.conn.execute("DELETE FROM runs")
+        self.conn.executemany("INSERT OR REPLACE INTO runs VALUES"\
+            " (?,?,?,?,?)", rows)
+        self.conn.commit()
+
+    def getRunNames(self):
+        """Returns the names of the runs in the index, in order."""
+        cur = self.conn.execute("SELECT name FROM runs ORDER BY runIndex")
+        return [row[0] for row in cur]
+
+    def addResults(self, mResults):
+        """Add (or update) entries for the given
+        :class:`~credo.modelresult.ModelResult` s, which should already have
+        written their XML records to the default location (see
+        :meth:`credo.modelresult.ModelResult.writeRecordXML`)."""
+        try:
+            for mResult in mResults:
+                self._addResult(mResult)
+        except:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    def _addResult(self, mResult):
+        recordFile = os.path.join(mResult.outputPath,
+            mResult.defaultRecordFilename())
+        try:
+            recordStat = os.stat(recordFile)
+            recordMTime, recordSize = recordStat.st_mtime, recordStat.st_size
+        except OSError:
+            recordMTime, recordSize = None, None
+        jobMI = mResult.jobMetaInfo
+        if jobMI is not None:
+            runType, simtime = jobMI.runType, jobMI.simtime
+        else:
+            runType, simtime = None, None
+        modelName = mResult.modelName
+        self.conn.execute("INSERT OR REPLACE INTO results VALUES"\
+            " (?,?,?,?,?,?,?)", (modelName, mResult.outputPath,
+            self._relPath(recordFile), recordMTime, recordSize, runType,
+            simtime))
+        for tableName in _RESULT_DETAIL_TABLES:
+            self.conn.execute("DELETE FROM %s WHERE modelName=?" % tableName,
+                (modelName,))
+        if jobMI is not None:
+            self.conn.executemany("INSERT INTO platform VALUES (?,?,?)",
+                [(modelName, key, str(val)) for key, val in
+                    jobMI.platform.iteritems()])
+            perfRows = []
+            for profType, perfDict in jobMI.performance.iteritems():
+                for stat, value in perfDict.iteritems():
+                    perfRows.append((modelName, profType, stat, value))
+            self.conn.executemany("INSERT INTO performance VALUES"\
+                " (?,?,?,?)", perfRows)
+        fieldRows = []
+        for position, fieldResult in enumerate(mResult.fieldResults):
+            for dofI, error in enumerate(fieldResult.dofErrors):
+                fieldRows.append((modelName, position, fieldResult.fieldName,
+                    dofI, error))
+        self.conn.executemany("INSERT INTO fieldResults VALUES (?,?,?,?,?)",
+            fieldRows)
+
+    def _relPath(self, path):
+        return os.path.relpath(os.path.abspath(path), self.indexDir)
+
+    def getResults(self, modelNames, checkRecords=True):
+        """Returns a dictionary of the
+        :class:`~credo.modelresult.ModelResult` s in the index with any of
+        the given modelNames, keyed by model name (names not in the index
+        are left out).
+
+        The results have the same information as if read from their XML
+        records (see :meth:`credo.modelresult.ModelResult.readFromRecordXML`).
+
+        :keyword checkRecords: if True (default), check each result's XML
+          record hasn't changed since it was indexed (by its modification
+          time and size), and if it has, re-read it, and update the index.
+        """
+        mResults = {}
+        # Results re-read from their records, rather than the index.
+        reReadResults = {}
+        rows = self._selectByNames("SELECT * FROM results", modelNames)
+        for modelName, outputPath, recordFile, recordMTime, recordSize, \
+                runType, simtime in rows:
+            recordFile = os.path.join(self.indexDir, recordFile)
+            if checkRecords:
+                try:
+                    recordStat = os.stat(recordFile)
+                except OSError:
+                    # Record removed - so is the result.
+                    continue
+                if (recordStat.st_mtime, recordStat.st_size) \
+                        != (recordMTime, recordSize):
+                    mResult = mres.ModelResult("place", outputPath)
+                    mResult.readFromRecordXML(recordFile)
+                    self.addResults([mResult])
+                    reReadResults[modelName] = mResult
+                    continue
+            mResult = mres.ModelResult(modelName, outputPath)
+            if runType is not None:
+                #TODO: temporarily put import in here to avoid cyclic import
+                import credo.jobrunner
+                mResult.jobMetaInfo = \
+                    credo.jobrunner.jobMetaInfoFactoryCreate(runType)
+                mResult.jobMetaInfo.simtime = simtime
+            mResults[modelName] = mResult
+        self._readDetails(mResults)
+        mResults.update(reReadResults)
+        return mResults
+
+    def _selectByNames(self, query, modelNames, orderBy=""):
+        """Run the given SELECT query, restricted to rows whose modelName is
+        one of modelNames (in batches, if there are many), and return all
+        the rows."""
+        modelNames = list(modelNames)
+        rows = []
+        for startI in range(0, len(modelNames), _MAX_QUERY_NAMES):
+            batch = modelNames[startI:startI+_MAX_QUERY_NAMES]
+            cur = self.conn.execute("%s WHERE modelName IN (%s) %s" % (query,
+                ",".join(["?"] * len(batch)), orderBy), batch)
+            rows.extend(cur.fetchall())
+        return rows
+
+    def _readDetails(self, mResults):
+        for modelName, key, value in self._selectByNames(
+                "SELECT * FROM platform", mResults.keys()):
+            mResult = mResults.get(modelName)
+            if mResult is not None and mResult.jobMetaInfo is not None:
+                mResult.jobMetaInfo.platform[key] = value
+        for modelName, profType, stat, value in self._selectByNames(
+                "SELECT * FROM performance", mResults.keys()):
+            mResult = mResults.get(modelName)
+            if mResult is not None and mResult.jobMetaInfo is not None:
+                perfDict = mResult.jobMetaInfo.performance.setdefault(
+                    profType, {})
+                perfDict[stat] = value
+        # Rows are ordered, so each result's field results are added in the
+        #  order they were recorded.
+        lastField = None
+        for modelName, position, fieldName, dofI, error in \
+                self._selectByNames("SELECT * FROM fieldResults",
+                mResults.keys(), "ORDER BY modelName, position, dofIndex"):
+            if (modelName, position) != lastField:
+                fieldResult = fields.FieldComparisonResult(fieldName, [])
+                mResults[modelName].fieldResults.append(fieldResult)
+                lastField = (modelName, position)
+            fieldResult.dofErrors.append(error)
+
+    def getPerformance(self, profType, stat):
+        """Returns a dictionary of the value of a particular performance
+        statistic (e.g. profType "CREDO", stat "walltime") for each result
+        in the index that recorded it, keyed by model name."""
+        cur = self.conn.execute("SELECT modelName, value FROM performance"\
+            " WHERE profType=? AND stat=?", (profType, stat))
+        return dict(cur.fetchall())
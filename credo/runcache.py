@@ -0,0 +1,141 @@
+##  Copyright (C), 2010, Monash University
+##  Copyright (C), 2010, Victorian Partnership for Advanced Computing (VPAC)
+##
+##  This file is part of the CREDO library.
+##  Developed as part of the Simulation, Analysis, Modelling program of
+##  AuScope Limited, and funded by the Australian Federal Government's
+##  National Collaborative Research Infrastructure Strategy (NCRIS) program.
+##
+##  This library is free software; you can redistribute it and/or
+##  modify it under the terms of the GNU Lesser General Public
+##  License as published by the Free Software Foundation; either
+##  version 2.1 of the License, or (at your option) any later version.
+##
+##  This library is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##  Lesser General Public License for more details.
+##
+##  You should have received a copy of the GNU Lesser General Public
+##  License along with this library; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+##  MA  02110-1301  USA
+
+
+"""This module allows re-using the results of
+:class:`~credo.modelrun.ModelRun` s that have already been run successfully
+with exactly the same configuration, rather than running them again - e.g.
+when re-running a parameter sweep suite after changing one of its variants
+(see the `reuseResults` option of :meth:`credo.jobrunner.api.JobRunner.runSuite`).
+
+A run's configuration is summarised by a hash (see :func:`.getRunHash`),
+which is saved in its output directory (in :data:`.RUN_HASH_FILENAME`)
+once it has run successfully and its ModelResult record has been written.
+"""
+
+import os
+import hashlib
+from cStringIO import StringIO
+
+from credo import modelresult as mres
+from credo.io import stgxml
+from credo.io import stgflatten
+
+#: Name of the file a run's configuration hash is saved to, in its output
+#: directory.
+RUN_HASH_FILENAME = "credo-runHash.txt"
+
+#: Environment variable which, if set to 1, makes JobRunners re-use
+#: results by default.
+REUSE_RESULTS_ENVKEY = "CREDO_REUSE_RESULTS"
+
+# Increase if what is hashed changes, to invalidate old hashes.
+_HASH_VERSION = "1"
+
+def reuseResultsDefault():
+    """Returns whether results should be re-used by default (see
+    :data:`.REUSE_RESULTS_ENVKEY`)."""
+    return os.environ.get(REUSE_RESULTS_ENVKEY, "0") == "1"
+
+def getRunHash(modelRun, extraCmdLineOpts=None):
+    """Returns a hash (as a hex string) of everything that determines the
+    results of running the given ModelRun: the contents of its input XML
+    files (including any files they include), the analysis XML generated
+    for it (which includes its :class:`~credo.modelrun.SimParams`, analysis
+    operations and output path), its paramOverrides, the contents of its
+    solver options file, its number of processors, any extra command line
+    options, and the identity (path, size and modification time) of the
+    executable that will run it.
+
+    Returns None if the run's input files or executable can't be found - in
+    which case it can't be re-used."""
+    runHash = hashlib.sha1(_HASH_VERSION)
+    startDir = os.getcwd()
+    os.chdir(modelRun.basePath)
+    try:
+        try:
+            deps = stgflatten.flattenCache.getDependencies(
+                modelRun.modelInputFiles)
+            exePath = modelRun.getModelRunAppExeCommand()
+            exeStat = os.stat(exePath)
+        except (EnvironmentError, ValueError):
+            return None
+        for filename, contentsHash in deps:
+            runHash.update("\0%s\0%s" % (filename, contentsHash))
+        runHash.update("\0%s\0%d\0%d" % (os.path.abspath(exePath),
+            exeStat.st_size, exeStat.st_mtime))
+        analysisXML = StringIO()
+        stgxml.writeXMLDoc(modelRun.analysisXMLDoc(), analysisXML)
+        runHash.update("\0" + analysisXML.getvalue())
+        runHash.update("\0" + repr(sorted(modelRun.paramOverrides.items())))
+        if modelRun.solverOpts:
+            runHash.update("\0" + stgflatten.flattenCache.fileHash(
+                os.path.abspath(modelRun.solverOpts)))
+        runHash.update("\0%s\0%s" % (modelRun.jobParams['nproc'],
+            extraCmdLineOpts))
+    finally:
+        os.chdir(startDir)
+    return runHash.hexdigest()
+
+def _runHashFilename(modelRun):
+    return os.path.join(modelRun.basePath, modelRun.outputPath,
+        RUN_HASH_FILENAME)
+
+def getReusableResult(modelRun, runHash):
+    """If the given ModelRun has already been run successfully with the
+    configuration given by runHash (see :func:`.getRunHash`), returns its
+    ModelResult (read from its record). Otherwise returns None."""
+    if runHash is None: return None
+    try:
+        hashFile = open(_runHashFilename(modelRun), "r")
+        try:
+            savedHash = hashFile.read().strip()
+        finally:
+            hashFile.close()
+    except IOError:
+        return None
+    if savedHash != runHash: return None
+    try:
+        return mres.readModelResultFromPath(os.path.join(modelRun.basePath,
+            modelRun.outputPath))
+    except Exception:
+        # E.g. record missing or corrupt - so run again.
+        return None
+
+def saveRunHash(modelRun, runHash):
+    """Record that the ModelRun has run successfully with the configuration
+    given by runHash, and its ModelResult record has been written."""
+    if runHash is None: return
+    hashFile = open(_runHashFilename(modelRun), "w")
+    try:
+        hashFile.write(runHash + "\n")
+    finally:
+        hashFile.close()
+
+def clearRunHash(modelRun):
+    """Remove the ModelRun's saved configuration hash, e.g. before running
+    it again (as its previous results will be over-written)."""
+    try:
+        os.unlink(_runHashFilename(modelRun))
+    except OSError:
+        pass
@@ -514,7 +514,8 @@ class SysTest:
         self._writeXMLSpecification(baseNode)
         self._writeXMLTestComponentPreRuns(baseNode)
         xmlDoc = etree.ElementTree(baseNode)
-        outFileName = self._writeXMLDocToFile(xmlDoc, outputPath, filename)
+        outFileName = self._writeXMLDocToFile(xmlDoc, outputPath, filename,
+            prettyPrint)
         return outFileName
         
     def updateXMLWithResult(self, resultsSet, outputPath="", filename="",
@@ -534,7 +535,8 @@ class SysTest:
             # We only do the below if there are actual results to write - for
             # an error run there may not be.
             self._updateXMLTestComponentResults(baseNode, resultsSet)
-        outFileName = self._writeXMLDocToFile(xmlDoc, outputPath, filename)
+        outFileName = self._writeXMLDocToFile(xmlDoc, outputPath, filename,
+            prettyPrint)
         return outFileName
 
     def updateXMLWithReports(self, outputPath="", filename="",
@@ -551,7 +553,8 @@ class SysTest:
         for grFilename in self.generatedReports:
             repNode = etree.SubElement(repsNode, 'report')
             repNode.attrib['filename'] = grFilename
-        outFileName = self._writeXMLDocToFile(xmlDoc, outputPath, filename)
+        outFileName = self._writeXMLDocToFile(xmlDoc, outputPath, filename,
+            prettyPrint)
         return outFileName
 
     def _createXMLBaseNode(self):
@@ -572,23 +575,33 @@ class SysTest:
 
     def _writeXMLDocToFile(self, xmlDoc, outputPath, filename, prettyPrint=True):
         """Write the information in xmlDoc (in xml.etree format) to the filename
-        given by outputPath and filename."""
+        given by outputPath and filename (see
+        :func:`credo.io.stgxml.writeXMLDocToFile`). The doc is kept, so
+        that :meth:`._getXMLBaseNodeFromFile` needn't re-read the file."""
         outputPath, filename = self._resolveXMLOutputPathFilename(
             outputPath, filename)
         if not os.path.exists(outputPath):
             os.makedirs(outputPath)
         outFilePath = os.path.join(outputPath, filename)
-        outFile = open(outFilePath, 'w')
-        credo.io.stgxml.writeXMLDoc(xmlDoc, outFile, prettyPrint)
-        outFile.close()
+        fileStamp = credo.io.stgxml.writeXMLDocToFile(xmlDoc, outFilePath,
+            prettyPrint)
+        self._lastXMLDoc = (fileStamp, xmlDoc)
         return outFilePath
 
     def _getXMLBaseNodeFromFile(self, outputPath="", filename=""):
         """Open the XML file in outputPath and given by filename (if these
         are empty strings, defaults are used), and return the base node
-        from this file (in xml.etree format)."""
+        from this file (in xml.etree format). If the file is unchanged since
+        this SysTest wrote it, the doc written is returned instead."""
         outputPath, filename = self._resolveXMLOutputPathFilename(
             outputPath, filename)
+        # The doc is about to be modified, so can't be re-used again.
+        lastXMLDoc = getattr(self, '_lastXMLDoc', None)
+        self._lastXMLDoc = None
+        if lastXMLDoc is not None and credo.io.stgxml.isFileUnchangedSince(
+                os.path.join(outputPath, filename), lastXMLDoc[0]):
+            xmlDoc = lastXMLDoc[1]
+            return xmlDoc.getroot(), xmlDoc
         outFile = open(os.path.join(outputPath, filename), 'r+')
         parser = etree.XMLParser()
         # Note: we haven't removed blank spaces from the output
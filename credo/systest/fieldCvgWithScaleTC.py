@@ -214,6 +214,7 @@ class FieldCvgWithScaleTC(MultiRunTestComponent):
 
         for mRun in modelRuns:
             mRun.analysisOps['fieldComparisons'] = self.fComps
+            mRun.markRecordStale()
 
     def check(self, resultsSet):
         """Implements base class
@@ -121,6 +121,7 @@ class FieldWithinTolTC(SingleRunTestComponent):
             for fieldName in self.fieldsToTest:
                 self.fComps.add(fields.FieldComparisonOp(fieldName))
         modelRun.analysisOps['fieldComparisons'] = self.fComps
+        modelRun.markRecordStale()
 
     def getTolForField(self, fieldName):
         """Utility func: given fieldName, returns the tolerance to use for
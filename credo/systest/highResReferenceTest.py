@@ -100,13 +100,11 @@ class HighResReferenceTest(SingleModelSysTest):
     def regenerateFixture(self, jobRunner):
         '''Do a run to create the reference solution to use.'''
         resParams = ("elementResI", "elementResJ", "elementResK")
-        ffile = stgxml.createFlattenedXML(self.inputFiles)
-        xmlDoc = etree.parse(ffile)
+        xmlDoc = stgxml.getFlattenedXMLDoc(self.inputFiles)
         stgRoot = xmlDoc.getroot()
         origRes = [0]*3
         for ii, resParam in enumerate(resParams):
             origRes[ii] = stgxml.getParamValue(stgRoot, resParam, int)    
-        os.remove(ffile)    
         highRes = [int(self.highResRatio * res) for res in origRes]
 
         print "Running the model to create a high-res reference solution "\
@@ -119,6 +117,7 @@ class HighResReferenceTest(SingleModelSysTest):
             dumpevery=0)
         for ii, resParam in enumerate(resParams):
             mRun.paramOverrides[resParam] = highRes[ii]
+        mRun.markRecordStale()
         mRun.cpFields = self.fieldsToTest
         mRun.writeInfoXML()
         mRun.analysisXMLGen()
@@ -196,13 +196,12 @@ class SysTestRunner:
     def _writeXMLDocToFile(self, xmlDoc, outputPath, filename,
             prettyPrint=True):
         """Write the information in xmlDoc (in xml.etree format) to the filename
-        given by outputPath and filename."""
+        given by outputPath and filename (see
+        :func:`credo.io.stgxml.writeXMLDocToFile`)."""
         if not os.path.exists(outputPath):
             os.makedirs(outputPath)
         outFilePath = os.path.join(outputPath, filename)
-        outFile = open(outFilePath, 'w')
-        credo.io.stgxml.writeXMLDoc(xmlDoc, outFile, prettyPrint)
-        outFile.close()
+        credo.io.stgxml.writeXMLDocToFile(xmlDoc, outFilePath, prettyPrint)
         return outFilePath
 
     def _createSuiteNode(self, suite):
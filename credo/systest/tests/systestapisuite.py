@@ -21,9 +21,14 @@
 ##  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 ##  MA  02110-1301  USA
 
+import os
+import shutil
+import tempfile
 import unittest
+from xml.etree import ElementTree as etree
 
 from credo.systest.api import *
+from skeletonSysTest import SkeletonSysTest
 
 # TODO: more testing of the SysTest class itself
 
@@ -78,12 +83,50 @@ class SysTestNamesHandling(unittest.TestCase):
         self.assertEqual(testNameSuffix,
             "Multigrid-analyticTest-np1-hipert")    
 
+class SysTestXMLTestCase(unittest.TestCase):
+    def setUp(self):
+        self.basedir = os.path.realpath(tempfile.mkdtemp())
+        self.sysTest = SkeletonSysTest("skelTest", "output", CREDO_PASS,
+            basePath=self.basedir)
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_updateXML(self):
+        xmlFilename = self.sysTest.writePreRunXML()
+        origParse = etree.parse
+        parses = []
+        def countedParse(*args):
+            parses.append(args)
+            return origParse(*args)
+        etree.parse = countedParse
+        try:
+            # The doc written is updated, rather than re-read..
+            self.sysTest.generatedReports = ["report1.png"]
+            self.sysTest.updateXMLWithReports()
+            self.assertEqual(len(parses), 0)
+            # .. unless the file has been changed since.
+            xmlDoc = origParse(xmlFilename)
+            etree.SubElement(xmlDoc.getroot(), "extra")
+            xmlDoc.write(xmlFilename)
+            self.sysTest.generatedReports = ["report2.png"]
+            self.sysTest.updateXMLWithReports(prettyPrint=False)
+            self.assertEqual(len(parses), 1)
+        finally:
+            etree.parse = origParse
+        rootNode = etree.parse(xmlFilename).getroot()
+        self.assertEqual([node.tag for node in rootNode][-3:],
+            ["generatedReports", "extra", "generatedReports"])
+        # Written without pretty-printing, as asked.
+        self.assertEqual(rootNode[-1].text, None)
+
 def suite():
     testResultSuite = unittest.TestSuite()
     testResultSuite.addTest(unittest.makeSuite(SysTestResultTestCase, 'test'))
     nameSuite = unittest.TestSuite()
     nameSuite.addTest(unittest.makeSuite(SysTestNamesHandling))
-    multiSuite = unittest.TestSuite((testResultSuite, nameSuite))
+    xmlSuite = unittest.makeSuite(SysTestXMLTestCase, 'test')
+    multiSuite = unittest.TestSuite((testResultSuite, nameSuite, xmlSuite))
     return multiSuite
 
 if __name__ == '__main__':
@@ -33,6 +33,7 @@ from xml.etree import ElementTree as etree
 
 from credo import modelresult as mres
 from credo.modelresult import ModelResult
+from credo.io import stgxml
 
 class ModelResultTestCase(unittest.TestCase):
 
@@ -68,6 +69,106 @@ class ModelResultTestCase(unittest.TestCase):
         fr = results.recordFieldResult('PressureField', tol, [3.5e-2])
         mres.updateModelResultsXMLFieldInfo(resFile, fr)
 
+    def test_writeRecordXMLUnchanged(self):
+        results = mres.ModelResult('TestModel', self.basedir)
+        resFile = results.writeRecordXML()
+        origStat = os.stat(resFile)
+        results.writeRecordXML()
+        self.assertEqual(os.stat(resFile).st_mtime, origStat.st_mtime)
+        # Changed, so should be re-written.
+        results.recordFieldResult('VelocityField', 0.01, [3.5e-4])
+        results.writeRecordXML()
+        self.assertNotEqual(os.stat(resFile).st_size, origStat.st_size)
+        fieldNode = etree.parse(resFile).getroot()[-1]
+        self.assertEqual(len(fieldNode), 1)
+        # Not changed since written, so not even re-generated.
+        origWriteFunc = stgxml.writeXMLDocToFile
+        writeCalls = []
+        def countedWrite(*args):
+            writeCalls.append(args)
+            return origWriteFunc(*args)
+        stgxml.writeXMLDocToFile = countedWrite
+        try:
+            results.writeRecordXML()
+            self.assertEqual(len(writeCalls), 0)
+            results.fieldResults[0].dofErrors[0] = 1.5e-4
+            results.markRecordStale()
+            results.writeRecordXML()
+            self.assertEqual(len(writeCalls), 1)
+            results.outputPath = self.basedir
+            results.writeRecordXML()
+            self.assertEqual(len(writeCalls), 2)
+        finally:
+            stgxml.writeXMLDocToFile = origWriteFunc
+        fieldNode = etree.parse(resFile).getroot()[-1]
+        self.assertEqual(fieldNode[0][0].attrib['error'], str(1.5e-4))
+        # File changed by something else, so should be re-written.
+        open(resFile, "w").close()
+        results.writeRecordXML()
+        self.assertEqual(etree.parse(resFile).getroot().tag,
+            ModelResult.XML_INFO_TAG)
+
+    def _writeResults(self, numResults):
+        # import here to avoid cyclic import, as in modelresult
+        from credo.jobrunner.mpijobrunner import MPIJobMetaInfo
+        resultPaths = []
+        for resI in range(numResults):
+            resPath = os.path.join(self.basedir, "run%02d" % resI)
+            results = mres.ModelResult('TestModel-%d' % resI, resPath)
+            results.jobMetaInfo = MPIJobMetaInfo()
+            results.jobMetaInfo.simtime = float(resI)
+            results.writeRecordXML()
+            resultPaths.append(resPath)
+        return resultPaths
+
+    def test_readModelResultsFromPaths(self):
+        resultPaths = self._writeResults(20)
+        for numWorkers in [1, 4]:
+            readResults = mres.readModelResultsFromPaths(resultPaths,
+                numWorkers)
+            self.assertEqual([res.modelName for res in readResults],
+                ['TestModel-%d' % resI for resI in range(20)])
+            self.assertEqual([res.jobMetaInfo.simtime for res in readResults],
+                range(20))
+        # Errors: the one for the first bad path is always reported.
+        shutil.copy(os.path.join(resultPaths[1], "ModelResult-TestModel-1.xml"),
+            resultPaths[0])
+        os.makedirs(os.path.join(self.basedir, "empty"))
+        resultPaths.insert(12, os.path.join(self.basedir, "empty"))
+        for numWorkers in [1, 4, 20]:
+            try:
+                mres.readModelResultsFromPaths(resultPaths[1:], numWorkers)
+            except ValueError, e:
+                self.assertTrue("contained 0" in str(e))
+            else:
+                self.fail("ValueError not raised")
+            try:
+                mres.readModelResultsFromPaths(resultPaths, numWorkers)
+            except ValueError, e:
+                self.assertTrue("contained 2" in str(e))
+            else:
+                self.fail("ValueError not raised")
+
+    def test_readFrequentOutputs(self):
+        freqFilename = os.path.join(os.path.dirname(
+            os.path.abspath(__file__)), "..", "io", "tests", "sampleData",
+            "FrequentOutput.dat")
+        resultPaths = self._writeResults(4)
+        for resPath in resultPaths:
+            shutil.copy(freqFilename, resPath)
+        mResults = mres.readModelResultsFromPaths(resultPaths)
+        for useProcesses in [False, True]:
+            mres.readFrequentOutputs(mResults, numWorkers=2,
+                useProcesses=useProcesses)
+            for mRes in mResults:
+                self.assertTrue(mRes.freqOutput.populated)
+                self.assertEqual(mRes.freqOutput.path, mRes.outputPath)
+                self.assertEqual(mRes.freqOutput.finalStep(),
+                    mResults[0].freqOutput.finalStep())
+        os.unlink(os.path.join(resultPaths[2], "FrequentOutput.dat"))
+        self.assertRaises(ValueError, mres.readFrequentOutputs, mResults,
+            numWorkers=2, useProcesses=True)
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(ModelResultTestCase, 'test'))
@@ -29,6 +29,7 @@ import unittest
 
 from credo import modelrun as mrun
 from credo import modelresult as mres
+from credo.io import stgxml
 
 class ModelRunTestCase(unittest.TestCase):
 
@@ -72,7 +73,24 @@ class ModelRunTestCase(unittest.TestCase):
         modelRun = mrun.ModelRun('TestModel', self.inputFiles,
             self.outputPath, nproc=nproc, basePath=self.basedir)
         modelRun.simParams = mrun.SimParams(nsteps=5, cpevery=10)
-        modelRun.writeInfoXML(prettyPrint=True)
+        recordFile = modelRun.writeInfoXML(prettyPrint=True)
+        # Only re-generated once the ModelRun is changed.
+        origWriteFunc = stgxml.writeXMLDocToFile
+        writeCalls = []
+        def countedWrite(*args):
+            writeCalls.append(args)
+            return origWriteFunc(*args)
+        stgxml.writeXMLDocToFile = countedWrite
+        try:
+            modelRun.writeInfoXML()
+            self.assertEqual(len(writeCalls), 0)
+            modelRun.paramOverrides["gravity"] = 2.0
+            modelRun.markRecordStale()
+            modelRun.writeInfoXML()
+            self.assertEqual(len(writeCalls), 1)
+        finally:
+            stgxml.writeXMLDocToFile = origWriteFunc
+        self.assertTrue("gravity" in open(recordFile).read())
 
     def test_analysisXMLGen(self):
         #TODO
@@ -28,13 +28,16 @@ import tempfile
 import unittest
 import itertools
 
-from credo.modelrun import ModelRun
+from credo.modelrun import ModelRun, SimParams
 from credo.modelsuite import ModelSuite, StgXMLVariant, JobParamVariant
 import credo.modelsuite as msuite
 
 # Skeleton classes
 #class SkelModelRun(ModelRun):
 
+class _FakeAnalysisOp:
+    pass
+
 class ModelSuiteTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -171,6 +174,68 @@ class ModelSuiteTestCase(unittest.TestCase):
                     msuite.getSubdir_TextParamVals(mSuite.runs[runI],
                     mSuite.modelVariants, expIndexTuple, runI)))
 
+    def test_generateRuns_lazy(self):
+        self.mRun1.analysisOps["testOp"] = _FakeAnalysisOp()
+        self.mRun1.simParams = SimParams(nsteps=10)
+        mSuite = ModelSuite(os.path.join("output","genSuiteTest"),
+            templateMRun = self.mRun1)
+        mSuite.addVariant("depthVary", self.stgI1)
+        mSuite.addVariant("scaleTests", self.jobI1)
+        mSuite.generateRuns(lazy=True)
+        numRuns = len(self.yRange) * len(self.procRange)
+        self.assertEqual(len(mSuite.runs), numRuns)
+        self.assertEqual(len(mSuite.runDescrips), numRuns)
+        # Nothing created until accessed, and then only once.
+        self.assertEqual(mSuite.runs.numCreated(), 0)
+        run2 = mSuite.runs[2]
+        self.assertEqual(mSuite.runs.numCreated(), 1)
+        self.assertTrue(mSuite.runs[2] is run2)
+        self.assertTrue(mSuite.runs[-1] is mSuite.runs[numRuns-1])
+        self.assertEqual(mSuite.runDescrips[2],
+            os.path.basename(run2.outputPath))
+        # Same runs as generating eagerly.
+        eagerSuite = ModelSuite(os.path.join("output","genSuiteTest"),
+            templateMRun = self.mRun1)
+        eagerSuite.addVariant("depthVary", self.stgI1)
+        eagerSuite.addVariant("scaleTests", self.jobI1)
+        eagerSuite.generateRuns()
+        self.assertTrue(isinstance(eagerSuite.runs, list))
+        for mRun, eagerRun in zip(mSuite.runs, eagerSuite.runs):
+            for attrName in ["name", "outputPath", "paramOverrides",
+                    "jobParams", "modelInputFiles"]:
+                self.assertEqual(getattr(mRun, attrName),
+                    getattr(eagerRun, attrName))
+        self.assertEqual(list(mSuite.runDescrips), eagerSuite.runDescrips)
+        # Replacing a run before it's created keeps its description.
+        newRun = ModelRun("newRun", ["Input1.xml"], "./output/new")
+        mSuite.runs[5] = newRun
+        self.assertTrue(mSuite.runs[5] is newRun)
+        self.assertEqual(mSuite.runDescrips[5], eagerSuite.runDescrips[5])
+        # Runs are independent of each other and the template.
+        run2.paramOverrides["extra"] = 1
+        run2.jobParams["maxRunTime"] = 10
+        run2.analysisOps["otherOp"] = object()
+        run2.analysisOps["testOp"].changed = True
+        run2.simParams.nsteps = 5
+        for mRun in [mSuite.runs[0], mSuite.runs[3], self.mRun1]:
+            self.assertFalse("extra" in mRun.paramOverrides)
+            self.assertFalse(hasattr(mRun.analysisOps["testOp"], "changed"))
+            self.assertEqual(mRun.jobParams["maxRunTime"],
+                self.mRun1.jobParams["maxRunTime"])
+            self.assertEqual(mRun.analysisOps.keys(), ["testOp"])
+            self.assertEqual(mRun.simParams.nsteps, 10)
+        # Changes to the template after generating don't affect the runs.
+        self.mRun1.paramOverrides["late"] = 2
+        self.assertFalse("late" in mSuite.runs[4].paramOverrides)
+        # Can still add runs.
+        extraRun = ModelRun("extraRun", ["Input1.xml"], "./output/extra")
+        runI = mSuite.addRun(extraRun, "extra run")
+        self.assertEqual(runI, numRuns)
+        self.assertTrue(mSuite.runs[runI] is extraRun)
+        self.assertEqual(mSuite.runDescrips[runI], "extra run")
+        self.assertEqual(len(mSuite.runCustomOptSets), numRuns+1)
+        self.assertRaises(IndexError, mSuite.runs.__getitem__, numRuns+1)
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(ModelSuiteTestCase, 'test'))
@@ -0,0 +1,101 @@
+##  Copyright (C), 2010, Monash University
+##  Copyright (C), 2010, Victorian Partnership for Advanced Computing (VPAC)
+##  
+##  This file is part of the CREDO library.
+##  Developed as part of the Simulation, Analysis, Modelling program of 
+##  AuScope Limited, and funded by the Australian Federal Government's
+##  National Collaborative Research Infrastructure Strategy (NCRIS) program.
+##
+##  This library is free software; you can redistribute it and/or
+##  modify it under the terms of the GNU Lesser General Public
+##  License as published by the Free Software Foundation; either
+##  version 2.1 of the License, or (at your option) any later version.
+##
+##  This library is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##  Lesser General Public License for more details.
+##
+##  You should have received a copy of the GNU Lesser General Public
+##  License along with this library; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+##  MA  02110-1301  USA
+
+import unittest
+
+from credo.recordwriter import RecordWriter
+
+class FakeRun:
+    """Records how many times its record was written."""
+    def __init__(self, name, failWrite=False):
+        self.name = name
+        self.failWrite = failWrite
+        self.writes = 0
+
+    def writeInfoXML(self):
+        if self.failWrite:
+            raise IOError("Couldn't write record of %s" % self.name)
+        self.writes += 1
+
+class FakeResult(FakeRun):
+    def writeRecordXML(self):
+        FakeRun.writeInfoXML(self)
+
+class RecordWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [FakeRun("run%d" % ii) for ii in range(50)] \
+            + [FakeResult("result%d" % ii) for ii in range(50)]
+
+    def test_batchedWrites(self):
+        recWriter = RecordWriter()
+        for ii in range(len(self.records)):
+            # As if the whole list were re-written after each change.
+            recWriter.addAll(self.records[:ii+1])
+        self.assertEqual([rec.writes for rec in self.records],
+            [0]*len(self.records))
+        recWriter.flush()
+        self.assertEqual([rec.writes for rec in self.records],
+            [1]*len(self.records))
+        self.assertEqual(recWriter.writes, len(self.records))
+        self.assertEqual(recWriter.merged,
+            len(self.records)*(len(self.records)-1)/2)
+        # Nothing pending now.
+        recWriter.flush()
+        self.assertEqual(recWriter.writes, len(self.records))
+        recWriter.add(self.records[0])
+        recWriter.close()
+        self.assertEqual(self.records[0].writes, 2)
+        self.assertRaises(ValueError, recWriter.add, self.records[0])
+
+    def test_backgroundWrites(self):
+        recWriter = RecordWriter(background=True)
+        for ii in range(len(self.records)):
+            recWriter.addAll(self.records[:ii+1])
+        recWriter.flush()
+        # Records may be re-written if added again after being written.
+        self.assertEqual(sum([rec.writes for rec in self.records]),
+            recWriter.writes)
+        self.assertEqual(min([rec.writes for rec in self.records]), 1)
+        self.assertEqual(recWriter.writes + recWriter.merged,
+            len(self.records)*(len(self.records)+1)/2)
+        # Errors are passed back from the writer thread.
+        recWriter.add(FakeRun("bad", failWrite=True))
+        self.assertRaises(IOError, recWriter.flush)
+        origWrites = self.records[0].writes
+        recWriter.add(self.records[0])
+        recWriter.close()
+        self.assertEqual(self.records[0].writes, origWrites+1)
+
+    def test_writeErrors(self):
+        recWriter = RecordWriter()
+        recWriter.add(FakeRun("bad", failWrite=True))
+        self.assertRaises(IOError, recWriter.flush)
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(RecordWriterTestCase, 'test'))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
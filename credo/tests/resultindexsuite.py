@@ -0,0 +1,195 @@
+##  Copyright (C), 2010, Monash University
+##  Copyright (C), 2010, Victorian Partnership for Advanced Computing (VPAC)
+##  
+##  This file is part of the CREDO library.
+##  Developed as part of the Simulation, Analysis, Modelling program of 
+##  AuScope Limited, and funded by the Australian Federal Government's
+##  National Collaborative Research Infrastructure Strategy (NCRIS) program.
+##
+##  This library is free software; you can redistribute it and/or
+##  modify it under the terms of the GNU Lesser General Public
+##  License as published by the Free Software Foundation; either
+##  version 2.1 of the License, or (at your option) any later version.
+##
+##  This library is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##  Lesser General Public License for more details.
+##
+##  You should have received a copy of the GNU Lesser General Public
+##  License along with this library; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+##  MA  02110-1301  USA
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from credo.modelrun import ModelRun
+from credo.modelresult import ModelResult
+from credo.jobrunner.mpijobrunner import MPIJobMetaInfo
+import credo.modelsuite as msuite
+from credo import resultindex
+
+class ResultIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = os.path.realpath(tempfile.mkdtemp())
+        self.mSuite = msuite.ModelSuite("output",
+            templateMRun=ModelRun("testModel", ["Input.xml"], "output",
+                basePath=self.basedir))
+        self.mSuite.addVariant("nproc", msuite.JobParamVariant("nproc",
+            [1, 2, 4]))
+        self.mSuite.generateRuns()
+        for runI, mRun in enumerate(self.mSuite.runs):
+            mRes = ModelResult(mRun.name, os.path.join(self.basedir,
+                mRun.outputPath))
+            mRes.jobMetaInfo = MPIJobMetaInfo()
+            mRes.jobMetaInfo.simtime = 0.5 * runI
+            mRes.jobMetaInfo.platform = {"node":"testhost"}
+            mRes.jobMetaInfo.performance = {"CREDO":{"walltime":10.0+runI,
+                "maxMem":1024.0}}
+            mRes.recordFieldResult("VelocityField", 1e-3, [0.1, 0.2*runI])
+            self.mSuite.resultsList.append(mRes)
+        self.mSuite.writeAllModelResultXMLs()
+        self.indexFilename = os.path.join(self.basedir, "output",
+            resultindex.RESULT_INDEX_FILENAME)
+        # To check whether results are read from the index, or XMLs.
+        self.origGetArray = msuite.getModelResultsArray
+        self.scans = 0
+        def countedGetArray(*args):
+            self.scans += 1
+            return self.origGetArray(*args)
+        msuite.getModelResultsArray = countedGetArray
+
+    def tearDown(self):
+        msuite.getModelResultsArray = self.origGetArray
+        shutil.rmtree(self.basedir)
+
+    def test_readFromIndex(self):
+        self.assertTrue(os.path.exists(self.indexFilename))
+        mResults = self.mSuite.readResultsFromPath(self.basedir)
+        self.assertEqual(self.scans, 0)
+        self.assertEqual([mRes.modelName for mRes in mResults],
+            [mRun.name for mRun in self.mSuite.runs])
+        for runI, mRes in enumerate(mResults):
+            origRes = self.mSuite.resultsList[runI]
+            self.assertEqual(mRes.outputPath, origRes.outputPath)
+            self.assertEqual(mRes.jobMetaInfo.runType, "MPI")
+            self.assertEqual(mRes.jobMetaInfo.simtime, 0.5 * runI)
+            self.assertEqual(mRes.jobMetaInfo.platform, {"node":"testhost"})
+            self.assertEqual(mRes.jobMetaInfo.performance,
+                origRes.jobMetaInfo.performance)
+            self.assertEqual(len(mRes.fieldResults), 1)
+            self.assertEqual(mRes.fieldResults[0].fieldName, "VelocityField")
+            self.assertEqual(mRes.fieldResults[0].dofErrors,
+                [0.1, 0.2*runI])
+        resIndex = resultindex.ResultIndex(self.indexFilename)
+        self.assertEqual(resIndex.getRunNames(),
+            [mRun.name for mRun in self.mSuite.runs])
+        self.assertEqual(resIndex.getPerformance("CREDO", "walltime"),
+            dict((mRun.name, 10.0+runI) for runI, mRun in
+                enumerate(self.mSuite.runs)))
+        resIndex.close()
+
+    def _resultInfo(self, mRes):
+        jobMI = mRes.jobMetaInfo
+        return (mRes.modelName, mRes.outputPath, jobMI.runType, jobMI.simtime,
+            jobMI.platform, jobMI.performance,
+            [(fr.fieldName, fr.dofErrors) for fr in mRes.fieldResults])
+
+    def test_indexMatchesRecords(self):
+        fromIndex = self.mSuite.readResultsFromPath(self.basedir)
+        fromRecords = self.mSuite.readResultsFromPath(self.basedir,
+            useIndex=False)
+        self.assertEqual(self.scans, 1)
+        self.assertEqual(map(self._resultInfo, fromIndex),
+            map(self._resultInfo, fromRecords))
+
+    def test_fieldResultOrder(self):
+        # Not in alphabetical order.
+        for mRes in self.mSuite.resultsList:
+            mRes.recordFieldResult("PressureField", 1e-3, [0.3])
+            mRes.recordFieldResult("DensityField", 1e-3, [0.4, 0.5])
+        self.mSuite.writeAllModelResultXMLs()
+        mResults = self.mSuite.readResultsFromPath(self.basedir)
+        self.assertEqual(self.scans, 0)
+        for mRes in mResults:
+            recordRes = ModelResult("place", mRes.outputPath)
+            recordRes.readFromRecordXML(os.path.join(mRes.outputPath,
+                mRes.defaultRecordFilename()))
+            self.assertEqual([fr.fieldName for fr in mRes.fieldResults],
+                ["VelocityField", "PressureField", "DensityField"])
+            self.assertEqual(self._resultInfo(mRes),
+                self._resultInfo(recordRes))
+
+    def test_oldIndexRecreated(self):
+        resIndex = resultindex.ResultIndex(self.indexFilename)
+        resIndex.conn.execute("PRAGMA user_version = 0")
+        resIndex.conn.commit()
+        resIndex.close()
+        mResults = self.mSuite.readResultsFromPath(self.basedir)
+        self.assertEqual(self.scans, 1)
+        self.assertEqual(map(self._resultInfo, mResults),
+            map(self._resultInfo, self.mSuite.resultsList))
+        mResults = self.mSuite.readResultsFromPath(self.basedir)
+        self.assertEqual(self.scans, 1)
+
+    def test_changedRecord(self):
+        # Record re-written without updating the index.
+        mRes = self.mSuite.resultsList[1]
+        mRes.jobMetaInfo.simtime = 7.5
+        mRes.jobMetaInfo.performance["CREDO"]["walltime"] = 99.25
+        mRes.markRecordStale()
+        time.sleep(0.01)
+        mRes.writeRecordXML()
+        mResults = self.mSuite.readResultsFromPath(self.basedir)
+        self.assertEqual(self.scans, 0)
+        self.assertEqual(mResults[1].jobMetaInfo.simtime, 7.5)
+        self.assertEqual(mResults[1].jobMetaInfo.performance["CREDO"]
+            ["walltime"], 99.25)
+        self.assertEqual(mResults[1].jobMetaInfo.platform,
+            {"node":"testhost"})
+        self.assertEqual([(fr.fieldName, fr.dofErrors) for fr in
+            mResults[1].fieldResults], [("VelocityField", [0.1, 0.2])])
+        # Field results kept when re-indexed.
+        mResults = self.mSuite.readResultsFromPath(self.basedir)
+        self.assertEqual([(fr.fieldName, fr.dofErrors) for fr in
+            mResults[1].fieldResults], [("VelocityField", [0.1, 0.2])])
+        resIndex = resultindex.ResultIndex(self.indexFilename)
+        self.assertEqual(resIndex.getPerformance("CREDO", "walltime")
+            [mRes.modelName], 99.25)
+        resIndex.close()
+
+    def test_noIndex(self):
+        os.unlink(self.indexFilename)
+        mResults = self.mSuite.readResultsFromPath(self.basedir)
+        self.assertEqual(self.scans, 1)
+        self.assertEqual([mRes.modelName for mRes in mResults],
+            [mRun.name for mRun in self.mSuite.runs])
+        # Index re-created, so not needed next time.
+        self.assertTrue(os.path.exists(self.indexFilename))
+        mResults2 = self.mSuite.readResultsFromPath(self.basedir)
+        self.assertEqual(self.scans, 1)
+        self.assertEqual([mRes.jobMetaInfo.performance for mRes in mResults2],
+            [mRes.jobMetaInfo.performance for mRes in mResults])
+        # Not reading the index
+        self.mSuite.readResultsFromPath(self.basedir, useIndex=False)
+        self.assertEqual(self.scans, 2)
+        # A result missing from the index.
+        resIndex = resultindex.ResultIndex(self.indexFilename)
+        resIndex.conn.execute("DELETE FROM results WHERE modelName=?",
+            (self.mSuite.runs[0].name,))
+        resIndex.conn.commit()
+        resIndex.close()
+        self.mSuite.readResultsFromPath(self.basedir)
+        self.assertEqual(self.scans, 3)
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ResultIndexTestCase, 'test'))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,177 @@
+##  Copyright (C), 2010, Monash University
+##  Copyright (C), 2010, Victorian Partnership for Advanced Computing (VPAC)
+##  
+##  This file is part of the CREDO library.
+##  Developed as part of the Simulation, Analysis, Modelling program of 
+##  AuScope Limited, and funded by the Australian Federal Government's
+##  National Collaborative Research Infrastructure Strategy (NCRIS) program.
+##
+##  This library is free software; you can redistribute it and/or
+##  modify it under the terms of the GNU Lesser General Public
+##  License as published by the Free Software Foundation; either
+##  version 2.1 of the License, or (at your option) any later version.
+##
+##  This library is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+##  Lesser General Public License for more details.
+##
+##  You should have received a copy of the GNU Lesser General Public
+##  License along with this library; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+##  MA  02110-1301  USA
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from credo.modelrun import ModelRun, SimParams
+from credo.modelresult import ModelResult
+from credo.modelsuite import ModelSuite, StgXMLVariant
+from credo.jobrunner.api import JobRunner
+from credo.jobrunner.mpijobrunner import MPIJobMetaInfo
+from credo.io import stgpath
+from credo.io import stgflatten
+from credo import runcache
+
+_modelXML = """<?xml version="1.0"?>
+<StGermainData xmlns="http://www.vpac.org/StGermain/XML_IO_Handler/Jun2003">
+  <include>extra.xml</include>
+  <param name="gravity">1.0</param>
+</StGermainData>
+"""
+
+_extraXML = """<?xml version="1.0"?>
+<StGermainData xmlns="http://www.vpac.org/StGermain/XML_IO_Handler/Jun2003">
+  <param name="dim">2</param>
+</StGermainData>
+"""
+
+class CountingJobRunner(JobRunner):
+    """A JobRunner that records which runs were submitted, and 'runs' them
+    by returning a ModelResult."""
+    def __init__(self):
+        JobRunner.__init__(self)
+        self.submitted = []
+
+    def submitRun(self, modelRun, prefixStr=None, extraCmdLineOpts=None,
+            dryRun=False, maxRunTime=None):
+        if dryRun: return None
+        self.submitted.append(modelRun.name)
+        jobMetaInfo = MPIJobMetaInfo()
+        jobMetaInfo.simtime = 1.0
+        jobMetaInfo.platform = {"node":"testhost"}
+        return jobMetaInfo
+
+    def blockResult(self, modelRun, jobMetaInfo):
+        mResult = ModelResult(modelRun.name, os.path.join(modelRun.basePath,
+            modelRun.outputPath))
+        mResult.jobMetaInfo = jobMetaInfo
+        mResult.recordFieldResult("VelocityField", 1e-3, [0.1, 0.2])
+        return mResult
+
+class RunCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = os.path.realpath(tempfile.mkdtemp())
+        for fname, contents in [("model.xml", _modelXML),
+                ("extra.xml", _extraXML), ("StGermain", "#!/bin/sh\n"),
+                ("solver.opt", "-ksp_type fgmres\n")]:
+            self._writeFile(fname, contents)
+        self.origBinDir = os.environ.get(stgpath.STG_BINDIRKEY)
+        os.environ[stgpath.STG_BINDIRKEY] = self.basedir
+        self.mRun = ModelRun("testModel", ["model.xml"], "output/testModel",
+            basePath=self.basedir, simParams=SimParams(nsteps=5))
+        stgflatten.flattenCache.clear()
+
+    def tearDown(self):
+        if self.origBinDir is None:
+            del os.environ[stgpath.STG_BINDIRKEY]
+        else:
+            os.environ[stgpath.STG_BINDIRKEY] = self.origBinDir
+        shutil.rmtree(self.basedir)
+
+    def _writeFile(self, fname, contents):
+        outFile = open(os.path.join(self.basedir, fname), "w")
+        outFile.write(contents)
+        outFile.close()
+
+    def test_getRunHash(self):
+        origHash = runcache.getRunHash(self.mRun)
+        self.assertEqual(runcache.getRunHash(self.mRun), origHash)
+        self.assertNotEqual(runcache.getRunHash(self.mRun, "--extra=1"),
+            origHash)
+        # Each of these should change the hash.
+        changes = [
+            lambda: self._writeFile("extra.xml", _extraXML.replace(">2<", ">3<")),
+            lambda: self._writeFile("StGermain", "#!/bin/sh\n\n"),
+            lambda: self.mRun.paramOverrides.update({"gravity":2.0}),
+            lambda: self.mRun.jobParams.update({"nproc":4}),
+            lambda: setattr(self.mRun.simParams, "nsteps", 10),
+            lambda: setattr(self.mRun, "solverOpts", "solver.opt"),
+            lambda: self._writeFile("solver.opt", "-ksp_type cg\n"),
+            ]
+        hashes = [origHash]
+        for change in changes:
+            change()
+            hashes.append(runcache.getRunHash(self.mRun))
+        self.assertEqual(len(set(hashes)), len(hashes))
+        # Settings that don't affect results shouldn't change it.
+        self.mRun.jobParams['maxRunTime'] = 100
+        self.assertEqual(runcache.getRunHash(self.mRun), hashes[-1])
+        # Can't be re-used if input files missing.
+        os.unlink(os.path.join(self.basedir, "extra.xml"))
+        self.assertEqual(runcache.getRunHash(self.mRun), None)
+
+    def test_runSuiteReuse(self):
+        mSuite = ModelSuite("output", templateMRun=self.mRun)
+        mSuite.addVariant("gravity", StgXMLVariant("gravity", [1.0, 2.0, 3.0]))
+        mSuite.generateRuns()
+        runNames = [mRun.name for mRun in mSuite.runs]
+        for nonBlocking in [False, True]:
+            for runI in range(len(mSuite.runs)):
+                runcache.clearRunHash(mSuite.runs[runI])
+            jobRunner = CountingJobRunner()
+            jobRunner.runSuite(mSuite, reuseResults=True,
+                runSuiteNonBlocking=nonBlocking)
+            self.assertEqual(jobRunner.submitted, runNames)
+            # Nothing changed: all re-used.
+            jobRunner.submitted = []
+            recordFiles = [os.path.join(res.outputPath,
+                res.defaultRecordFilename()) for res in mSuite.resultsList]
+            records = [open(fname).read() for fname in recordFiles]
+            recordMTimes = map(os.path.getmtime, recordFiles)
+            time.sleep(0.01)
+            results = jobRunner.runSuite(mSuite, reuseResults=True,
+                runSuiteNonBlocking=nonBlocking)
+            self.assertEqual(jobRunner.submitted, [])
+            # Records of re-used results left as they were.
+            self.assertEqual([open(fname).read() for fname in recordFiles],
+                records)
+            self.assertEqual(map(os.path.getmtime, recordFiles), recordMTimes)
+            self.assertEqual([res.jobMetaInfo.platform for res in results],
+                [{"node":"testhost"}] * len(runNames))
+            self.assertEqual([res.modelName for res in results], runNames)
+            self.assertEqual([res.jobMetaInfo.simtime for res in results],
+                [1.0] * len(runNames))
+            # Only the changed run is run again.
+            mSuite.runs[1].paramOverrides["gravity"] = 2.5
+            results = jobRunner.runSuite(mSuite, reuseResults=True,
+                runSuiteNonBlocking=nonBlocking)
+            self.assertEqual(jobRunner.submitted, [runNames[1]])
+            self.assertEqual([res.modelName for res in results], runNames)
+            # Not re-used unless asked.
+            jobRunner.submitted = []
+            jobRunner.runSuite(mSuite, reuseResults=False,
+                runSuiteNonBlocking=nonBlocking)
+            self.assertEqual(jobRunner.submitted, runNames)
+            mSuite.runs[1].paramOverrides["gravity"] = 2.0
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(RunCacheTestCase, 'test'))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -25,7 +25,19 @@
 into other modules."""
 
 import os
+import sys
 import inspect
+import threading
+import traceback
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+#: Default number of threads used by :func:`parallelMap` (the tasks it's
+#: used for are generally limited by file system latency, not CPU).
+DEFAULT_NUM_THREADS = 8
 
 def getCallingPath(stackNum):
     """Get the path of the calling stack at stackNum levels higher."""
@@ -63,3 +75,244 @@ def dictAsPrettyStr(inDict):
     for kw, val in inDict.iteritems():
         strings.append("'%s': %s" % (str(kw), str(val)))
     return "{%s}" % (", ".join(strings))
+
+class LRUCache:
+    """A simple cache of key-value pairs, which holds at most `maxBytes`
+    bytes worth of values, discarding the least recently used entries
+    once that's exceeded. The size of each value is given when it's added,
+    or measured using `sizeFunc` (by default, :func:`len`).
+    Safe to use from multiple threads.
+
+    .. attribute:: maxBytes
+
+       The maximum total size of values to keep (see :meth:`setMaxBytes`).
+
+    .. attribute:: currBytes
+
+       The current total size of values kept.
+
+    .. attribute:: hits
+
+       Number of calls to :meth:`get` that found their key in the cache.
+
+    .. attribute:: misses
+
+       Number of calls to :meth:`get` that didn't.
+
+    .. attribute:: evictions
+
+       Number of entries discarded to keep within :attr:`maxBytes`.
+    """
+
+    def __init__(self, maxBytes, sizeFunc=len):
+        self.maxBytes = maxBytes
+        self.sizeFunc = sizeFunc
+        self.currBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Map of key to list node of [prev, next, key, value, size]. The
+        # list is circular with a sentinel, most recently used first.
+        self._entries = {}
+        self._head = []
+        self._head[:] = [self._head, self._head, None, None, 0]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns the value cached for `key`, or `default` if there
+        isn't one."""
+        self._lock.acquire()
+        try:
+            try:
+                node = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._unlink(node)
+            self._linkFirst(node)
+            return node[3]
+        finally:
+            self._lock.release()
+
+    def put(self, key, value, size=None):
+        """Add `value` to the cache as the most recently used entry for
+        `key`, then discard old entries as needed. A value that on its own
+        is larger than :attr:`maxBytes` isn't kept."""
+        if size is None: size = self.sizeFunc(value)
+        self._lock.acquire()
+        try:
+            self._remove(key)
+            if size > self.maxBytes: return
+            node = [None, None, key, value, size]
+            self._linkFirst(node)
+            self._entries[key] = node
+            self.currBytes += size
+            self._evict()
+        finally:
+            self._lock.release()
+
+    def remove(self, key):
+        """Discard the entry for `key`, if there is one."""
+        self._lock.acquire()
+        try:
+            self._remove(key)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Discard all entries, and reset the counters."""
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._head[:] = [self._head, self._head, None, None, 0]
+            self.currBytes = 0
+            self.hits = self.misses = self.evictions = 0
+        finally:
+            self._lock.release()
+
+    def setMaxBytes(self, maxBytes):
+        """Change :attr:`maxBytes`, discarding entries if needed."""
+        self._lock.acquire()
+        try:
+            self.maxBytes = maxBytes
+            self._evict()
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Returns a dict of the counters and current size of the cache."""
+        return {'hits':self.hits, 'misses':self.misses,
+            'evictions':self.evictions, 'entries':len(self._entries),
+            'bytes':self.currBytes, 'maxBytes':self.maxBytes}
+
+    def _linkFirst(self, node):
+        first = self._head[1]
+        node[0], node[1] = self._head, first
+        first[0] = node
+        self._head[1] = node
+
+    def _unlink(self, node):
+        node[0][1] = node[1]
+        node[1][0] = node[0]
+
+    def _remove(self, key):
+        node = self._entries.pop(key, None)
+        if node is None: return
+        self._unlink(node)
+        self.currBytes -= node[4]
+
+    def _evict(self):
+        while self.currBytes > self.maxBytes:
+            lastNode = self._head[0]
+            self._remove(lastNode[2])
+            self.evictions += 1
+
+def parallelMap(func, items, numWorkers=None, useProcesses=False):
+    """Returns the list of results of calling `func` on each of `items`,
+    like :func:`map`, but using `numWorkers` threads to make the calls
+    concurrently (or processes, if `useProcesses` is True). Results are
+    in the same order as `items`.
+
+    :keyword numWorkers: number of threads or processes to use. Defaults to
+      :data:`.DEFAULT_NUM_THREADS` threads, or one process per CPU. If 1,
+      calls are made in order in the current thread.
+    :keyword useProcesses: use a pool of processes (via the
+      :mod:`multiprocessing` module) rather than threads, for CPU-bound
+      tasks. `func`, `items` and results must then be picklable - e.g.
+      `func` must be a module-level function.
+
+    If any calls raise an exception, the one raised for the earliest item in
+    `items` is re-raised - i.e. the same one that :func:`map` would raise.
+    Items after a failed one may not be processed. (When using processes,
+    the traceback in the worker process is saved as a string in the
+    exception's `workerTraceback` attribute.)"""
+    items = list(items)
+    if useProcesses and multiprocessing is None:
+        raise ImportError("Error, using processes in parallelMap requires"
+            " the Python multiprocessing module.")
+    if numWorkers is None:
+        if useProcesses: numWorkers = multiprocessing.cpu_count()
+        else: numWorkers = DEFAULT_NUM_THREADS
+    numWorkers = min(numWorkers, len(items))
+    if numWorkers <= 1:
+        return map(func, items)
+    if useProcesses:
+        return _processMap(func, items, numWorkers)
+    else:
+        return _threadMap(func, items, numWorkers)
+
+def _threadMap(func, items, numWorkers):
+    results = [None] * len(items)
+    errors = {}
+    # Items are claimed in order, so once one fails, any not yet claimed
+    # after it can be skipped: all those before it are already claimed.
+    state = {'next':0, 'stopAt':len(items)}
+    lock = threading.Lock()
+    def worker():
+        while True:
+            lock.acquire()
+            try:
+                itemI = state['next']
+                if itemI >= state['stopAt']: return
+                state['next'] += 1
+            finally:
+                lock.release()
+            try:
+                results[itemI] = func(items[itemI])
+            except Exception:
+                lock.acquire()
+                try:
+                    errors[itemI] = sys.exc_info()
+                    state['stopAt'] = min(state['stopAt'], itemI)
+                finally:
+                    lock.release()
+    threads = [threading.Thread(target=worker) for ii in range(numWorkers)]
+    for thread in threads:
+        thread.setDaemon(True)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        excType, excValue, excTb = errors[min(errors)]
+        raise excType, excValue, excTb
+    return results
+
+def _callInProcess(funcAndItem):
+    """Calls func(item) in a worker process of :func:`parallelMap`, returning
+    (True, result), or (False, exception, traceback string) on error."""
+    func, item = funcAndItem
+    try:
+        return True, func(item)
+    except Exception, e:
+        tbStr = traceback.format_exc()
+        try:
+            import cPickle
+            cPickle.dumps(e)
+        except Exception:
+            e = RuntimeError(str(e))
+        return False, e, tbStr
+
+def _processMap(func, items, numWorkers):
+    pool = multiprocessing.Pool(numWorkers)
+    try:
+        results = []
+        # imap returns results in order, so the first error found is the
+        # one for the earliest item.
+        for callResult in pool.imap(_callInProcess,
+                [(func, item) for item in items]):
+            if not callResult[0]:
+                excValue, excValue.workerTraceback = callResult[1:]
+                raise excValue
+            results.append(callResult[1])
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return results